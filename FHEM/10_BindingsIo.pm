@@ -11,6 +11,7 @@ use Thread::Queue;
 use Encode;
 
 use Protocol::WebSocket::Frame;
+use Protocol::WebSocket::Handshake::Client;
 
 use DevIo;
 use CoProcess;
@@ -23,6 +24,8 @@ sub Log3($$$);
 
 my $USE_DEVIO_DECODEWS = 0;
 my $timeouts = 0;
+# seconds until an async call without reply is dropped
+my $ASYNC_TIMEOUT = 60;
 
 sub
 BindingsIo_Initialize($)
@@ -42,6 +45,8 @@ BindingsIo_Initialize($)
   $hash->{ReadyFn}  = 'BindingsIo_Ready';
   $hash->{WriteFn}  = 'BindingsIo_Write';
 
+  $hash->{AttrList} = "asyncMode:0,1";
+
   $hash->{Clients} = "PythonModule"; # NodeModule
 
   return undef;
@@ -59,8 +64,30 @@ BindingsIo_Define($$$)
 
   my $port = 0;
   my $localServer = 1;
+  # arguments of the binding started by FHEM
+  my $listen = "";
+  delete $hash->{UNIXSOCKET};
   if ($bindingType eq "Python") {
-    $hash->{DeviceName} = "ws:127.0.0.1:15733";
+    if (defined($h->{socket})) {
+      # unix domain socket, no TCP port open
+      $hash->{DeviceName} = "UNIX:STREAM:".$h->{socket};
+      $hash->{UNIXSOCKET} = 1;
+      $listen = " socket=".$h->{socket};
+    } else {
+      my $bindingPort = $h->{port} // 15733;
+      # connect to the listen address, loopback if the binding listens on all interfaces
+      my $bindingHost = $h->{host} // "127.0.0.1";
+      $bindingHost = "127.0.0.1" if ($bindingHost =~ m/^(0\.0\.0\.0|::|\*)?$/);
+      $hash->{DeviceName} = "ws:".$bindingHost.":".$bindingPort;
+      $listen = " port=".$bindingPort if (defined($h->{port}));
+      $listen .= " host=".$h->{host} if (defined($h->{host}));
+    }
+  } elsif (@$a[2] =~ m/^unix:(.+)$/) {
+    # binding started outside of FHEM, listening on a unix domain socket
+    $hash->{DeviceName} = "UNIX:STREAM:".$1;
+    $hash->{UNIXSOCKET} = 1;
+    $bindingType = ucfirst(@$a[3]);
+    $localServer = 0;
   } else {
     $hash->{DeviceName} = "ws:".@$a[2];
     $bindingType = ucfirst(@$a[3]);
@@ -77,7 +104,7 @@ BindingsIo_Define($$$)
       $foundServer = 1 if($main::defs{$fhem_dev}{TYPE} eq $bindingType."Server");
     }
     if ($foundServer == 0) {
-      CommandDefine(undef, $bindingType."binding_".$port." ".$bindingType."Binding ".$port);
+      CommandDefine(undef, $bindingType."binding_".$port." ".$bindingType."Binding ".$port.$listen);
       InternalTimer(gettimeofday()+3, "BindingsIo_connectDev", $hash, 0);
     }
   }
@@ -114,6 +141,15 @@ sub
 BindingsIo_doInit($) {
   my ($hash) = @_;
 
+  if ($hash->{UNIXSOCKET}) {
+    my $err = BindingsIo_wsHandshake($hash);
+    if (defined($err)) {
+      Log3 $hash, 1, "BindingsIo: ERROR ".$hash->{NAME}." - ".$err;
+      DevIo_CloseDev($hash);
+      return $err;
+    }
+  }
+
   # initialize all devices (send Define)
   my $bindingType = uc($hash->{BindingType})."TYPE";
   foreach my $fhem_dev (sort keys %main::defs) {
@@ -126,6 +162,26 @@ BindingsIo_doInit($) {
   return undef;
 }
 
+sub
+BindingsIo_wsHandshake($) {
+  my ($hash) = @_;
+
+  # DevIo does the websocket handshake for ws: connections only
+  my $hs = Protocol::WebSocket::Handshake::Client->new(url => "ws://localhost/");
+  delete $hash->{WEBSOCKET};
+  DevIo_SimpleWrite($hash, $hs->to_string, 0);
+  my $t1 = time;
+  while (!$hs->is_done) {
+    return "websocket handshake timeout" if ((time - $t1) > 5);
+    my $buf = BindingsIo_SimpleReadWithTimeout($hash, 0.1);
+    next if (!defined($buf));
+    return "connection closed during websocket handshake" if ($buf eq "connectionclosed");
+    return "websocket handshake failed: ".$hs->error if (!defined($hs->parse($buf)));
+  }
+  $hash->{WEBSOCKET} = 1;
+  return undef;
+}
+
 sub
 BindingsIo_Notify($)
 {
@@ -156,6 +212,7 @@ BindingsIo_Read($)
   my $name = $hash->{NAME};
 
   BindingsIo_readWebsocketMessage($hash, undef, 0, 1);
+  BindingsIo_asyncExpire($hash) if (defined($hash->{asyncCalls}));
 }
 
 sub
@@ -189,6 +246,15 @@ BindingsIo_Write($$$$$) {
 
   my $bindingType = uc($hash->{BindingType})."TYPE";
 
+  # with asyncMode FHEM doesn't wait for calls whose result isn't needed,
+  # the reply is handled later in BindingsIo_Read
+  my $async = 0;
+  if (AttrVal($hash->{NAME}, "asyncMode", 0) == 1 && $devhash != $hash) {
+    if (($function eq "Set" && defined(@$a[1]) && @$a[1] ne "?") or $function eq "Undefine" or $initrun == 1) {
+      $async = 1;
+    }
+  }
+
   my %msg = (
     "id" => $waitingForId,
     "msgtype" => "function",
@@ -197,9 +263,11 @@ BindingsIo_Write($$$$$) {
     "args" => $a,
     "argsh" => $h,
     "defargs" => $devhash->{args},
-    "defargsh" => $devhash->{argsh}
+    "defargsh" => $devhash->{argsh},
+    "sent" => time
   );
   $msg{$bindingType} =  $devhash->{$bindingType};
+  $msg{"async"} = 1 if ($async == 1);
 
   my $utf8msg = Encode::encode("utf-8", Encode::decode("utf-8", to_json(\%msg)));
   Log3 $hash, 4, "BindingsIo: <<< WS: ".$utf8msg;
@@ -207,6 +275,17 @@ BindingsIo_Write($$$$$) {
     DevIo_SimpleWrite($hash, $utf8msg, 0);
   }
 
+  if ($async == 1) {
+    BindingsIo_asyncExpire($hash);
+    $hash->{asyncCalls}{$waitingForId} = {
+      "NAME" => $devhash->{NAME},
+      "function" => $function,
+      "time" => time
+    };
+    Log3 $hash, 4, "BindingsIo: pending ".$hash->{BindingType}."Function: ".$devhash->{NAME}." => $function ($waitingForId)";
+    return undef;
+  }
+
   my $py_timeout = 1500;
   if ($function eq "Define" or $init_done == 0 or $initrun == 1) {
     # wait 10s on Define, this might happen on startup
@@ -248,6 +327,47 @@ BindingsIo_Write($$$$$) {
   return $returnval;
 }
 
+sub
+BindingsIo_asyncExpire($) {
+  my ($hash) = @_;
+
+  foreach my $id (keys %{$hash->{asyncCalls} // {}}) {
+    my $call = $hash->{asyncCalls}{$id};
+    if ((time - $call->{time}) > $ASYNC_TIMEOUT) {
+      Log3 $hash, 1, "BindingsIo: ERROR: Timeout while waiting for async function to finish: ".$call->{NAME}." => ".$call->{function}." (id: $id)";
+      delete $hash->{asyncCalls}{$id};
+    }
+  }
+}
+
+sub
+BindingsIo_asyncDone($$) {
+  my ($hash, $json) = @_;
+
+  my $call = delete $hash->{asyncCalls}{$json->{id}};
+  Log3 $hash, 4, "BindingsIo: end async ".$hash->{BindingType}."Function: ".$call->{NAME}." => ".$call->{function}
+    ." (".$json->{id}.") after ".sprintf("%.3f", time - $call->{time})."s";
+  # device might have been deleted meanwhile, e.g. async Undefine
+  my $devhash = $defs{$call->{NAME}};
+  return "continue" if (!defined($devhash));
+
+  if ($json->{error}) {
+    Log3 $hash, 1, "BindingsIo: ERROR: ".$call->{NAME}." ".$call->{function}." failed: ".$json->{error};
+    readingsSingleUpdate($devhash, "state", $json->{error}, 1);
+    return "continue";
+  }
+  foreach my $key (keys %$json) {
+    next if ($key eq "msgtype" or $key eq "finished" or $key eq "ws" or $key eq "returnval" or $key 
+      eq "function" or $key eq "defargs" or $key eq "defargsh" or $key eq "args" or $key eq "argsh" or $key eq "id");
+    $devhash->{$key} = $json->{$key};
+  }
+  if (defined($json->{returnval}) && $json->{returnval} ne "") {
+    # nobody waits for the result anymore
+    Log3 $hash, 3, "BindingsIo: ".$call->{NAME}." ".$call->{function}.": ".$json->{returnval};
+  }
+  return "continue";
+}
+
 sub
 BindingsIo_Undefine($$)
 {
@@ -264,7 +384,9 @@ BindingsIo_Get($$$)
 {
   my ($hash, $a, $h) = @_;
 
-  return undef;
+  # handled by the binding itself, e.g. get pyBinding stats
+  return $hash->{NAME}." is not connected" if(!DevIo_IsOpen($hash));
+  return BindingsIo_Write($hash, $hash, "Get", $a, $h);
 }
 
 sub
@@ -272,7 +394,8 @@ BindingsIo_Set($$$)
 {
   my ($hash, $a, $h) = @_;
 
-  return undef;
+  return $hash->{NAME}." is not connected" if(!DevIo_IsOpen($hash));
+  return BindingsIo_Write($hash, $hash, "Set", $a, $h);
 }
 
 sub
@@ -314,6 +437,12 @@ sub BindingsIo_processMessage($$$$) {
     return "error";
   }
 
+  if ($json->{msgtype} eq "function" && $json->{finished} == 1 && defined($json->{id})
+      && exists($hash->{asyncCalls}{$json->{id}})) {
+    # reply of an async call, can arrive any time
+    return BindingsIo_asyncDone($hash, $json);
+  }
+
   if ($waitingForId != 0) {
     # function running
     # skip messages which aren't part of the function
@@ -355,24 +484,28 @@ sub BindingsIo_processMessage($$$$) {
   } elsif ($json->{msgtype} eq "command") {
     my $ret = 0;
     my %res;
+    my $evalstart = time;
     $ret = eval $json->{command};
+    my $evaltime = time - $evalstart;
     if ($@) {
       Log3 $hash, 1, "BindingsIo: ERROR failed (".$json->{command}."): ".$@;
       %res = (
         awaitId => $json->{awaitId},
         error => 1,
         errorText => $@,
-        result => $ret
+        result => $ret,
+        evaltime => $evaltime
       );
     } else {
       %res = (
         awaitId => $json->{awaitId},
         error => 0,
-        result => $ret
+        result => $ret,
+        evaltime => $evaltime
       );
     }
     my $utf8msg = Encode::encode("utf-8", Encode::decode("utf-8", to_json(\%res)));
-    Log3 $hash, 4, "BindingsIo: <<< WS: ".$utf8msg;
+    Log3 $hash, 4, "BindingsIo: <<< WS: ".$utf8msg.($json->{traceId} ? " (trace ".$json->{traceId}.")" : "");
     if (length $utf8msg > 0) {
       DevIo_SimpleWrite($hash, $utf8msg, 0);
     }
@@ -498,7 +631,79 @@ sub BindingsIo_readWebsocketMessage($$$$) {
   <a name="BindingsIo_Define"></a>
   <b>Define</b>
   <ul>
-  define pybinding BindingsIo Python
+  define pybinding BindingsIo Python [port=&lt;port&gt;] [host=&lt;listen address&gt;] [socket=&lt;path&gt;]<br>
+  define pybinding BindingsIo &lt;host:port&gt;|unix:&lt;path&gt; Python<br><br>
+  The first form starts pythonbinding.py (PythonBinding device), by default it listens on port 15733 of all interfaces.
+  With host=&lt;listen address&gt; (IPv4 address or host name) it only listens on this address and FHEM connects to it.
+  With socket=&lt;path&gt; FHEM and the binding communicate through a unix domain socket, no TCP port is opened.
+  The PythonBinding device is created once, delete it after changing these options.
+  The second form connects to a binding which was started outside of FHEM.<br>
+  Example: <code>define pybinding BindingsIo Python socket=./log/pythonbinding.sock</code>
+  </ul>
+
+  <a name="BindingsIo_Set"></a>
+  <b>Set</b>
+  <ul>
+    <li>statsReset<br>
+      Reset the statistics shown by get stats.</li>
+    <li>tracing on|off<br>
+      Record timings of every function call (transfer, queueing, module code, nested commands and their Perl eval time).</li>
+    <li>traceExport<br>
+      Write the recorded traces as Chrome trace file (chrome://tracing, Perfetto) to ./log.</li>
+    <li>memoryTracking on|off<br>
+      Track memory allocations with tracemalloc and attribute them to the module packages (lib/&lt;type&gt;).
+      Every 5 minutes the readings memory_&lt;type&gt; (kB) are updated. Tracking slows down the binding.</li>
+    <li>memorySnapshot<br>
+      Store the current allocations as base for get memoryDiff.</li>
+    <li>profile &lt;device|module type|all&gt; [seconds]<br>
+      Profile for the given seconds (default 30). <i>all</i> uses cProfile for everything on the event loop
+      (./log/pythonbinding-profile-all-*.prof, open with snakeviz or pstats). A device or module type is
+      profiled with a sampler which includes executor jobs started by the module, the stacks are written
+      in collapsed format (*.folded) for flamegraph.pl or speedscope. The readings profile_state,
+      profile_top and profile_file show the result.</li>
+    <li>reload &lt;module type&gt;<br>
+      Load the changed code of a module type without restarting the binding. The devices of this type
+      (and of types which import it) are deleted in Python, the modules are imported again and the devices
+      are defined again. Calls in between wait for the reload. The reading reload_state shows the result.</li>
+  </ul>
+
+  <a name="BindingsIo_Attr"></a>
+  <b>Attributes</b>
+  <ul>
+    <li>asyncMode 0|1<br>
+      FHEM doesn't wait for the binding on calls whose result isn't needed right away
+      (set commands except <i>set &lt;device&gt; ?</i>, delete and the defines after a reconnect).
+      The binding replies later, the set command returns immediately and the module updates its
+      readings when it's done. Errors of these calls are logged and written to the state reading.
+      Default is 0, every call blocks FHEM until the binding replied (max. 1.5s).</li>
+  </ul>
+
+  <a name="BindingsIo_Get"></a>
+  <b>Get</b>
+  <ul>
+    <li>stats<br>
+      Call count, in-flight calls, timeouts, errors and latency percentiles (p50, p95, p99, max)
+      of all functions called by FHEM (per module type and function) and all commands sent to FHEM.</li>
+    <li>blocking<br>
+      The last event loop stalls (blocking code in a module) with duration, device and code location.</li>
+    <li>imports<br>
+      Import time and number of imported modules per module type.</li>
+    <li>loading<br>
+      Progress of the module loading (e.g. during FHEM startup) and the state of each module type.</li>
+    <li>workers<br>
+      Worker processes with their devices, module types, restarts and the last crash reason
+      (PythonBinding attributes workers and isolate).</li>
+    <li>memory<br>
+      Allocated memory per module (requires memoryTracking on).</li>
+    <li>memoryDiff<br>
+      Memory growth per module and the allocations which grew most since set memorySnapshot.</li>
+    <li>leakedTasks<br>
+      Tasks which still ran code of a deleted device 10s after its Undefine, with device, age and coroutine.
+      They were cancelled and logged.</li>
+    <li>traces<br>
+      List the last recorded traces, the trace id is the id logged by BindingsIo with verbose 4.</li>
+    <li>trace &lt;traceId&gt;<br>
+      All spans of one function call as JSON.</li>
   </ul>
 
 </ul><br>
@@ -25,14 +25,45 @@ PythonBinding_Initialize($)
 
   $hash->{ReadFn}   = 'PythonBinding_Read';
 
+  $hash->{AttrList} = "metricsPort wheelhouse useBundle:0,1 extraArgs workers isolate";
+
   return undef;
 }
 
+sub
+PythonBinding_getScript()
+{
+  return "FHEM/bindings/python/pythonbinding.py";
+}
+
 sub
 PythonBinding_getCmd($)
 {
   my ($hash) = @_;
-  return "FHEM/bindings/python/pythonbinding.py";
+  my $cmd = PythonBinding_getScript();
+  if (AttrVal($hash->{NAME}, "useBundle", 0)) {
+    my $bundle = $cmd;
+    $bundle =~ s/\.py$/.pyz/;
+    if (-f $bundle) {
+      $cmd = $bundle;
+    } else {
+      Log3 $hash, 2, "$hash->{NAME}: $bundle not found, run build_bundle.py";
+    }
+  }
+  my $metricsPort = AttrVal($hash->{NAME}, "metricsPort", 0);
+  $cmd .= " --metrics-port ".$metricsPort if ($metricsPort);
+  $cmd .= " --unix-socket ".$hash->{SOCKET} if (defined($hash->{SOCKET}));
+  $cmd .= " --port ".$hash->{PORT} if (defined($hash->{PORT}));
+  $cmd .= " --host ".$hash->{HOST} if (defined($hash->{HOST}));
+  my $extraArgs = AttrVal($hash->{NAME}, "extraArgs", "");
+  $cmd .= " ".$extraArgs if ($extraArgs ne "");
+  my $wheelhouse = AttrVal($hash->{NAME}, "wheelhouse", "");
+  $cmd .= " --wheelhouse ".$wheelhouse if ($wheelhouse ne "");
+  my $workers = AttrVal($hash->{NAME}, "workers", 0);
+  $cmd .= " --workers ".$workers if ($workers);
+  my $isolate = AttrVal($hash->{NAME}, "isolate", "");
+  $cmd .= " --isolate ".$isolate if ($isolate ne "");
+  return $cmd;
 }
 
 sub
@@ -43,12 +74,17 @@ PythonBinding_Define($$$)
 
   Log3 $hash, 3, "PythonBinding v1.0.0";
 
+  # listener of pythonbinding.py, set by BindingsIo
+  $hash->{SOCKET} = $h->{socket} if (defined($h->{socket}));
+  $hash->{PORT} = $h->{port} if (defined($h->{port}));
+  $hash->{HOST} = $h->{host} if (defined($h->{host}));
+
   $hash->{logfile} = "./log/PythonBinding-%Y-%m-%d.log";
   $hash->{CoProcess} = {  name => 'PythonBinding',
                           cmdFn => 'PythonBinding_getCmd',
                        };
 
-  chmod(0744, PythonBinding_getCmd($hash));
+  chmod(0744, PythonBinding_getScript());
 
   readingsSingleUpdate($hash, "state", "active", 1);
   if ($init_done) {
@@ -187,7 +223,31 @@ PythonBinding_Shutdown($)
   <a name="PythonBinding_Attr"></a>
   <b>Attr</b>
   <ul>
-  -
+    <li>metricsPort<br>
+      Serve internal metrics in Prometheus format on http://127.0.0.1:&lt;metricsPort&gt;/metrics.
+      Takes effect with the next start of pythonbinding.py.</li>
+    <li>extraArgs<br>
+      Further arguments for pythonbinding.py, e.g. <code>--uvloop</code> or <code>--loop-debug --slow-callback 0.05</code>.
+      Takes effect with the next start of pythonbinding.py.</li>
+    <li>useBundle 0|1<br>
+      Start pythonbinding.pyz instead of pythonbinding.py. The bundle contains precompiled bytecode of all modules
+      in one file, which speeds up the start on systems with SD card. Build it with
+      <code>python3 FHEM/bindings/python/build_bundle.py</code> and again after each update.
+      Takes effect with the next start of pythonbinding.py.</li>
+    <li>wheelhouse<br>
+      Directory with wheels of all module requirements. Missing requirements are installed from this
+      directory only, PyPI isn't accessed (for systems without internet access).
+      Takes effect with the next start of pythonbinding.py.</li>
+    <li>workers<br>
+      Number of worker processes for the module instances, by default all devices run in one process.
+      Devices are assigned to the workers by module type, with <code>extraArgs --shard-by name</code> by device name.
+      <code>get pyBinding workers</code> shows the assignment.
+      Takes effect with the next start of pythonbinding.py.</li>
+    <li>isolate &lt;type&gt;[,&lt;type&gt;]<br>
+      Run each of these module types in its own process, e.g. types with native libraries like
+      <code>object_detection,eq3bt</code>. If the process crashes, it is restarted and only the devices of
+      this type are defined again. The devices get the readings worker_restarts and worker_crash (reason).
+      Takes effect with the next start of pythonbinding.py.</li>
   </ul>
 </ul><br>
 
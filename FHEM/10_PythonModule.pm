@@ -25,7 +25,7 @@ PythonModule_Initialize($)
   $hash->{SetFn}    = 'PythonModule_Set';
   $hash->{AttrFn}   = 'PythonModule_Attr';
   $hash->{RenameFn} = 'PythonModule_Rename';
-  $hash->{AttrList} = 'IODev '.$readingFnAttributes;
+  $hash->{AttrList} = 'IODev readingThrottle:textField-long '.$readingFnAttributes;
 
   return undef;
 }
@@ -132,7 +132,15 @@ PythonModule_Shutdown($)
 <h3>PythonModule</h3>
 <ul>
   This module provides the interface for python modules.<br><br>
-  <a href="https://github.com/dominikkarall/fhem_pythonbinding#readme">Click here for online README</a>
+  <a href="https://github.com/dominikkarall/fhem_pythonbinding#readme">Click here for online README</a><br><br>
+
+  <a name="PythonModule_Attr"></a>
+  <b>Attr</b>
+  <ul>
+    <li>readingThrottle<br>
+    Space separated list of &lt;reading regex&gt;:&lt;every|min|max|avg|delta&gt;:&lt;value&gt;
+    to limit the updates of high frequency readings, e.g. load_power:avg:10</li>
+  </ul>
 </ul><br>
 
 =end html
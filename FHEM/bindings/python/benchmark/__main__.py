@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+
+from .fhem_standin import FhemStandIn, start_binding, git_revision
+from . import scenarios
+
+async def run(args):
+    fhem = FhemStandIn(args.connect)
+    await fhem.connect()
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "label": args.label,
+        "scenarios": {}
+    }
+    selected = args.scenario or list(scenarios.SCENARIOS)
+    try:
+        for name in selected:
+            kwargs = scenarios.QUICK.get(name, {}) if args.quick else {}
+            fhem.reset_counters()
+            print("running " + name + "...", file=sys.stderr)
+            start = time.perf_counter()
+            try:
+                result = await scenarios.SCENARIOS[name](fhem, **kwargs)
+                result["ok"] = True
+            except Exception as e:
+                result = {"ok": False, "error": repr(e)}
+            result["wall_s"] = round(time.perf_counter() - start, 3)
+            result["standin"] = scenarios.standin_counters(fhem)
+            report["scenarios"][name] = result
+    finally:
+        await fhem.close()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark",
+        description="Benchmark fhem_pythonbinding against a FHEM stand-in")
+    parser.add_argument("--connect", default=None,
+        help="websocket uri of a running binding, e.g. ws://127.0.0.1:15733 or unix:/path (default: start one)")
+    parser.add_argument("--scenario", action="append", choices=list(scenarios.SCENARIOS),
+        help="scenario to run, can be given multiple times (default: all)")
+    parser.add_argument("--quick", action="store_true", help="small iteration counts")
+    parser.add_argument("--output", "-o", default=None, help="write JSON report to file")
+    parser.add_argument("--label", default=None, help="free text stored in the report")
+    parser.add_argument("--binding-arg", action="append", default=[],
+        help="extra argument for pythonbinding.py")
+    parser.add_argument("--binding-log", default=None, help="write binding output to file")
+    args = parser.parse_args()
+
+    proc = None
+    if args.connect is None:
+        args.connect = "ws://127.0.0.1:15733"
+        for arg in args.binding_arg:
+            if arg.startswith("--unix-socket="):
+                args.connect = "unix:" + arg.split("=", 1)[1]
+        proc = start_binding(args.binding_arg, args.binding_log)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(data + "\n")
+    else:
+        print(data)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Cold start: start the binding, measure when the websocket accepts
+connections and when the first Define is done. Compare pythonbinding.py
+with the zipapp built by build_bundle.py:
+
+    python -m benchmark.coldstart --runs 10 -o script.json
+    python -m benchmark.coldstart --runs 10 --bundle -o bundle.json
+
+--drop-caches (root only) empties the page cache before every run, which
+is what a reboot of a system with an SD card looks like.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+
+from .fhem_standin import FhemStandIn, FhemDevice, start_binding, git_revision, ROOT
+from .scenarios import latency_summary
+
+BUNDLE = "FHEM/bindings/python/pythonbinding.pyz"
+STARTUP_RE = re.compile(r"(\w+) ([\d.]+)s")
+
+def drop_caches():
+    subprocess.run(["sync"], check=True)
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+async def measure(start, pythontype):
+    fhem = FhemStandIn()
+    await fhem.connect(interval=0.005)
+    listening = time.perf_counter() - start
+    try:
+        await fhem.define("coldstart", pythontype)
+        await fhem.wait_for_reading("coldstart", "state")
+        first_define = time.perf_counter() - start
+        # phases measured by the binding itself, from process start,
+        # first_define is recorded after Define returned
+        await asyncio.sleep(0.2)
+        fhem.defs["pyBinding"] = FhemDevice("pyBinding", None, None)
+        reply, _ = await fhem.call("pyBinding", "Get", ["pyBinding", "imports"])
+        line = reply.get("returnval", "").split("\n")[0]
+        binding = {phase: float(seconds) for phase, seconds in STARTUP_RE.findall(line)}
+    finally:
+        await fhem.close()
+    return {"listening_s": round(listening, 3), "first_define_s": round(first_define, 3), "binding": binding}
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark.coldstart",
+        description="Cold start time of fhem_pythonbinding")
+    parser.add_argument("--runs", type=int, default=5, help="number of starts")
+    parser.add_argument("--bundle", action="store_true", help="start " + BUNDLE + " instead of pythonbinding.py")
+    parser.add_argument("--pythontype", default="helloworld", help="module of the first Define")
+    parser.add_argument("--drop-caches", action="store_true", help="empty the page cache before each run (root)")
+    parser.add_argument("--output", "-o", default=None, help="write JSON report to file")
+    parser.add_argument("--label", default=None, help="free text stored in the report")
+    parser.add_argument("--binding-arg", action="append", default=[],
+        help="extra argument for pythonbinding.py")
+    args = parser.parse_args()
+
+    script = BUNDLE if args.bundle else None
+    if script and not os.path.exists(os.path.join(ROOT, script)):
+        sys.exit(script + " not found, run build_bundle.py first")
+    runs = []
+    for i in range(args.runs):
+        if args.drop_caches:
+            drop_caches()
+        start = time.perf_counter()
+        proc = start_binding(args.binding_arg, script=script)
+        try:
+            runs.append(asyncio.run(measure(start, args.pythontype)))
+        finally:
+            proc.terminate()
+            proc.wait()
+        print(f"run {i + 1}: " + json.dumps(runs[-1]), file=sys.stderr)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "label": args.label,
+        "mode": "bundle" if args.bundle else "script",
+        "drop_caches": args.drop_caches,
+        "listening": latency_summary([r["listening_s"] for r in runs]),
+        "first_define": latency_summary([r["first_define_s"] for r in runs]),
+        "runs": runs
+    }
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(data + "\n")
+    else:
+        print(data)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Compare two reports of python -m benchmark, e.g. asyncio and uvloop:
+
+    python -m benchmark -o asyncio.json --label asyncio
+    python -m benchmark -o uvloop.json --label uvloop --binding-arg=--uvloop
+    python -m benchmark.compare asyncio.json uvloop.json
+"""
+import argparse
+import json
+
+# counters of the stand-in aren't results
+SKIP = ("standin", "ok", "error")
+
+def flatten(result, prefix=""):
+    values = {}
+    for key, value in result.items():
+        if key in SKIP:
+            continue
+        if isinstance(value, dict):
+            values.update(flatten(value, prefix + key + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[prefix + key] = value
+    return values
+
+def compare(base, other):
+    rows = []
+    for scenario, result in base["scenarios"].items():
+        if scenario not in other["scenarios"]:
+            continue
+        a = flatten(result)
+        b = flatten(other["scenarios"][scenario])
+        for key in a:
+            if key in b:
+                change = (b[key] - a[key]) / a[key] * 100 if a[key] else None
+                rows.append((scenario, key, a[key], b[key], change))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark.compare",
+        description="Compare two benchmark reports")
+    parser.add_argument("base")
+    parser.add_argument("other")
+    args = parser.parse_args()
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.other) as f:
+        other = json.load(f)
+
+    print("{:<20} {:<28} {:>12} {:>12} {:>8}".format("scenario", "metric",
+        base.get("label") or "base", other.get("label") or "other", "change"))
+    for scenario, key, a, b, change in compare(base, other):
+        print("{:<20} {:<28} {:>12} {:>12} {:>8}".format(scenario, key, a, b,
+            "" if change is None else f"{change:+.1f}%"))
+
+if __name__ == "__main__":
+    main()
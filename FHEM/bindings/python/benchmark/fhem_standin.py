@@ -0,0 +1,345 @@
+"""
+Python stand-in for 10_BindingsIo.pm
+
+Connects to fhem_pythonbinding the same way BindingsIo does, sends
+function calls (Define, Set, Attr, ...) and answers the command messages
+of fhem.py from an in-memory %defs/readings/attr model.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+
+import websockets
+
+# repository root, FHEM runs pythonbinding.py from there
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", ".."))
+# module types of the benchmark (synthetic_load), not part of lib/
+MODULE_DIR = "FHEM/bindings/python/benchmark/modules"
+
+# 'string' "string" $defs{'NAME'} number undef
+ARG_RE = re.compile(r"""'((?:\\.|[^'\\])*)'|"((?:\\.|[^"\\])*)"|\$defs\{'([^']*)'\}|(-?\d+(?:\.\d+)?)|(undef)""")
+CALL_RE = re.compile(r"^\s*(\w+)\((.*)\)\s*$", re.S)
+
+def start_binding(args=None, logfile=None, script=None):
+    """Start pythonbinding.py the same way 10_PythonBinding does"""
+    cmd = [sys.executable, script or "FHEM/bindings/python/pythonbinding.py", "--module-dir", MODULE_DIR] + (args or [])
+    out = open(logfile, "w") if logfile else subprocess.DEVNULL
+    return subprocess.Popen(cmd, cwd=ROOT, stdout=out, stderr=subprocess.STDOUT)
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+class FhemDevice:
+
+    def __init__(self, name, pythontype, defargs, defargsh=None):
+        self.name = name
+        self.pythontype = pythontype
+        self.defargs = defargs
+        self.defargsh = defargsh or {}
+        self.readings = {}
+        self.attrs = {}
+        self.internals = {"NAME": name, "TYPE": "PythonModule", "PYTHONTYPE": pythontype}
+        self.userattr = ""
+
+class FhemStandIn:
+
+    def __init__(self, uri="ws://127.0.0.1:15733"):
+        self.uri = uri
+        self.defs = {}
+        self.ws = None
+        self.unique_id = "%032x" % random.getrandbits(128)
+        self._pending = {}
+        self._reading_waiters = {}
+        self._bulk = {}
+        self._reader_task = None
+        # FHEM blocks in BindingsIo_Write, only one function call at a time
+        self._call_lock = asyncio.Lock()
+        # counters for the report
+        self.commands = {}
+        self.command_errors = 0
+        self.call_errors = 0
+        self.readings_updated = 0
+        self.messages_received = 0
+        self.messages_sent = 0
+
+    async def connect(self, timeout=30, interval=0.2):
+        start = time.time()
+        while True:
+            try:
+                if self.uri.startswith("unix:"):
+                    self.ws = await websockets.unix_connect(self.uri[5:], "ws://localhost/",
+                        ping_interval=None, max_size=None)
+                else:
+                    self.ws = await websockets.connect(self.uri, ping_interval=None, max_size=None)
+                break
+            except OSError:
+                if time.time() - start > timeout:
+                    raise
+                await asyncio.sleep(interval)
+        self._reader_task = asyncio.create_task(self._reader())
+
+    async def close(self):
+        if self.ws:
+            await self.ws.close()
+        if self._reader_task:
+            self._reader_task.cancel()
+
+    def reset_counters(self):
+        self.commands = {}
+        self.command_errors = 0
+        self.call_errors = 0
+        self.readings_updated = 0
+        self.messages_received = 0
+        self.messages_sent = 0
+
+    async def _send(self, msg):
+        self.messages_sent += 1
+        await self.ws.send(json.dumps(msg, ensure_ascii=False))
+
+    async def _reader(self):
+        async for payload in self.ws:
+            self.messages_received += 1
+            msg = json.loads(payload)
+            if msg.get("msgtype") == "command":
+                await self._handle_command(msg)
+            elif msg.get("msgtype") == "update_hash":
+                self._update_internals(msg)
+            elif msg.get("msgtype") == "function" and msg.get("finished") == 1:
+                fut = self._pending.pop(msg["id"], None)
+                if fut and not fut.done():
+                    fut.set_result(msg)
+
+    def _update_internals(self, msg):
+        dev = self.defs.get(msg.get("NAME"))
+        if dev is None:
+            return
+        for key, value in msg.items():
+            if key not in ("msgtype", "finished", "returnval", "function", "defargs",
+                    "defargsh", "args", "argsh", "id", "ws"):
+                dev.internals[key] = value
+
+    # FUNCTION CALLS (BindingsIo_Write)
+    async def call(self, name, function, args=None, argsh=None, timeout=10):
+        """Send function message and wait for the reply, returns (reply, latency)"""
+        dev = self.defs[name]
+        msg_id = random.randint(1, 100000000)
+        msg = {
+            "id": msg_id,
+            "msgtype": "function",
+            "NAME": name,
+            "function": function,
+            "args": args if args is not None else [],
+            "argsh": argsh if argsh is not None else {},
+            "defargs": dev.defargs,
+            "defargsh": dev.defargsh,
+            "PYTHONTYPE": dev.pythontype,
+            "sent": time.time()
+        }
+        async with self._call_lock:
+            fut = asyncio.get_running_loop().create_future()
+            self._pending[msg_id] = fut
+            start = time.perf_counter()
+            await self._send(msg)
+            try:
+                reply = await asyncio.wait_for(fut, timeout)
+            finally:
+                self._pending.pop(msg_id, None)
+            latency = time.perf_counter() - start
+        if "error" in reply:
+            self.call_errors += 1
+        self._update_internals(reply)
+        return reply, latency
+
+    async def call_async(self, name, function, args=None, argsh=None):
+        """Send function message with asyncMode, returns a future of the reply"""
+        dev = self.defs[name]
+        msg_id = random.randint(1, 100000000)
+        msg = {
+            "id": msg_id,
+            "msgtype": "function",
+            "NAME": name,
+            "function": function,
+            "args": args if args is not None else [],
+            "argsh": argsh if argsh is not None else {},
+            "defargs": dev.defargs,
+            "defargsh": dev.defargsh,
+            "PYTHONTYPE": dev.pythontype,
+            "sent": time.time(),
+            "async": 1
+        }
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[msg_id] = fut
+        # FHEM continues right after sending, the reply is handled by the reader
+        await self._send(msg)
+        return fut
+
+    async def define(self, name, pythontype, *args):
+        defargs = [name, "PythonModule", pythontype] + list(args)
+        self.defs[name] = FhemDevice(name, pythontype, defargs)
+        return await self.call(name, "Define", defargs)
+
+    async def set(self, name, *args, timeout=10):
+        return await self.call(name, "Set", [name] + list(args), timeout=timeout)
+
+    async def set_async(self, name, *args):
+        return await self.call_async(name, "Set", [name] + list(args))
+
+    async def get(self, name, *args, timeout=10):
+        return await self.call(name, "Get", [name] + list(args), timeout=timeout)
+
+    async def attr(self, name, attr, value):
+        self.defs[name].attrs[attr] = value
+        return await self.call(name, "Attr", ["set", name, attr, value])
+
+    async def undefine(self, name):
+        ret = await self.call(name, "Undefine")
+        del self.defs[name]
+        return ret
+
+    async def wait_for_reading(self, name, reading, value=None, timeout=30):
+        dev = self.defs[name]
+        if reading in dev.readings and (value is None or dev.readings[reading][0] == value):
+            return dev.readings[reading][0]
+        fut = asyncio.get_running_loop().create_future()
+        self._reading_waiters.setdefault((name, reading), []).append((value, fut))
+        return await asyncio.wait_for(fut, timeout)
+
+    # COMMAND HANDLING (BindingsIo_processMessage)
+    async def _handle_command(self, msg):
+        start = time.time()
+        try:
+            result = self.eval(msg["command"])
+            reply = {"awaitId": msg["awaitId"], "error": 0, "result": result}
+        except Exception as e:
+            self.command_errors += 1
+            reply = {"awaitId": msg["awaitId"], "error": 1, "errorText": str(e), "result": None}
+        reply["evaltime"] = time.time() - start
+        await self._send(reply)
+
+    def eval(self, command):
+        """Evaluate the perl commands generated by fhem.py"""
+        if command.startswith("foreach my $fhem_dev"):
+            return self._check_if_device_exists(command)
+        result = ""
+        for statement in command.split(";;"):
+            if statement.strip() == "":
+                continue
+            m = CALL_RE.match(statement)
+            if m is None:
+                raise Exception("Unsupported command: " + statement)
+            fct_name = m.group(1)
+            self.commands[fct_name] = self.commands.get(fct_name, 0) + 1
+            fct = getattr(self, "_fhem_" + fct_name, None)
+            if fct is None:
+                raise Exception("Unsupported function: " + fct_name)
+            result = fct(*self._parse_args(m.group(2)))
+        return result
+
+    def _parse_args(self, argstr):
+        args = []
+        for m in ARG_RE.finditer(argstr):
+            if m.group(1) is not None:
+                args.append(re.sub(r"\\(.)", r"\1", m.group(1)))
+            elif m.group(2) is not None:
+                args.append(re.sub(r"\\(.)", r"\1", m.group(2)))
+            elif m.group(3) is not None:
+                args.append(self.defs.get(m.group(3)))
+            elif m.group(4) is not None:
+                args.append(m.group(4))
+            else:
+                args.append(None)
+        return args
+
+    def _check_if_device_exists(self, command):
+        m = re.search(r"\{(\w+)\} eq '([^']*)' && \$main::defs\{\$fhem_dev\}\{(\w+)\} eq '([^']*)'", command)
+        if m is None:
+            return 0
+        for dev in self.defs.values():
+            if dev.internals.get(m.group(1)) == m.group(2) and str(dev.internals.get(m.group(3))) == m.group(4):
+                return 1
+        return 0
+
+    def _set_reading(self, dev, reading, value, changed_only=False):
+        if dev is None:
+            raise Exception("Device doesn't exist")
+        if changed_only and reading in dev.readings and dev.readings[reading][0] == value:
+            return
+        dev.readings[reading] = (value, time.time())
+        self.readings_updated += 1
+        waiters = self._reading_waiters.get((dev.name, reading))
+        if waiters:
+            for expected, fut in list(waiters):
+                if (expected is None or expected == value) and not fut.done():
+                    fut.set_result(value)
+                    waiters.remove((expected, fut))
+
+    def _fhem_getUniqueId(self):
+        return self.unique_id
+
+    def _fhem_ReadingsVal(self, name, reading, default):
+        dev = self.defs.get(name)
+        if dev and reading in dev.readings:
+            return dev.readings[reading][0]
+        return default
+
+    def _fhem_AttrVal(self, name, attr, default):
+        dev = self.defs.get(name)
+        if dev and attr in dev.attrs:
+            return dev.attrs[attr]
+        return default
+
+    def _fhem_InternalVal(self, name, internal, default):
+        dev = self.defs.get(name)
+        if dev and internal in dev.internals:
+            return dev.internals[internal]
+        return default
+
+    def _fhem_addToDevAttrList(self, name, attr_list):
+        self.defs[name].userattr += " " + attr_list
+
+    def _fhem_setDevAttrList(self, name, attr_list):
+        self.defs[name].userattr = attr_list
+
+    def _fhem_readingsBeginUpdate(self, dev):
+        self._bulk[dev.name] = True
+
+    def _fhem_readingsBulkUpdate(self, dev, reading, value, changed=None):
+        self._set_reading(dev, reading, value)
+
+    def _fhem_readingsBulkUpdateIfChanged(self, dev, reading, value):
+        self._set_reading(dev, reading, value, changed_only=True)
+
+    def _fhem_readingsEndUpdate(self, dev, do_trigger):
+        self._bulk.pop(dev.name, None)
+
+    def _fhem_readingsSingleUpdate(self, dev, reading, value, do_trigger):
+        self._set_reading(dev, reading, value)
+
+    def _fhem_CommandDefine(self, cl, definition):
+        parts = definition.split()
+        if len(parts) > 2 and parts[1] == "PythonModule":
+            self.defs[parts[0]] = FhemDevice(parts[0], parts[2], parts)
+        return None
+
+    def _fhem_CommandAttr(self, cl, attrdef):
+        parts = attrdef.split(" ", 2)
+        if parts[0] in self.defs and len(parts) == 3:
+            self.defs[parts[0]].attrs[parts[1]] = parts[2]
+        return None
+
+    def _fhem_CommandDeleteReading(self, cl, deldef):
+        name, regex = deldef.split(" ", 1)
+        dev = self.defs.get(name)
+        if dev:
+            for reading in [r for r in dev.readings if re.fullmatch(regex, r)]:
+                del dev.readings[reading]
+        return None
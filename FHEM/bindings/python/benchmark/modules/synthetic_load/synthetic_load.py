@@ -0,0 +1,123 @@
+
+import asyncio
+import json
+import os
+import signal
+import time
+
+from .. import fhem
+from .. import utils
+from .. import stats
+from .. import fhem_pythonbinding
+
+# device used by the benchmark suite to push readings into FHEM
+class synthetic_load:
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.hash = None
+        self.load_job = None
+        self.load_readings = 0
+        self.load_counter = 0
+        return
+
+    # FHEM FUNCTION
+    async def Define(self, hash, args, argsh):
+        self.hash = hash
+        await fhem.readingsBeginUpdate(hash)
+        await fhem.readingsBulkUpdateIfChanged(hash, "state", "ready")
+        await fhem.readingsEndUpdate(hash, 1)
+        return ""
+
+    # FHEM FUNCTION
+    async def Undefine(self, hash):
+        return
+
+    # FHEM FUNCTION
+    async def Set(self, hash, args, argsh):
+        set_list_conf = {
+           "burst": { "args": ["count", "readings"], "params": { "count": { "default": "100" }, "readings": { "default": "10" }}},
+           "background": { "args": ["count", "readings"], "params": { "count": { "default": "100" }, "readings": { "default": "10" }}},
+           "load": { "args": ["interval", "readings"], "params": { "interval": { "default": "0" }, "readings": { "default": "1" }}},
+           "block": { "args": ["seconds"], "params": { "seconds": { "default": "1" }}},
+           "crash": {},
+           "ping": {}
+        }
+        return await utils.handle_set(set_list_conf, self, hash, args, argsh)
+
+    # FHEM FUNCTION
+    async def Get(self, hash, args, argsh):
+        if len(args) > 1 and args[1] == "probe":
+            return json.dumps(self.probe())
+        return "Unknown argument " + (args[1] if len(args) > 1 else "?") + ", choose one of probe:noArg"
+
+    # internal state of the binding process, used by the soak test
+    def probe(self):
+        return {
+            "time": time.time(),
+            "rss_kb": stats.rss_bytes() // 1024,
+            "loop_lag": stats.loop_lag.read_window(),
+            "asyncio_tasks": len(asyncio.all_tasks()),
+            "device_tasks": sum(len(t) for t in utils.tasks.tasks.values()),
+            "leaked_tasks": len(utils.tasks.leaked),
+            "scheduled_jobs": utils.scheduler.job_count(),
+            "loadedModuleInstances": len(fhem_pythonbinding.loadedModuleInstances),
+            "moduleLoadingRunning": len(fhem_pythonbinding.moduleLoadingRunning),
+            "msg_listeners": len(fhem_pythonbinding.PyBinding.msg_listeners),
+            "update_locks": len(fhem.update_locks),
+            "reading_throttles": len(fhem.reading_throttles),
+            "function_active": len(fhem.function_active)
+        }
+
+    # push <count> bulk updates with <readings> readings each
+    async def set_burst(self, hash, params):
+        count = int(params["count"])
+        readings = int(params["readings"])
+        start = time.time()
+        for i in range(count):
+            await fhem.readingsBeginUpdate(hash)
+            for r in range(readings):
+                await fhem.readingsBulkUpdate(hash, "r" + str(r), i)
+            await fhem.readingsEndUpdate(hash, 1)
+        await fhem.readingsSingleUpdate(hash, "burst_duration", round(time.time() - start, 3), 1)
+        return ""
+
+    # same as burst but returns immediately
+    async def set_background(self, hash, params):
+        utils.create_task(hash, self.set_burst(hash, params))
+        return ""
+
+    # push <readings> readings every <interval> seconds, 0 stops
+    async def set_load(self, hash, params):
+        interval = float(params["interval"])
+        self.load_readings = int(params["readings"])
+        if interval <= 0:
+            if self.load_job:
+                self.load_job.cancel()
+                self.load_job = None
+        elif self.load_job:
+            self.load_job.set_interval(interval)
+        else:
+            self.load_job = utils.schedule_periodic(hash, interval, self.push_load)
+        return ""
+
+    async def push_load(self):
+        self.load_counter += 1
+        await fhem.readingsBeginUpdate(self.hash)
+        for r in range(self.load_readings):
+            await fhem.readingsBulkUpdate(self.hash, "l" + str(r), self.load_counter)
+        await fhem.readingsEndUpdate(self.hash, 1)
+
+    # blocks the event loop, used to test the loop watchdog
+    async def set_block(self, hash, params):
+        time.sleep(float(params["seconds"]))
+        return ""
+
+    # segfault like a native library, used to test the restart of isolated module types
+    async def set_crash(self, hash):
+        os.kill(os.getpid(), signal.SIGSEGV)
+        return ""
+
+    async def set_ping(self, hash):
+        await fhem.readingsSingleUpdate(hash, "state", "pong", 1)
+        return ""
@@ -0,0 +1,176 @@
+import asyncio
+import time
+
+def percentile(values, pct):
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[idx]
+
+def latency_summary(latencies):
+    if len(latencies) == 0:
+        return {"count": 0}
+    ms = [l * 1000 for l in latencies]
+    return {
+        "count": len(ms),
+        "min_ms": round(min(ms), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3)
+    }
+
+def standin_counters(fhem):
+    return {
+        "messages_sent": fhem.messages_sent,
+        "messages_received": fhem.messages_received,
+        "readings_updated": fhem.readings_updated,
+        "command_errors": fhem.command_errors,
+        "call_errors": fhem.call_errors,
+        "commands": dict(fhem.commands)
+    }
+
+async def cleanup(fhem, names):
+    for name in names:
+        await fhem.undefine(name)
+
+# define many devices at once, like FHEM does on startup
+async def define_storm(fhem, devices=50, pythontype="helloworld"):
+    names = ["bench_storm_" + str(i) for i in range(devices)]
+    start = time.perf_counter()
+    results = []
+    for name in names:
+        results.append(await fhem.define(name, pythontype))
+    replies = time.perf_counter() - start
+    await asyncio.gather(*[fhem.wait_for_reading(name, "state") for name in names])
+    ready = time.perf_counter() - start
+    result = {
+        "devices": devices,
+        "pythontype": pythontype,
+        "define_reply": latency_summary([r[1] for r in results]),
+        "all_replied_s": round(replies, 3),
+        "all_ready_s": round(ready, 3),
+        "devices_per_s": round(devices / ready, 1)
+    }
+    await cleanup(fhem, names)
+    return result
+
+# sequential set calls, each one updating one reading
+async def set_roundtrip(fhem, iterations=500, pythontype="helloworld"):
+    name = "bench_roundtrip"
+    await fhem.define(name, pythontype)
+    await fhem.wait_for_reading(name, "state")
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        reply, latency = await fhem.set(name, "on" if i % 2 else "off")
+        latencies.append(latency)
+    duration = time.perf_counter() - start
+    await cleanup(fhem, [name])
+    return {
+        "iterations": iterations,
+        "latency": latency_summary(latencies),
+        "calls_per_s": round(iterations / duration, 1)
+    }
+
+# one device pushing bulk updates as fast as possible
+async def bulk_readings(fhem, updates=200, readings=20):
+    name = "bench_bulk"
+    await fhem.define(name, "synthetic_load")
+    await fhem.wait_for_reading(name, "state")
+    before = fhem.readings_updated
+    start = time.perf_counter()
+    await fhem.set(name, "burst", str(updates), str(readings), timeout=600)
+    duration = time.perf_counter() - start
+    total = fhem.readings_updated - before
+    await cleanup(fhem, [name])
+    return {
+        "updates": updates,
+        "readings_per_update": readings,
+        "readings_received": total,
+        "duration_s": round(duration, 3),
+        "readings_per_s": round(total / duration, 1)
+    }
+
+# set round-trips while many devices push readings in the background
+async def concurrent_devices(fhem, devices=20, updates=50, readings=10):
+    names = ["bench_concurrent_" + str(i) for i in range(devices)]
+    probe = "bench_concurrent_probe"
+    for name in names + [probe]:
+        await fhem.define(name, "synthetic_load")
+    await asyncio.gather(*[fhem.wait_for_reading(name, "state") for name in names + [probe]])
+    before = fhem.readings_updated
+    start = time.perf_counter()
+    for name in names:
+        await fhem.set(name, "background", str(updates), str(readings))
+    done = asyncio.gather(*[fhem.wait_for_reading(name, "burst_duration", timeout=600) for name in names])
+    latencies = []
+    while not done.done():
+        reply, latency = await fhem.set(probe, "ping")
+        latencies.append(latency)
+        await asyncio.sleep(0.01)
+    await done
+    duration = time.perf_counter() - start
+    total = fhem.readings_updated - before
+    await cleanup(fhem, names + [probe])
+    return {
+        "devices": devices,
+        "updates": updates,
+        "readings_per_update": readings,
+        "probe_latency": latency_summary(latencies),
+        "readings_received": total,
+        "duration_s": round(duration, 3),
+        "readings_per_s": round(total / duration, 1)
+    }
+
+# set calls on many devices, blocking like BindingsIo_Write and with asyncMode
+async def async_set(fhem, devices=10, sets=20, pythontype="helloworld"):
+    names = ["bench_async_" + str(i) for i in range(devices)]
+    for name in names:
+        await fhem.define(name, pythontype)
+    await asyncio.gather(*[fhem.wait_for_reading(name, "state") for name in names])
+    result = {"devices": devices, "sets": sets}
+
+    start = time.perf_counter()
+    for i in range(sets):
+        for name in names:
+            await fhem.set(name, "on" if i % 2 else "off")
+    duration = time.perf_counter() - start
+    result["sync"] = {
+        "fhem_blocked_s": round(duration, 3),
+        "calls_per_s": round(devices * sets / duration, 1)
+    }
+
+    start = time.perf_counter()
+    replies = []
+    for i in range(sets):
+        for name in names:
+            replies.append(await fhem.set_async(name, "on" if i % 2 else "off"))
+    blocked = time.perf_counter() - start
+    await asyncio.wait_for(asyncio.gather(*replies), 60)
+    duration = time.perf_counter() - start
+    result["async"] = {
+        "fhem_blocked_s": round(blocked, 3),
+        "all_done_s": round(duration, 3),
+        "calls_per_s": round(devices * sets / duration, 1)
+    }
+    await cleanup(fhem, names)
+    return result
+
+SCENARIOS = {
+    "define_storm": define_storm,
+    "set_roundtrip": set_roundtrip,
+    "bulk_readings": bulk_readings,
+    "concurrent_devices": concurrent_devices,
+    "async_set": async_set
+}
+
+QUICK = {
+    "define_storm": {"devices": 10},
+    "set_roundtrip": {"iterations": 50},
+    "bulk_readings": {"updates": 20, "readings": 10},
+    "concurrent_devices": {"devices": 5, "updates": 10},
+    "async_set": {"devices": 5, "sets": 10}
+}
@@ -0,0 +1,174 @@
+"""
+Soak test: define many synthetic_load devices which push readings at a
+fixed rate and sample the state of the binding process over a long time.
+
+    python -m benchmark.soak --devices 1000 --interval 10 --duration 14400 -o soak.jsonl
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+
+from .fhem_standin import FhemStandIn, start_binding, git_revision
+from .scenarios import latency_summary
+
+PROBE = "soak_probe"
+
+# sizes which should not grow while the device count is constant
+GROWTH_KEYS = ["rss_kb", "asyncio_tasks", "device_tasks", "leaked_tasks", "scheduled_jobs",
+    "loadedModuleInstances", "moduleLoadingRunning", "msg_listeners", "update_locks",
+    "reading_throttles", "function_active"]
+
+async def probe(fhem):
+    reply, latency = await fhem.get(PROBE, "probe")
+    data = json.loads(reply["returnval"])
+    data["probe_ms"] = round(latency * 1000, 3)
+    return data
+
+class Soak:
+
+    def __init__(self, fhem, args):
+        self.fhem = fhem
+        self.args = args
+        self.names = ["soak_" + str(i) for i in range(args.devices)]
+        self.latencies = []
+        self.samples = []
+        self.out = open(args.output, "w") if args.output else None
+
+    def write(self, record):
+        if self.out:
+            self.out.write(json.dumps(record) + "\n")
+            self.out.flush()
+
+    async def setup(self):
+        await self.fhem.define(PROBE, "synthetic_load")
+        await self.fhem.wait_for_reading(PROBE, "state")
+        self.baseline = await probe(self.fhem)
+        start = time.perf_counter()
+        for name in self.names:
+            await self.fhem.define(name, "synthetic_load")
+        await asyncio.gather(*[self.fhem.wait_for_reading(name, "state", timeout=600) for name in self.names])
+        define_s = time.perf_counter() - start
+        before = await probe(self.fhem)
+        for name in self.names:
+            await self.fhem.set(name, "load", str(self.args.interval), str(self.args.readings))
+        self.write({"type": "setup", "define_s": round(define_s, 3), "probe": before})
+        return before
+
+    async def sample(self, window_start, readings_before):
+        # FHEM calls something from time to time, measure their latency
+        window = []
+        for i in range(self.args.pings):
+            reply, latency = await self.fhem.set(PROBE, "ping")
+            window.append(latency)
+        self.latencies.extend(window)
+        data = await probe(self.fhem)
+        now = time.perf_counter()
+        readings = self.fhem.readings_updated - readings_before
+        data["elapsed_s"] = round(now - self.start, 1)
+        data["readings_per_s"] = round(readings / (now - window_start), 1)
+        data["ping"] = latency_summary(window)
+        data["call_errors"] = self.fhem.call_errors
+        data["command_errors"] = self.fhem.command_errors
+        self.samples.append(data)
+        self.write(dict(type="sample", **data))
+        print(f"{data['elapsed_s']}s rss={data['rss_kb']}kB lag={data['loop_lag']['max_ms']}ms "
+            f"tasks={data['asyncio_tasks']} readings/s={data['readings_per_s']} "
+            f"ping p95={data['ping'].get('p95_ms')}ms", file=sys.stderr)
+
+    async def teardown(self):
+        for name in self.names:
+            await self.fhem.set(name, "load", "0")
+        for name in self.names:
+            await self.fhem.undefine(name)
+        # wait for the leak check of the task registry
+        await asyncio.sleep(12)
+        return await probe(self.fhem)
+
+    async def run(self):
+        before = await self.setup()
+        self.start = time.perf_counter()
+        end = self.start + self.args.duration
+        try:
+            while time.perf_counter() < end:
+                window_start = time.perf_counter()
+                readings_before = self.fhem.readings_updated
+                await asyncio.sleep(min(self.args.sample, max(0, end - window_start)))
+                await self.sample(window_start, readings_before)
+        except asyncio.CancelledError:
+            pass
+        after = await self.teardown()
+        summary = self.summary(before, after)
+        self.write(dict(type="summary", **summary))
+        if self.out:
+            self.out.close()
+        return summary
+
+    def summary(self, before, after):
+        summary = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "devices": self.args.devices,
+            "interval_s": self.args.interval,
+            "readings_per_push": self.args.readings,
+            "offered_readings_per_s": round(self.args.devices * self.args.readings / self.args.interval, 1),
+            "samples": len(self.samples),
+            "ping": latency_summary(self.latencies),
+            "baseline": self.baseline,
+            "before_load": before,
+            "after_undefine": after
+        }
+        if self.samples:
+            first, last = self.samples[0], self.samples[-1]
+            summary["growth"] = {key: last[key] - first[key] for key in GROWTH_KEYS}
+            summary["max_loop_lag_ms"] = max(s["loop_lag"]["max_ms"] for s in self.samples)
+            summary["min_readings_per_s"] = min(s["readings_per_s"] for s in self.samples)
+        # everything device related should be gone again after Undefine
+        summary["leftover"] = {key: after[key] - self.baseline[key] for key in GROWTH_KEYS}
+        return summary
+
+async def run(args):
+    fhem = FhemStandIn(args.connect)
+    await fhem.connect()
+    try:
+        return await Soak(fhem, args).run()
+    finally:
+        await fhem.close()
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark.soak",
+        description="Long running load test of fhem_pythonbinding")
+    parser.add_argument("--connect", default=None,
+        help="websocket uri of a running binding (default: start one)")
+    parser.add_argument("--devices", type=int, default=100, help="number of synthetic devices")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between updates of one device")
+    parser.add_argument("--readings", type=int, default=5, help="readings per update")
+    parser.add_argument("--duration", type=float, default=3600, help="seconds to run")
+    parser.add_argument("--sample", type=float, default=60, help="seconds between samples")
+    parser.add_argument("--pings", type=int, default=20, help="set calls per sample for latency")
+    parser.add_argument("--output", "-o", default=None, help="write samples and summary as JSON lines")
+    parser.add_argument("--binding-arg", action="append", default=[],
+        help="extra argument for pythonbinding.py")
+    parser.add_argument("--binding-log", default=None, help="write binding output to file")
+    args = parser.parse_args()
+
+    proc = None
+    if args.connect is None:
+        args.connect = "ws://127.0.0.1:15733"
+        proc = start_binding(args.binding_arg, args.binding_log)
+    try:
+        summary = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        summary = None
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+    if summary:
+        print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# Precompile lib/ and pack the binding into a single zipapp (pythonbinding.pyz).
+# Importing from one zip file needs a fraction of the stat/open calls of
+# the lib/ directory tree, which makes cold starts on SD cards faster.
+#
+#   python3 FHEM/bindings/python/build_bundle.py
+#   attr pythonbinding_15733 useBundle 1
+#
+# The bundle contains bytecode only and must be rebuilt after an update of
+# the binding or the Python interpreter. The code filenames are the paths
+# inside the bundle, a moved bundle needs a rebuild for per module statistics.
+
+import argparse
+import compileall
+import importlib.util
+import marshal
+import os
+import shutil
+import sys
+import tempfile
+import zipapp
+
+BINDING_DIR = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(BINDING_DIR, "lib")
+
+# files which are read with pkgutil.get_data, modules with other data files
+# open them by path and are loaded from the source tree instead
+BUNDLED_DATA = ("manifest.json",)
+
+MAIN = '''import os
+import sys
+import importlib.util
+
+if importlib.util.MAGIC_NUMBER != {magic!r}:
+    sys.exit("pythonbinding.pyz was built for another Python version, run build_bundle.py again")
+
+import lib
+# module types which aren't bundled are imported from the source tree next to the bundle
+lib.__path__.append(os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "lib"))
+
+import lib.fhem_pythonbinding as fpb
+
+fpb.run()
+'''
+
+def module_types():
+    return sorted(d for d in os.listdir(LIB_DIR)
+        if os.path.isfile(os.path.join(LIB_DIR, d, "__init__.py")))
+
+def data_files(pythontype):
+    files = []
+    for root, dirs, names in os.walk(os.path.join(LIB_DIR, pythontype)):
+        dirs[:] = [d for d in dirs if d != "__pycache__"]
+        files += [os.path.join(root, n) for n in names
+            if not n.endswith((".py", ".pyc", ".md")) and n not in BUNDLED_DATA]
+    return files
+
+def write_pyc(source, filename, target, optimize):
+    with open(source, "rb") as f:
+        data = f.read()
+    # filename is the path inside the bundle, loop_watchdog matches it against lib/
+    code = compile(data, filename, "exec", dont_inherit=True, optimize=optimize)
+    st = os.stat(source)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        # unchecked header, sourceless files in a zip aren't validated against a source
+        f.write(importlib.util.MAGIC_NUMBER)
+        f.write((0).to_bytes(4, "little"))
+        f.write((int(st.st_mtime) & 0xFFFFFFFF).to_bytes(4, "little"))
+        f.write((st.st_size & 0xFFFFFFFF).to_bytes(4, "little"))
+        f.write(marshal.dumps(code))
+
+def build(output, optimize, exclude):
+    output = os.path.abspath(output)
+    with tempfile.TemporaryDirectory() as tmp:
+        count = 0
+        for root, dirs, names in os.walk(LIB_DIR):
+            dirs[:] = [d for d in dirs if d != "__pycache__"]
+            rel = os.path.relpath(root, BINDING_DIR)
+            parts = rel.split(os.sep)
+            if len(parts) > 1 and parts[1] in exclude:
+                continue
+            for name in names:
+                source = os.path.join(root, name)
+                if name.endswith(".py"):
+                    write_pyc(source, os.path.join(output, rel, name),
+                        os.path.join(tmp, rel, name[:-3] + ".pyc"), optimize)
+                    count += 1
+                elif name in BUNDLED_DATA:
+                    shutil.copy2(source, os.path.join(tmp, rel, name))
+        with open(os.path.join(tmp, "__main__.py"), "w") as f:
+            f.write(MAIN.format(magic=importlib.util.MAGIC_NUMBER))
+        zipapp.create_archive(tmp, output, interpreter="/usr/bin/env python3")
+    os.chmod(output, 0o755)
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the pythonbinding.pyz bundle")
+    parser.add_argument("--output", "-o", default=os.path.join(BINDING_DIR, "pythonbinding.pyz"))
+    parser.add_argument("--optimize", type=int, choices=[0, 1, 2], default=1,
+        help="bytecode optimization level of the bundle, 2 also removes docstrings (default: 1)")
+    parser.add_argument("--exclude", action="append", default=[],
+        help="module type to load from the source tree, can be given multiple times")
+    parser.add_argument("--compile-only", action="store_true",
+        help="only precompile lib/ in place for pythonbinding.py, no bundle")
+    args = parser.parse_args()
+
+    # bytecode for pythonbinding.py and for the types loaded from the source tree
+    compileall.compile_dir(LIB_DIR, quiet=1, workers=0)
+    if args.compile_only:
+        print("Compiled " + LIB_DIR)
+        return
+
+    exclude = set(args.exclude)
+    for pythontype in module_types():
+        if pythontype not in exclude and data_files(pythontype):
+            print(f"{pythontype}: opens data files by path, loaded from the source tree")
+            exclude.add(pythontype)
+    count = build(args.output, args.optimize, exclude)
+    print(f"Wrote {args.output} ({count} modules, {os.path.getsize(args.output) // 1024} kB)")
+
+if __name__ == "__main__":
+    main()
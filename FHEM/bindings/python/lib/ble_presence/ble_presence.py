@@ -4,6 +4,7 @@ import logging
 from bleak import BleakScanner
 
 from .. import fhem
+from .. import utils
 
 class ble_presence:
 
@@ -12,25 +13,24 @@ class ble_presence:
         # disable bleak discovery messages
         logging.getLogger("bleak.backends.bluezdbus.discovery").setLevel(logging.ERROR)
         self.hash = None
-        self.blescanTask = None
+        self.blescanJob = None
         return
 
     async def runBleScan(self):
-        while True:
-            new_state = "absent"
-            try:
-                device = await BleakScanner.find_device_by_address(self._address)
-                if device:
-                    await fhem.readingsSingleUpdateIfChanged(self.hash, "name", device.name, 1)
-                    await fhem.readingsSingleUpdateIfChanged(self.hash, "rssi", device.rssi, 1)
-                    new_state = "present"
-            except:
-                self.logger.exception("BleakScanner failed")
-            await self.update_state(new_state)
-            if new_state == "absent":
-                await asyncio.sleep(10)
-            else:
-                await asyncio.sleep(60)
+        new_state = "absent"
+        try:
+            device = await BleakScanner.find_device_by_address(self._address)
+            if device:
+                await fhem.readingsSingleUpdateIfChanged(self.hash, "name", device.name, 1)
+                await fhem.readingsSingleUpdateIfChanged(self.hash, "rssi", device.rssi, 1)
+                new_state = "present"
+        except:
+            self.logger.exception("BleakScanner failed")
+        await self.update_state(new_state)
+        if new_state == "absent":
+            self.blescanJob.set_interval(10)
+        else:
+            self.blescanJob.set_interval(60)
 
     async def update_state(self, new_state):
         await fhem.readingsSingleUpdateIfChanged(self.hash, "presence", new_state, 1)
@@ -46,13 +46,13 @@ class ble_presence:
         self.hash["MAC"] = args[3]
         await self.update_state("absent")
 
-        if self.blescanTask:
-            self.blescanTask.cancel()
-        self.blescanTask = asyncio.create_task(self.runBleScan())
+        if self.blescanJob:
+            self.blescanJob.cancel()
+        self.blescanJob = utils.schedule_periodic(hash, 10, self.runBleScan)
         return ""
 
     # FHEM FUNCTION
     async def Undefine(self, hash, args, argsh):
-        if self.blescanTask:
-            self.blescanTask.cancel()
+        if self.blescanJob:
+            self.blescanJob.cancel()
         return
\ No newline at end of file
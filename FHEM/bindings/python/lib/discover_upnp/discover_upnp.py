@@ -201,6 +201,13 @@ class discover_upnp:
     async def removed_device(self, upnp_device):
         return
 
+    # warm restart: renderers found in the last run can be created before the search finds them again
+    async def snapshot(self):
+        return {"create_devs": self.create_devs}
+
+    async def restore(self, hash, state):
+        self.create_devs = state["create_devs"]
+
     # FHEM Define
     async def Define(self, hash, args, argsh):
         """Start a discovery service."""
@@ -12,6 +12,7 @@ from async_upnp_client.profiles.dlna import DeviceState, DmrDevice
 from async_upnp_client.aiohttp import get_local_ip
 
 from .. import fhem
+from .. import utils
 from ..discover_upnp.discover_upnp import ssdp
 
 DEFAULT_LISTEN_PORT = 8301
@@ -42,6 +43,7 @@ class dlna_dmr:
         self.logger = logger
         self.server = None
         self.device = None
+        self.update_job = None
         # set log level to ERROR for aiohttp.access to avoid INFO notify msgs
         logging.getLogger("aiohttp.access").setLevel(logging.ERROR)
 
@@ -70,11 +72,12 @@ class dlna_dmr:
 
         await self.updateDeviceReadings()
         await fhem.readingsSingleUpdate(self.hash, "state", "online", 1)
-        self.update_task = asyncio.create_task(self.update())
+        self.update_job = utils.schedule_periodic(self.hash, 30, self.update)
 
     async def removed_device(self, upnp_device):
         await fhem.readingsSingleUpdate(self.hash, "state", "offline", 1)
-        self.update_task.cancel()
+        if self.update_job:
+            self.update_job.cancel()
         await self.device.cleanup()
         self.device = None
 
@@ -101,7 +104,8 @@ class dlna_dmr:
 
     # FHEM Function
     async def Undefine(self, hash):
-        self.update_task.cancel()
+        if self.update_job:
+            self.update_job.cancel()
         await ssdp.getInstance(self.logger).stop_search()
         if self.server:
             await self.server.stop_server()
@@ -143,13 +147,13 @@ class dlna_dmr:
                 if url is None:
                     await self.device.dlna_dmrdevice.async_media_play()
                 else:
-                    asyncio.create_task(self.device.async_play_media(url))
+                    utils.create_task(self.hash, self.device.async_play_media(url))
             elif cmd == "speak":
                 tts_url = "http://translate.google.com/translate_tts?tl=de&client=tw-ob&q=" + "%20".join(args[2:])
-                asyncio.create_task(self.device.async_play_media(tts_url))
+                utils.create_task(self.hash, self.device.async_play_media(tts_url))
             elif cmd == "volume":
                 new_vol = int(args[2])
-                asyncio.create_task(
+                utils.create_task(self.hash,
                     self.device.dlna_dmrdevice.async_set_volume_level(new_vol/100))
             elif cmd == "mute":
                 onoff = args[2]
@@ -180,16 +184,14 @@ class dlna_dmr:
         # get_volume = service.action('GetVolume')
         # await get_volume.async_call(InstanceID=0, Channel='Master')
 
-        while True:
-            try:
-                await self.device.async_update()
-                if self.device.available:
-                    await self.updateReadings()
-                else:
-                    await fhem.readingsSingleUpdate(self.hash, "state", "offline", 1)
-            except:
-                self.logger.exception("Failed to update")
-            await asyncio.sleep(30)
+        try:
+            await self.device.async_update()
+            if self.device.available:
+                await self.updateReadings()
+            else:
+                await fhem.readingsSingleUpdate(self.hash, "state", "offline", 1)
+        except:
+            self.logger.exception("Failed to update")
 
     async def updateReadings(self):
         await fhem.readingsBeginUpdate(self.hash)
@@ -277,7 +279,7 @@ class DlnaDmrDevice:
         """State variable(s) changed, update readings."""
         self.logger.debug("event received")
         # create event as it is not async
-        asyncio.create_task(self.dlna_dmrinstance.updateReadings())
+        utils.create_task(self.dlna_dmrinstance.hash, self.dlna_dmrinstance.updateReadings())
 
     @property
     def dlna_dmrdevice(self):
@@ -9,6 +9,8 @@ import re
 
 from bluepy import btle
 
+from .. import utils
+
 DEFAULT_TIMEOUT = 1
 
 _LOGGER = logging.getLogger("eq3bt")
@@ -27,6 +29,8 @@ class BTLEConnection(btle.DefaultDelegate):
         self._mac = mac
         self._callbacks = {}
         self._keep_connected = keep_connected
+        # avoid cycling through all ifaces on each request of an unreachable device
+        self.breaker = utils.CircuitBreaker(mac, failure_threshold=1, base_delay=30, max_delay=1800)
     
     def set_keep_connected(self, new_state):
         self._keep_connected = new_state
@@ -70,29 +74,40 @@ class BTLEConnection(btle.DefaultDelegate):
             self._conn = None
 
         if self._conn is None or conn_state != "conn":
-            self._conn = btle.Peripheral()
-            self._conn.withDelegate(self)
-            self._nr_conn_errors = 0
-            _LOGGER.debug("Trying to connect to %s", self._mac)
-            while True:
-                # try to connect with all ifaces
-                try:
-                    self._conn.connect(self._mac, iface=self._ifaces[self._iface_idx])
-                    break
-                except btle.BTLEException as ex:
-                    _LOGGER.debug("Unable to connect to the device %s using iface %s, retrying: %s", self._mac, self._ifaces[self._iface_idx], ex)
-                    try:
-                        self._conn.connect(self._mac, iface=self._ifaces[self._iface_idx])
-                        break
-                    except Exception as ex2:
-                        _LOGGER.debug("Second connection try to %s using ifaces %s failed: %s", self._mac, self._ifaces[self._iface_idx], ex2)
-                        if self.next_iface() is False:
-                            # tried all ifaces, raise exception
-                            raise
+            if not self.breaker.allow():
+                raise btle.BTLEDisconnectError(f"Device {self._mac} unreachable, retry in {self.breaker.retry_in():.0f}s")
+            try:
+                self._connect()
+            except Exception:
+                # also without hci interface, otherwise the breaker stays half-open
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
 
         _LOGGER.debug("Connected to %s", self._mac)
         return self
 
+    def _connect(self):
+        self._conn = btle.Peripheral()
+        self._conn.withDelegate(self)
+        self._nr_conn_errors = 0
+        _LOGGER.debug("Trying to connect to %s", self._mac)
+        while True:
+            # try to connect with all ifaces
+            try:
+                self._conn.connect(self._mac, iface=self._ifaces[self._iface_idx])
+                break
+            except btle.BTLEException as ex:
+                _LOGGER.debug("Unable to connect to the device %s using iface %s, retrying: %s", self._mac, self._ifaces[self._iface_idx], ex)
+                try:
+                    self._conn.connect(self._mac, iface=self._ifaces[self._iface_idx])
+                    break
+                except Exception as ex2:
+                    _LOGGER.debug("Second connection try to %s using ifaces %s failed: %s", self._mac, self._ifaces[self._iface_idx], ex2)
+                    if self.next_iface() is False:
+                        # tried all ifaces, raise exception
+                        raise
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self._conn and self._keep_connected is False:
             self._conn.disconnect()
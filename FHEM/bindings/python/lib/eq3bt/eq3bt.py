@@ -142,6 +142,7 @@ class eq3bt:
                 await self.update_all()
             except:
                 self.logger.error(f"Failed to update, retry in {waittime}s")
+            await self.thermostat.breaker.update_readings(self.hash)
             await asyncio.sleep(waittime)
 
     # FHEM FUNCTION
@@ -272,6 +273,10 @@ class FhemThermostat(eq3.Thermostat):
     
     def set_keep_connection(self, new_state):
         self.set_keep_connected(new_state)
+
+    @property
+    def breaker(self):
+        return self._conn.breaker
     
     def update_all(self):
         super().update()
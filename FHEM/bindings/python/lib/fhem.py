@@ -1,5 +1,8 @@
 
+import re
 import json
+import time
+import array
 import random
 import asyncio
 import logging
@@ -7,11 +10,20 @@ import traceback
 import concurrent.futures
 import websockets
 
+from . import stats
+from . import tracing
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
 function_active = []
 update_locks = {}
+reading_throttles = {}
+# device name -> {reading: (value, do_trigger, if_changed)} of throttled values due to be written
+throttle_flushes = {}
+# device name -> throttles which got a value in the running readingsBeginUpdate,
+# they get the do_trigger of readingsEndUpdate
+bulk_throttles = {}
 wsconnection = None
 
 # TODO use run_coroutine_threadsafe if asyncio.get_event_loop() == None
@@ -29,6 +41,189 @@ def setFunctionInactive(hash):
     if element != hash["NAME"]:
         logger.error(f"Set wrong function inactive, tried {hash['NAME']}, current function_active: {function_active},{element}")
 
+# reading throttles are configured via attribute readingThrottle, e.g.
+# attr dev readingThrottle load_power:avg:10 position:every:5 count:delta:1
+#   every:N - send last value at most every N seconds
+#   min:N, max:N, avg:N - send aggregated value of an N seconds window
+#   delta:X - send only if value differs by at least X from last sent value
+# held back values are written when their window ends, independent of the update
+# which produced them, with the do_trigger and IfChanged mode of the last held back
+# update: all values of a device due in the same loop iteration are written as one
+# bulk update per do_trigger (see flushThrottled)
+THROTTLE_MODES = ["every", "min", "max", "avg", "delta"]
+
+class ReadingThrottle:
+
+    def __init__(self, hash, mode, param):
+        self.hash = hash
+        self.mode = mode
+        self.param = param
+        # values of the current window, array avoids a float object per value
+        self.buffer = array.array('d')
+        self.pending = None
+        self.last_sent = None
+        self.window_start = 0
+        self.timer = None
+        # of the last update, None until readingsEndUpdate of a bulk update
+        self.do_trigger = 1
+        self.if_changed = False
+
+    def cancel(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+    def process(self, reading, value):
+        """Returns the value to send now or None if it is held back"""
+        if self.mode == "every":
+            now = time.time()
+            if now - self.window_start >= self.param:
+                self.window_start = now
+                self.pending = None
+                return value
+            self.pending = value
+            self.start_timer(reading, self.window_start + self.param - now)
+            return None
+
+        try:
+            num_value = float(value)
+        except ValueError:
+            # non numeric values can't be aggregated
+            return value
+
+        if self.mode == "delta":
+            if self.last_sent is not None and abs(num_value - self.last_sent) < self.param:
+                return None
+            self.last_sent = num_value
+            return value
+
+        self.buffer.append(num_value)
+        self.start_timer(reading, self.param)
+        return None
+
+    def start_timer(self, reading, delay):
+        if self.timer is None:
+            self.timer = tracing.detached(asyncio.get_event_loop().call_later,
+                delay, self.flush, reading)
+
+    def aggregate(self):
+        if self.mode == "every":
+            return self.pending
+        if len(self.buffer) == 0:
+            return None
+        if self.mode == "min":
+            value = min(self.buffer)
+        elif self.mode == "max":
+            value = max(self.buffer)
+        else:
+            value = round(sum(self.buffer) / len(self.buffer), 3)
+        del self.buffer[:]
+        return value
+
+    def flush(self, reading):
+        self.timer = None
+        value = self.aggregate()
+        if value is None:
+            return
+        if self.mode == "every":
+            self.window_start = time.time()
+            self.pending = None
+        name = self.hash["NAME"]
+        if name not in throttle_flushes:
+            throttle_flushes[name] = {}
+            asyncio.get_event_loop().call_soon(flushThrottled, self.hash)
+        do_trigger = 1 if self.do_trigger is None else self.do_trigger
+        throttle_flushes[name][reading] = (convertValue(value), do_trigger, self.if_changed)
+
+def flushThrottled(hash):
+    values = throttle_flushes.pop(hash["NAME"], None)
+    if not values:
+        return
+    for do_trigger in sorted(set(v[1] for v in values.values())):
+        asyncio.create_task(_readingsBulkUpdateValues(hash,
+            {reading: v for reading, v in values.items() if v[1] == do_trigger}, do_trigger))
+
+def parseReadingThrottle(spec):
+    throttles = []
+    for throttle_def in spec.split():
+        parts = throttle_def.split(":")
+        if len(parts) != 3 or parts[1] not in THROTTLE_MODES:
+            raise ValueError(f"Invalid throttle definition {throttle_def}, use <reading>:<{'|'.join(THROTTLE_MODES)}>:<value>")
+        try:
+            param = float(parts[2])
+            regex = re.compile(parts[0])
+        except (ValueError, re.error) as e:
+            raise ValueError(f"Invalid throttle definition {throttle_def}: {e}")
+        throttles.append((regex, parts[1], param))
+    return throttles
+
+def setReadingThrottle(hash, spec):
+    """Set throttles of a device, returns an error message or empty string"""
+    try:
+        throttle_defs = parseReadingThrottle(spec)
+    except ValueError as e:
+        return str(e)
+
+    removeReadingThrottle(hash["NAME"])
+    if len(throttle_defs) > 0:
+        reading_throttles[hash["NAME"]] = {
+            "hash": hash,
+            "defs": throttle_defs,
+            "readings": {}
+        }
+    return ""
+
+def removeReadingThrottle(name):
+    if name in reading_throttles:
+        for throttle in reading_throttles[name]["readings"].values():
+            if throttle:
+                throttle.cancel()
+        del reading_throttles[name]
+    throttle_flushes.pop(name, None)
+    bulk_throttles.pop(name, None)
+
+def renameDevice(old_name, new_name):
+    if old_name in update_locks:
+        update_locks[new_name] = update_locks.pop(old_name)
+    if old_name in reading_throttles:
+        dev_throttles = reading_throttles.pop(old_name)
+        for throttle in dev_throttles["readings"].values():
+            if throttle:
+                throttle.cancel()
+        dev_throttles["hash"] = dict(dev_throttles["hash"], NAME=new_name)
+        dev_throttles["readings"] = {}
+        reading_throttles[new_name] = dev_throttles
+    throttle_flushes.pop(old_name, None)
+    bulk_throttles.pop(old_name, None)
+
+def removeDevice(name):
+    removeReadingThrottle(name)
+    if name in update_locks and not update_locks[name].locked():
+        del update_locks[name]
+
+def throttleReading(hash, reading, value, do_trigger=None, if_changed=False):
+    """Returns None if the reading update is held back by a throttle,
+    do_trigger None for bulk updates"""
+    dev_throttles = reading_throttles.get(hash["NAME"])
+    if dev_throttles is None:
+        return value
+    readings = dev_throttles["readings"]
+    if reading not in readings:
+        # None is cached as well for readings without throttle
+        readings[reading] = None
+        for regex, mode, param in dev_throttles["defs"]:
+            if regex.fullmatch(reading):
+                readings[reading] = ReadingThrottle(dev_throttles["hash"], mode, param)
+                break
+    throttle = readings[reading]
+    if throttle is None:
+        return value
+    throttle.do_trigger = do_trigger
+    throttle.if_changed = if_changed
+    if do_trigger is None:
+        bulk_throttles.setdefault(hash["NAME"], set()).add(throttle)
+    return throttle.process(reading, value)
+
 async def getUniqueId(hash):
     cmd = "getUniqueId()"
     return await sendCommandHash(hash, cmd)
@@ -61,13 +256,17 @@ async def readingsBeginUpdate(hash):
     return await sendCommandHash(hash, cmd)
 
 async def readingsBulkUpdateIfChanged(hash, reading, value):
-    value = convertValue(value)
+    value = throttleReading(hash, reading, convertValue(value), if_changed=True)
+    if value is None:
+        return ""
     cmd = "readingsBulkUpdateIfChanged($defs{'" + hash["NAME"] + "'},'" + \
         reading + "','" + value.replace("'", "\\'") + "');;"
     return await sendCommandHash(hash, cmd)
 
 async def readingsBulkUpdate(hash, reading, value, changed=None):
-    value = convertValue(value)
+    value = throttleReading(hash, reading, convertValue(value))
+    if value is None:
+        return ""
     if changed is None:
         cmd = "readingsBulkUpdate($defs{'" + hash["NAME"] + "'},'" + \
             reading + "','" + value.replace("'", "\\'") + "');;"
@@ -77,27 +276,48 @@ async def readingsBulkUpdate(hash, reading, value, changed=None):
     return await sendCommandHash(hash, cmd)
 
 async def readingsEndUpdate(hash, do_trigger):
+    for throttle in bulk_throttles.pop(hash["NAME"], ()):
+        throttle.do_trigger = do_trigger
     cmd = "readingsEndUpdate($defs{'" + hash["NAME"] + "'}," + str(do_trigger) + ");;"
     res = await sendCommandHash(hash,cmd)
     update_locks[hash["NAME"]].release()
     return res
 
 async def readingsSingleUpdate(hash, reading, value, do_trigger):
+    value = throttleReading(hash, reading, convertValue(value), do_trigger)
+    if value is None:
+        return ""
+    return await _readingsSingleUpdate(hash, reading, value, do_trigger)
+
+async def _readingsSingleUpdate(hash, reading, value, do_trigger):
     if hash["NAME"] not in update_locks:
         update_locks[hash["NAME"]] = asyncio.Lock()
     async with update_locks[hash["NAME"]]:
-        value = convertValue(value)
         cmd = "readingsSingleUpdate($defs{'" + hash["NAME"] + "'},'" + \
             reading + "','" + value.replace("'", "\\'") + "'," + str(do_trigger) + ")"
         return await sendCommandHash(hash, cmd)
 
+async def _readingsBulkUpdateValues(hash, values, do_trigger):
+    # {reading: (converted value, do_trigger, if_changed)}, written without throttle in one begin/end update
+    if hash["NAME"] not in update_locks:
+        update_locks[hash["NAME"]] = asyncio.Lock()
+    async with update_locks[hash["NAME"]]:
+        cmd = "readingsBeginUpdate($defs{'" + hash["NAME"] + "'});;"
+        for reading, (value, _, if_changed) in values.items():
+            cmd += ("readingsBulkUpdateIfChanged" if if_changed else "readingsBulkUpdate") + \
+                "($defs{'" + hash["NAME"] + "'},'" + reading + "','" + value.replace("'", "\\'") + "');;"
+        cmd += "readingsEndUpdate($defs{'" + hash["NAME"] + "'}," + str(do_trigger) + ");;"
+        return await sendCommandHash(hash, cmd, "readingThrottleFlush")
+
 async def readingsSingleUpdateIfChanged(hash, reading, value, do_trigger):
-    value = convertValue(value)
+    value = throttleReading(hash, reading, convertValue(value), do_trigger, True)
+    if value is None:
+        return ""
     cmd = "readingsBeginUpdate($defs{'" + hash["NAME"] + "'});;readingsBulkUpdateIfChanged($defs{'" + hash["NAME"] + "'},'" + \
         reading + "','" + value.replace("'", "\\'") + \
         "');;readingsEndUpdate($defs{'" + \
         hash["NAME"] + "'}," + str(do_trigger) + ");;"
-    return await sendCommandHash(hash, cmd)
+    return await sendCommandHash(hash, cmd, "readingsSingleUpdateIfChanged")
 
 async def CommandDefine(hash, definition):
     cmd = "CommandDefine(undef, \"" + definition + "\")"
@@ -116,7 +336,7 @@ async def checkIfDeviceExists(hash, typeinternal, typevalue, internal, value):
         "  return 1 if(defined($main::defs{$fhem_dev}{" + typeinternal + "}) && $main::defs{$fhem_dev}{" + typeinternal + "} eq '" + typevalue + "' && $main::defs{$fhem_dev}{" + internal + "} eq '" + value + "');;" + \
         "}" + \
         "return 0;;"
-    return await sendCommandHash(hash, cmd)
+    return await sendCommandHash(hash, cmd, "checkIfDeviceExists")
 
 # UTILS FUNCTIONS TO SEND COMMAND TO FHEM
 def convertValue(value):
@@ -138,6 +358,9 @@ async def send_and_wait(name, cmd):
         "msgtype": "command",
         "command": cmd
     }
+    trace_id = tracing.trace_id()
+    if trace_id is not None:
+        msg["traceId"] = trace_id
 
     def listener(rmsg):
         try:
@@ -161,30 +384,52 @@ async def send_and_wait(name, cmd):
     return await fut
 
 
-async def sendCommandName(name, cmd, hash=None):
+async def sendCommandName(name, cmd, hash=None, stat_name=None):
     ret = ""
-    try:
-        logger.debug("sendCommandName START")
-        while len(function_active) != 0:
-            if function_active[-1] == name:
-                break
-            await asyncio.sleep(0.001)
-        # wait max 1s for reply from FHEM
-        jsonmsg = await asyncio.wait_for(send_and_wait(name, cmd), 15)
-        logger.debug("sendCommandName END")
-        ret = json.loads(jsonmsg)['result']
-    except asyncio.TimeoutError:
-        logger.error("Timeout - NO RESPONSE for command: " + cmd)
-        ret = ""
-    except concurrent.futures.CancelledError:
-        # function timeout
-        pass
-    except Exception as e:
-        logger.error("Exception while waiting for reply: " + e)
-        traceback.format_exc()
-        ret = str(e)
+    stat_name = stat_name or stats.command_name(cmd)
+    stat = stats.command_stat(stat_name)
+    start = stat.start()
+    error = False
+    timeout = False
+    with tracing.span("command:" + stat_name) as span:
+        try:
+            logger.debug("sendCommandName START")
+            wait_start = time.time()
+            while len(function_active) != 0:
+                if function_active[-1] == name:
+                    break
+                await asyncio.sleep(0.001)
+            if span is not None and time.time() - wait_start > 0.001:
+                span.child("wait_function_active", wait_start, time.time())
+            # wait max 1s for reply from FHEM
+            jsonmsg = await asyncio.wait_for(send_and_wait(name, cmd), 15)
+            logger.debug("sendCommandName END")
+            reply = json.loads(jsonmsg)
+            error = reply.get('error', 0) == 1
+            if span is not None and "evaltime" in reply:
+                # FHEM reports only the duration, assume it ended right before the reply
+                end = time.time()
+                span.child("perl_eval", end - reply["evaltime"], end)
+            ret = reply['result']
+        except asyncio.TimeoutError:
+            logger.error("Timeout - NO RESPONSE for command: " + cmd)
+            timeout = True
+            ret = ""
+        except concurrent.futures.CancelledError:
+            # function timeout
+            timeout = True
+        except Exception as e:
+            logger.error("Exception while waiting for reply: " + e)
+            traceback.format_exc()
+            error = True
+            ret = str(e)
+        finally:
+            stat.stop(start, error, timeout)
+            if span is not None:
+                span.args["error"] = error
+                span.args["timeout"] = timeout
     
     return ret
 
-async def sendCommandHash(hash, cmd):
-    return await sendCommandName(hash["NAME"], cmd, hash)
+async def sendCommandHash(hash, cmd, stat_name=None):
+    return await sendCommandName(hash["NAME"], cmd, hash, stat_name)
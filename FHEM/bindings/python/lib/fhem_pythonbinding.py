@@ -1,17 +1,26 @@
 
 import asyncio
+import argparse
+import faulthandler
 import websockets
 import json
 import traceback
 import logging
-import concurrent.futures
-import functools
-import site
 import sys
-import importlib
+import os
+import signal
 import time
 from . import fhem
+from . import utils
+from . import stats
+from . import tracing
+from . import loop_watchdog
+from . import profiler
+from . import memory
+from . import module_loader
 from . import pkg_installer
+from . import workers
+from . import snapshots
 
 logging.basicConfig(format='%(asctime)s - %(levelname)-8s - %(name)s: %(message)s', level=logging.INFO)
 
@@ -19,32 +28,188 @@ logger = logging.getLogger(__name__)
 
 loadedModuleInstances = {}
 moduleLoadingRunning = {}
+# NAME: last function message of the device, it has the define arguments for a reload
+moduleDefinitions = {}
 wsconnection = None
 
-pip_lock = asyncio.Lock()
-
 connection_start = 0
 fct_timeout = 60
+shutdown_running = False
 
 def getFhemPyDeviceByName(name):
     if name in loadedModuleInstances:
         return loadedModuleInstances[name]
     return None
 
+def releaseDevice(name, instance=None):
+    # cancel everything which belongs to the device instance
+    fhem.removeDevice(name)
+    utils.cancel_scheduled(name)
+    utils.tasks.cancel_owner(name, instance)
+
+def renameDevice(instance, old_name, new_name):
+    fhem.renameDevice(old_name, new_name)
+    utils.scheduler.rename_owner(old_name, new_name)
+    utils.tasks.rename_owner(old_name, new_name)
+    # modules keep the hash from Define
+    if isinstance(getattr(instance, "hash", None), dict):
+        instance.hash["NAME"] = new_name
+
+class BindingDevice:
+    # Get/Set of the BindingsIo device itself, e.g. get pyBinding stats
+
+    async def call(self, hash):
+        func = getattr(self, hash["function"], None)
+        if func is None:
+            return ""
+        return await func(hash, hash["args"], hash["argsh"])
+
+    async def Get(self, hash, args, argsh):
+        get_list_conf = {
+            "stats": { "function": "get_stats" },
+            "traces": { "function": "get_traces" },
+            "blocking": { "function": "get_blocking" },
+            "memory": { "function": "get_memory" },
+            "imports": { "function": "get_imports" },
+            "loading": { "function": "get_loading" },
+            "workers": { "function": "get_workers" },
+            "memoryDiff": { "function": "get_memoryDiff" },
+            "leakedTasks": { "function": "get_leakedTasks" },
+            "trace": { "args": ["traceId"], "params": { "traceId": {} }, "function": "get_trace" }
+        }
+        return await utils.handle_set(get_list_conf, self, hash, args, argsh)
+
+    async def Set(self, hash, args, argsh):
+        set_list_conf = {
+            "statsReset": {},
+            "tracing": { "args": ["onoff"], "params": { "onoff": {} }, "options": "on,off" },
+            "traceExport": {},
+            "profile": { "args": ["target", "seconds"], "params": { "target": {}, "seconds": { "default": "30" }}},
+            "reload": { "args": ["pythontype"], "params": { "pythontype": {} }},
+            "memoryTracking": { "args": ["onoff"], "params": { "onoff": {} }, "options": "on,off" },
+            "memorySnapshot": {}
+        }
+        return await utils.handle_set(set_list_conf, self, hash, args, argsh)
+
+    async def get_stats(self, hash, params):
+        return stats.format_table()
+
+    async def set_statsReset(self, hash):
+        stats.reset()
+        return ""
+
+    async def get_blocking(self, hash, params):
+        return loop_watchdog.format_stalls()
+
+    async def get_imports(self, hash, params):
+        lines = ["Startup: " + stats.format_startup(), "",
+            "{:<30} {:>10} {:>10}".format("module", "seconds", "modules")]
+        for pythontype, (seconds, modules) in sorted(stats.import_times.items(), key=lambda x: -x[1][0]):
+            lines.append("{:<30} {:>10.3f} {:>10}".format(pythontype, seconds, modules))
+        return "\n".join(lines)
+
+    async def get_loading(self, hash, params):
+        return module_loader.loader.format_progress()
+
+    async def get_workers(self, hash, params):
+        if workers.supervisor is None:
+            return "All devices run in this process, start pythonbinding.py with --workers N or --isolate TYPE to use worker processes"
+        return workers.supervisor.format_table()
+
+    async def get_leakedTasks(self, hash, params):
+        res = utils.tasks.format_leaked()
+        if workers.supervisor is not None:
+            res += "\nTasks leaked in worker processes are only logged by the worker"
+        return res
+
+    async def get_memory(self, hash, params):
+        return memory.format_totals()
+
+    async def get_memoryDiff(self, hash, params):
+        return memory.format_diff()
+
+    async def get_traces(self, hash, params):
+        return tracing.format_list()
+
+    async def get_trace(self, hash, params):
+        trace = tracing.find(params["traceId"])
+        if trace is None:
+            return "Trace " + params["traceId"] + " not found"
+        return json.dumps(trace.to_dict(), indent=2)
+
+    async def set_tracing(self, hash, params):
+        tracing.enabled = params["onoff"] == "on"
+        return ""
+
+    async def set_traceExport(self, hash):
+        return "Trace written to " + tracing.export()
+
+    async def set_memoryTracking(self, hash, params):
+        if params["onoff"] == "on":
+            memory.start(hash["NAME"])
+        else:
+            memory.stop()
+        return ""
+
+    async def set_memorySnapshot(self, hash):
+        return memory.save_baseline()
+
+    async def set_profile(self, hash, params):
+        return profiler.start(hash, params["target"], params["seconds"], loadedModuleInstances)
+
+    async def set_reload(self, hash, params):
+        pythontype = params["pythontype"]
+        supervisor = workers.supervisor
+        if not ("lib." + pythontype in sys.modules
+                or (supervisor is not None and pythontype in supervisor.types.values())):
+            return pythontype + " isn't loaded"
+        if supervisor is not None:
+            # every worker reloads its own devices of this type
+            supervisor.call_workers(hash)
+        # FHEM doesn't wait for the reload, the result is shown in reading reload_state
+        asyncio.create_task(fhem.wsconnection.reloadModuleType(hash, pythontype))
+        return ""
+
+bindingDevice = BindingDevice()
+
 async def pybinding(websocket, path):
     global connection_start
     connection_start = time.time()
-    logger.info("FHEM connection started: " + websocket.remote_address[0])
-    pb = PyBinding(websocket)
+    stats.count_connection()
+    stats.mark_startup("connected")
+    # peername is empty for unix domain sockets
+    peer = websocket.remote_address[0] if websocket.remote_address else "unix socket"
+    logger.info("FHEM connection started: " + peer)
+    supervisor = workers.supervisor
+    if supervisor is not None:
+        supervisor.attach(websocket)
+        # messages of this process are sent by the supervisor, in order with those of the workers
+        pb = PyBinding(supervisor.connection)
+    else:
+        pb = PyBinding(websocket)
     fhem.updateConnection(pb)
     try:
         async for message in websocket:
-            asyncio.create_task(pb.onMessage(message))
+            # module functions run in the worker processes, only BindingsIo functions here
+            if supervisor is None or not supervisor.route(message):
+                asyncio.create_task(pb.onMessage(message, time.time()))
     except websockets.exceptions.ConnectionClosedError:
         logger.error("Connection closed error", exc_info=True)
         logger.info("Restart binding")
         sys.exit(1)
 
+async def pipebinding(reader, connection):
+    # worker process, the supervisor forwards the messages of FHEM line by line
+    global connection_start
+    connection_start = time.time()
+    pb = PyBinding(connection)
+    fhem.updateConnection(pb)
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        asyncio.create_task(pb.onMessage(line.decode("utf-8"), time.time()))
+
 class PyBinding:
 
     msg_listeners = []
@@ -56,37 +221,140 @@ class PyBinding:
         self.msg_listeners.append({"func": listener, "awaitId": awaitid})
 
     async def send(self, msg):
+        stats.count_message("out", "command")
         await self.wsconnection.send(msg.encode("utf-8"))
 
     async def sendBackReturn(self, hash, ret):
         retHash = hash.copy()
+        retHash.pop('sent', None)
+        retHash.pop('async', None)
         retHash['finished'] = 1
         retHash['returnval'] = ret
         retHash['id'] = hash['id']
+        if hash.get('PYTHONTYPE'):
+            # live tasks and scheduled jobs of the device
+            retHash['PYTASKS'] = utils.tasks.count(hash['NAME']) + utils.scheduler.job_count(hash['NAME'])
+        else:
+            retHash.pop('PYTHONTYPE', None)
         msg = json.dumps(retHash)
         logger.debug("<<< WS: " + msg, ensure_ascii=False)
+        stats.count_message("out", "function")
         await self.wsconnection.send(msg.encode("utf-8"))
-        fhem.setFunctionInactive(hash)        
+        tracing.mark_reply()
+        if not hash.get('async'):
+            fhem.setFunctionInactive(hash)        
 
     async def sendBackError(self, hash, error):
         logger.error(error + "(id: {})".format(hash['id']))
         retHash = hash.copy()
+        retHash.pop('sent', None)
+        retHash.pop('async', None)
         retHash['finished'] = 1
         retHash['error'] = error
         retHash['id'] = hash['id']
         msg = json.dumps(retHash, ensure_ascii=False)
         logger.debug("<<< WS: " + msg)
+        stats.count_message("out", "error")
         await self.wsconnection.send(msg.encode("utf-8"))
-        fhem.setFunctionInactive(hash)
+        tracing.mark_reply()
+        if not hash.get('async'):
+            fhem.setFunctionInactive(hash)
 
     async def updateHash(self, hash):
         retHash = hash.copy()
+        retHash.pop('sent', None)
+        retHash.pop('async', None)
         retHash['msgtype'] = "update_hash"
         del retHash['id']
         msg = json.dumps(retHash, ensure_ascii=False)
         logger.debug("<<< WS: " + msg)
+        stats.count_message("out", "update_hash")
         await self.wsconnection.send(msg.encode("utf-8"))
 
+    async def replayQueue(self, queue):
+        # functions received while the device was loading, in order
+        for queued in queue:
+            await self.onMessage(queued, replay=True)
+
+    def markFirstDefine(self):
+        if "first_define" not in stats.startup:
+            stats.mark_startup("first_define")
+            logger.info("Startup: " + stats.format_startup())
+
+    async def createInstance(self, hash):
+        # dependency check and import, shared by all devices of this type
+        with tracing.span("module_load", module=hash["PYTHONTYPE"]):
+            module_object = await module_loader.loader.load(hash)
+        # create instance of class with logger
+        target_class = getattr(module_object, hash["PYTHONTYPE"])
+        moduleLogger = logging.getLogger(hash["NAME"])
+        moduleLogger.setLevel(self.getLogLevel(await fhem.AttrVal(hash["NAME"], "verbose", "3")))
+        fhem.setReadingThrottle(hash, await fhem.AttrVal(hash["NAME"], "readingThrottle", ""))
+        instance = target_class(moduleLogger)
+        loadedModuleInstances[hash["NAME"]] = instance
+        # cached state of the last run, Define can start with it and refresh in the background
+        await snapshots.restore(instance, hash)
+        return instance
+
+    async def reloadModuleType(self, bindinghash, pythontype):
+        start = time.time()
+        affected = module_loader.reload_order(pythontype)
+        names = sorted(name for name, hash in moduleDefinitions.items()
+            if hash["PYTHONTYPE"] in affected and name in loadedModuleInstances)
+        if len(names) == 0 and "lib." + pythontype not in sys.modules:
+            return
+        logger.info(f"Reload {', '.join(affected)}, devices: {', '.join(names) or 'none'}")
+
+        # Set/Attr received meanwhile run after the new Define
+        for name in names:
+            moduleLoadingRunning[name] = []
+        for name in names:
+            instance = loadedModuleInstances.pop(name)
+            # the new instance continues with the state of the old one
+            snapshots.keep(name, await snapshots.take(name, instance, moduleDefinitions[name]))
+            func = getattr(instance, "Undefine", None)
+            if func is not None:
+                try:
+                    await asyncio.wait_for(func(moduleDefinitions[name]), fct_timeout)
+                except Exception:
+                    logger.exception(f"Undefine of {name} failed during reload")
+            releaseDevice(name, instance)
+        try:
+            module_loader.loader.unload(affected)
+        except RuntimeError as e:
+            logger.error(f"Reload of {pythontype} failed: {e}")
+
+        failed = []
+        # dependencies first, e.g. discover_upnp before dlna_dmr
+        for name in sorted(names, key=lambda n: affected.index(moduleDefinitions[n]["PYTHONTYPE"])):
+            hash = dict(moduleDefinitions[name], function="Define",
+                args=moduleDefinitions[name]['defargs'], argsh=moduleDefinitions[name]['defargsh'])
+            moduleDefinitions[name] = hash
+            try:
+                instance = await self.createInstance(hash)
+                with tracing.span("module:Define"):
+                    await asyncio.wait_for(instance.Define(hash, hash['defargs'], hash['defargsh']), fct_timeout)
+            except Exception:
+                logger.exception(f"Define of {name} failed during reload")
+                failed.append(name)
+                loadedModuleInstances.pop(name, None)
+                self.dropQueue(hash, moduleLoadingRunning.pop(name, None))
+                await fhem.readingsSingleUpdate(hash, "state", "Reload failed: " + traceback.format_exc(), 1)
+                continue
+            queue = moduleLoadingRunning.pop(name, [])
+            if len(queue):
+                asyncio.create_task(self.replayQueue(queue))
+
+        state = f"{', '.join(affected)}: {len(names) - len(failed)} devices reloaded in {time.time() - start:.2f}s"
+        if len(failed):
+            state += ", failed: " + ", ".join(failed)
+        logger.info(state)
+        await fhem.readingsSingleUpdate(bindinghash, "reload_state", state, 1)
+
+    def dropQueue(self, hash, queue):
+        for queued in queue or []:
+            logger.warning(f"{hash['NAME']} isn't defined, dropped function: {queued}")
+
     def getLogLevel(self, verbose_level):
         if verbose_level == "5":
             return logging.DEBUG
@@ -97,13 +365,13 @@ class PyBinding:
         else:
             return logging.ERROR
 
-    async def onMessage(self, payload):
+    async def onMessage(self, payload, received=None, replay=False):
         try:
-            await self._onMessage(payload)
+            await self._onMessage(payload, received or time.time(), replay)
         except:
             logger.exception("Failed to handle message: " + str(payload))
 
-    async def _onMessage(self, payload):
+    async def _onMessage(self, payload, received, replay=False):
         msg = payload
         logger.debug(">>> WS: " + msg)
         hash = None
@@ -112,11 +380,14 @@ class PyBinding:
         except:
             logger.error("Websocket JSON couldn't be decoded")
             return
+        stats.count_message("in", "reply" if "awaitId" in hash else hash.get("msgtype"))
 
         global fct_timeout, connection_start
         if time.time() - connection_start > 120:
             fct_timeout = 5
 
+        timer = None
+        trace = None
         try:
             if ("awaitId" in hash and len(self.msg_listeners) > 0):
                 removeElement = None
@@ -129,74 +400,83 @@ class PyBinding:
             else:
                 ret = ''
                 if (hash['msgtype'] == "function"):
-                    # this is needed to avoid 2 replies on dep installation
-                    fhem_reply_done = False
-                    fhem.setFunctionActive(hash)
+                    # this is needed to avoid 2 replies on dep installation,
+                    # replayed functions were answered while the device was loading
+                    fhem_reply_done = replay
+                    replay_queue = []
+                    timer = stats.FunctionTimer(hash)
+                    if hash.get("PYTHONTYPE"):
+                        trace = tracing.start_trace(hash, received)
+                    if not replay and not hash.get("async"):
+                        # FHEM waits for the reply and handles only commands of this device meanwhile,
+                        # async calls are completed later in BindingsIo_Read and don't block FHEM
+                        fhem.setFunctionActive(hash)
+                    if not hash.get("PYTHONTYPE"):
+                        # function of the BindingsIo device
+                        try:
+                            ret = await bindingDevice.call(hash)
+                        except Exception:
+                            timer.error = True
+                            await self.sendBackError(hash, "Failed to execute function " + hash["function"] + ": " + traceback.format_exc())
+                            return 0
+                        await self.sendBackReturn(hash, ret)
+                        return 0
                     # load module
                     nmInstance = None
+                    moduleDefinitions[hash["NAME"]] = hash
                     if hash['function'] == "Rename":
-                        if hash['NAME'] in loadedModuleInstances:
-                            loadedModuleInstances[hash['args'][1]] = loadedModuleInstances[hash['args'][0]]
-                            del loadedModuleInstances[hash['args'][0]]
-                            self.sendBackReturn(hash, "")
-                            return 0
+                        # RenameFn is called with (new, old), hash has already the new name
+                        new_name = hash['NAME']
+                        old_name = hash['args'][1] if hash['args'][0] == new_name else hash['args'][0]
+                        if old_name in loadedModuleInstances:
+                            instance = loadedModuleInstances.pop(old_name)
+                            moduleDefinitions.pop(old_name, None)
+                            try:
+                                loadedModuleInstances[new_name] = instance
+                                renameDevice(instance, old_name, new_name)
+                                snapshots.rename(old_name, new_name)
+                                await self.sendBackReturn(hash, "")
+                                return 0
+                            except Exception:
+                                # instance is lost, define it again with the new name
+                                logger.exception(f"Failed to rename {old_name} to {new_name}")
+                                loadedModuleInstances.pop(new_name, None)
+                                releaseDevice(old_name, instance)
+                                releaseDevice(new_name)
+
+                    if hash['function'] == "Undefine" and hash["NAME"] in moduleLoadingRunning:
+                        # release the device after its Define finished
+                        moduleLoadingRunning[hash["NAME"]].append(payload)
+                        await self.sendBackReturn(hash, "")
+                        return 0
 
                     if (hash['function'] != "Undefine"):
                         # Load module and execute Define if Define isn't called right now
                         if (not (hash["NAME"] in loadedModuleInstances)):
                             if hash["NAME"] in moduleLoadingRunning:
+                                if hash["function"] in ("Set", "Attr"):
+                                    # FHEM can't wait for the import, run it as soon as the device is defined
+                                    moduleLoadingRunning[hash["NAME"]].append(payload)
                                 await self.sendBackReturn(hash, "")
                                 return 0
 
-                            moduleLoadingRunning[hash["NAME"]] = True
+                            moduleLoadingRunning[hash["NAME"]] = []
 
                             # loading a module might take some time, therefore sendBackReturn now
                             await self.sendBackReturn(hash, "")
                             fhem_reply_done = True
 
                             try:
-                                # check dependencies
-                                deps_ok = pkg_installer.check_dependencies(hash["PYTHONTYPE"])
-                                if deps_ok == False:
-                                    # readingsSingleUpdate inform about dep installation
-                                    await fhem.readingsSingleUpdate(hash, "state", "Installing updates...", 1)
-                                    # run only one installation and do depcheck before any other installation
-                                    async with pip_lock:
-                                        # make sure that all import caches are up2date before check
-                                        importlib.invalidate_caches()
-                                        # check again if something changed for dependencies
-                                        deps_ok = pkg_installer.check_dependencies(hash["PYTHONTYPE"])
-                                        if deps_ok == False:
-                                            # start installation in a separate asyncio thread
-                                            with concurrent.futures.ThreadPoolExecutor() as pool:
-                                                await asyncio.get_event_loop().run_in_executor(
-                                                        pool, functools.partial(
-                                                            pkg_installer.check_and_install_dependencies,
-                                                            hash["PYTHONTYPE"]))
-                                            # update cache again after install
-                                            if not site.getusersitepackages() in sys.path:
-                                                logger.debug("add pip path: " + site.getusersitepackages())
-                                                sys.path.append(site.getusersitepackages())
-                                            importlib.invalidate_caches()
-                                    # when installation finished, inform user
-                                    await fhem.readingsSingleUpdate(hash, "state", "Installation finished. Define now...", 1)
-                                    # wait 5s so that user can read the msg about installation
-                                    await asyncio.sleep(5)
-                                    # continue define
-
-                                # import module
-                                pymodule = "lib." + hash["PYTHONTYPE"] + "." + hash["PYTHONTYPE"]
-                                module_object = importlib.import_module(pymodule)
-                                # create instance of class with logger
-                                target_class = getattr(module_object, hash["PYTHONTYPE"])
-                                moduleLogger = logging.getLogger(hash["NAME"])
-                                moduleLogger.setLevel(self.getLogLevel(await fhem.AttrVal(hash["NAME"], "verbose", "3")))
-                                loadedModuleInstances[hash["NAME"]] = target_class(moduleLogger)
-                                del moduleLoadingRunning[hash["NAME"]]
+                                await self.createInstance(hash)
+                                replay_queue = moduleLoadingRunning.pop(hash["NAME"])
                                 if (hash["function"] != "Define"):
                                     func = getattr(loadedModuleInstances[hash["NAME"]], "Define", "nofunction")
-                                    await asyncio.wait_for(func(hash, hash['defargs'], hash['defargsh']), fct_timeout)
+                                    with tracing.span("module:Define"):
+                                        await asyncio.wait_for(func(hash, hash['defargs'], hash['defargsh']), fct_timeout)
+                                    self.markFirstDefine()
                             except asyncio.TimeoutError:
+                                timer.timeout = True
+                                self.dropQueue(hash, moduleLoadingRunning.pop(hash["NAME"], None) or replay_queue)
                                 errorMsg = f"Function execution >{fct_timeout}s, cancelled: {hash['NAME']} Define"
                                 if fhem_reply_done:
                                     await fhem.readingsSingleUpdate(hash, "state", errorMsg, 1)
@@ -204,6 +484,8 @@ class PyBinding:
                                     await self.sendBackError(hash, errorMsg)
                                 return 0
                             except Exception:
+                                timer.error = True
+                                self.dropQueue(hash, moduleLoadingRunning.pop(hash["NAME"], None) or replay_queue)
                                 errorMsg = "Failed to load module " + hash["PYTHONTYPE"] + ": " + traceback.format_exc()
                                 if fhem_reply_done:
                                     await fhem.readingsSingleUpdate(hash, "state", errorMsg, 1)
@@ -211,7 +493,7 @@ class PyBinding:
                                     await self.sendBackError(hash, errorMsg)
                                 return 0
                         
-                    nmInstance = loadedModuleInstances[hash["NAME"]]
+                    nmInstance = loadedModuleInstances.get(hash["NAME"])
 
                     if (nmInstance != None):
                         try:
@@ -222,6 +504,12 @@ class PyBinding:
                                     moduleLogger.setLevel(self.getLogLevel(hash["args"][3]))
                                 else:
                                     moduleLogger.setLevel(logging.ERROR)
+                            elif hash["function"] == "Attr" and hash["args"][2] == "readingThrottle":
+                                # throttles are applied in fhem.py, module isn't involved
+                                if hash["args"][0] == "set":
+                                    ret = fhem.setReadingThrottle(hash, hash["args"][3])
+                                else:
+                                    fhem.removeReadingThrottle(hash["NAME"])
                             else:
                                 # call Set/Attr/Define/...
                                 func = getattr(nmInstance, hash["function"], "nofunction")
@@ -229,17 +517,23 @@ class PyBinding:
                                     logger.debug(f"Start function {hash['NAME']}:{hash['function']}")
                                     if hash["function"] == "Undefine":
                                         try:
-                                            ret = await asyncio.wait_for(func(hash), fct_timeout)
+                                            with tracing.span("module:Undefine"):
+                                                ret = await asyncio.wait_for(func(hash), fct_timeout)
                                         except:
                                             del loadedModuleInstances[hash["NAME"]]
                                     else:
-                                        ret = await asyncio.wait_for(func(hash, hash['args'], hash['argsh']), fct_timeout)
+                                        with tracing.span("module:" + hash["function"]):
+                                            ret = await asyncio.wait_for(func(hash, hash['args'], hash['argsh']), fct_timeout)
+                                        if hash["function"] == "Define":
+                                            self.markFirstDefine()
                                     logger.debug(f"End function {hash['NAME']}:{hash['function']}")
                                     if (ret == None):
                                         ret = ""
                                     if fhem_reply_done:
                                         await self.updateHash(hash)
                         except asyncio.TimeoutError:
+                            timer.timeout = True
+                            self.dropQueue(hash, replay_queue)
                             errorMsg = f"Function execution >{fct_timeout}s, cancelled: {hash['NAME']} - {hash['function']}"
                             if fhem_reply_done:
                                 await fhem.readingsSingleUpdate(hash, "state", errorMsg, 1)
@@ -247,6 +541,8 @@ class PyBinding:
                                 await self.sendBackError(hash, errorMsg)
                             return 0
                         except:
+                            timer.error = True
+                            self.dropQueue(hash, replay_queue)
                             errorMsg = "Failed to execute function " + hash["function"] + ": " + traceback.format_exc()
                             if fhem_reply_done:
                                 await fhem.readingsSingleUpdate(hash, "state", errorMsg, 1)
@@ -255,17 +551,152 @@ class PyBinding:
                             return 0
                     
                     if (hash['function'] == "Undefine"):
+                        moduleDefinitions.pop(hash["NAME"], None)
+                        snapshots.remove(hash["NAME"])
+                        releaseDevice(hash["NAME"], nmInstance)
                         if hash["NAME"] in loadedModuleInstances:
                             del loadedModuleInstances[hash["NAME"]]
                     
                     if fhem_reply_done is False:
                         await self.sendBackReturn(hash, ret)
 
+                    if len(replay_queue):
+                        asyncio.create_task(self.replayQueue(replay_queue))
+
         except Exception:
             logger.error("Failed to handle message: ", exc_info=True)
+        finally:
+            if timer:
+                timer.stop()
+            if trace:
+                trace.finish()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="FHEM Python binding")
+    parser.add_argument("--host", default="0.0.0.0",
+        help="address of the websocket listener (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=15733,
+        help="port of the websocket listener (default: 15733)")
+    parser.add_argument("--unix-socket", metavar="PATH",
+        help="listen on this unix domain socket instead of TCP, for FHEM on the same host")
+    parser.add_argument("--metrics-port", type=int, default=0,
+        help="serve Prometheus metrics on http://<metrics-host>:<port>/metrics (default: off)")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+        help="address of the metrics listener (default: 127.0.0.1)")
+    parser.add_argument("--block-threshold", type=float, default=0.5,
+        help="report event loop stalls longer than this many seconds, 0 disables (default: 0.5)")
+    parser.add_argument("--tracemalloc", action="store_true",
+        help="start memory tracking per module on startup, includes memory allocated on import")
+    parser.add_argument("--uvloop", action="store_true",
+        help="use the uvloop event loop if it is installed")
+    parser.add_argument("--loop-debug", action="store_true",
+        help="asyncio debug mode, logs slow callbacks and never awaited coroutines")
+    parser.add_argument("--slow-callback", type=float, default=0.1, metavar="SECONDS",
+        help="with --loop-debug log callbacks which run longer (default: 0.1)")
+    parser.add_argument("--wheelhouse", metavar="DIR",
+        help="install missing requirements only from the wheels in DIR, without access to PyPI")
+    parser.add_argument("--workers", type=int, default=0, metavar="N",
+        help="run the module instances in N worker processes, 0 runs everything in this process (default: 0)")
+    parser.add_argument("--shard-by", choices=["type", "name"], default="type",
+        help="assign devices to workers by module type or by device name (default: type)")
+    parser.add_argument("--pin", action="append", default=[], metavar="TYPE,TYPE",
+        help="run these module types in the same worker, can be given multiple times")
+    parser.add_argument("--isolate", action="append", default=[], metavar="TYPE[,TYPE]",
+        help="run each of these module types in its own process, which is restarted after a crash")
+    parser.add_argument("--module-dir", action="append", default=[], metavar="DIR",
+        help="load module types from DIR as well, e.g. the synthetic_load module of the benchmark")
+    parser.add_argument("--worker-id", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def run_worker(loop, args):
+    protocol_fd = workers.redirect_stdout()
+    # stack of a segfault in native code goes to stderr, the supervisor logs it as crash reason
+    faulthandler.enable()
+    # worker number in every log line, all workers log to the same file
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter(f'%(asctime)s - %(levelname)-8s - [worker {args.worker_id}] %(name)s: %(message)s'))
+    logger.info(f"Worker {args.worker_id} started (pid {os.getpid()})")
+    reader, connection = loop.run_until_complete(workers.open_worker_pipes(protocol_fd))
+    stats.mark_startup("connected")
+    loop.run_until_complete(pipebinding(reader, connection))
+    logger.info(f"Worker {args.worker_id}: supervisor closed the connection, exit")
+    loop.run_until_complete(shutdown())
+
+async def shutdown():
+    global shutdown_running
+    if shutdown_running:
+        return
+    shutdown_running = True
+    count = await snapshots.save_all(loadedModuleInstances, moduleDefinitions)
+    if workers.supervisor is not None:
+        # the workers save their snapshots when their pipe is closed
+        await workers.supervisor.stop(snapshots.SNAPSHOT_TIMEOUT + 1)
+    logger.info(f"Shutdown, saved {count} snapshots")
+    # threads of modules (e.g. googlecast) would keep the process alive
+    os._exit(0)
+
+def handle_sigterm(loop):
+    # FHEM stops the binding with SIGTERM, modules get the chance to save a snapshot
+    try:
+        loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(shutdown()))
+    except NotImplementedError:
+        # windows
+        pass
 
 def run():
+    stats.mark_startup("imports")
+    args = parse_args()
+    for module_dir in args.module_dir:
+        module_loader.add_module_dir(module_dir)
     logger.info("Starting pythonbinding...")
-    asyncio.get_event_loop().run_until_complete(
-        websockets.serve(pybinding, '0.0.0.0', 15733, ping_timeout=None, ping_interval=None))
-    asyncio.get_event_loop().run_forever()
+    if args.uvloop:
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        except ImportError:
+            logger.warning("uvloop isn't installed, using the asyncio event loop")
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if args.loop_debug:
+        loop.set_debug(True)
+        loop.slow_callback_duration = args.slow_callback
+    logger.info(f"Event loop: {type(loop).__module__}.{type(loop).__name__}"
+        + (f", debug, slow callbacks >{args.slow_callback}s" if args.loop_debug else ""))
+    if args.tracemalloc:
+        memory.start()
+    if args.wheelhouse:
+        if not os.path.isdir(args.wheelhouse):
+            logger.error(f"Wheelhouse {args.wheelhouse} doesn't exist, requirements can't be installed")
+        pkg_installer.wheelhouse = os.path.abspath(args.wheelhouse)
+    stats.install_executor(loop)
+    stats.loop_lag.start()
+    if args.block_threshold > 0:
+        loop_watchdog.start(loop, args.block_threshold, loadedModuleInstances)
+    handle_sigterm(loop)
+    if args.worker_id is not None:
+        run_worker(loop, args)
+        return
+    isolate = [t.strip() for types in args.isolate for t in types.split(",") if t.strip()]
+    if args.workers > 0 or len(isolate):
+        workers.start_supervisor(loop, args.workers, args.shard_by, args.pin, isolate)
+        if args.workers > 0:
+            logger.info(f"Started {args.workers} workers, devices are assigned by {args.shard_by}")
+        if len(isolate):
+            logger.info("Module types in their own process: " + ", ".join(isolate))
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            # left over from the last run
+            os.unlink(args.unix_socket)
+        loop.run_until_complete(
+            websockets.unix_serve(pybinding, args.unix_socket, ping_timeout=None, ping_interval=None))
+        # only FHEM (same user) and its group may connect
+        os.chmod(args.unix_socket, 0o660)
+        logger.info("Listening on " + args.unix_socket)
+    else:
+        loop.run_until_complete(
+            websockets.serve(pybinding, args.host, args.port, ping_timeout=None, ping_interval=None))
+    stats.mark_startup("listening")
+    if args.metrics_port:
+        from . import metrics_http
+        loop.run_until_complete(metrics_http.start(args.metrics_host, args.metrics_port))
+    loop.run_forever()
@@ -21,11 +21,9 @@ from pychromecast.controllers.youtube import YouTubeController
 import pychromecast.controllers.dashcast as dashcast
 # Spotify
 from pychromecast.controllers.spotify import SpotifyController
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-
-# youtube_dl
-import youtube_dl
+# spotipy and youtube_dl are only needed for playing spotify or youtube urls
+spotipy = utils.lazy_import("spotipy")
+youtube_dl = utils.lazy_import("youtube_dl")
 
 connection_update_lock = threading.Lock()
 
@@ -41,6 +39,19 @@ class googlecast:
         self.currPosTask = None
         self.connectionStateCache = ""
         self.browser = None
+        self.cachedCast = None
+        # discovery and cached address might find the cast at the same time
+        self.castLock = threading.Lock()
+
+    # warm restart: address of the cast, it's connected without waiting for the discovery
+    async def snapshot(self):
+        if self.cast is None or getattr(self.cast, "host", None) is None:
+            return None
+        return {"host": self.cast.host, "port": self.cast.port, "uuid": str(self.cast.uuid),
+            "model_name": self.cast.model_name}
+
+    async def restore(self, hash, state):
+        self.cachedCast = state
 
     # FHEM FUNCTION
     async def Define(self, hash, args, argsh):
@@ -63,6 +74,8 @@ class googlecast:
         await fhem.readingsEndUpdate(hash, 1)
 
         self.startDiscovery()
+        if self.cachedCast:
+            utils.create_task(hash, self.connectCachedCast())
 
         return ""
 
@@ -198,6 +211,7 @@ class googlecast:
                 pool, functools.partial(self.playSpotify, uri))
 
     async def playSpotify(self, uri):
+        from spotipy.oauth2 import SpotifyClientCredentials
         # FIXME user needs to enter CLIENT_ID and CLIENT_SECRET from Spotify Dashboard
         client_credentials_manager = SpotifyClientCredentials("CLIENT_ID","CLIENT_SECRET")
         data = client_credentials_manager.get_access_token()
@@ -290,25 +304,51 @@ class googlecast:
         return None
 
 
+    def useCast(self, chromecast):
+        self.cast = chromecast
+        # add status listener
+        self.cast.register_connection_listener(self)
+        self.cast.register_status_listener(self)
+        # add media controller listener
+        self.cast.media_controller.register_status_listener(self)
+        self.logger.debug("wait for chromecast")
+        # timeout 0.001 just waits for status to be ready
+        # but we just need the thread to start by calling wait()
+        self.cast.wait(0.001)
+        self.logger.debug("wait finished")
+
     def startDiscovery(self):
         def castFound(chromecast):
-            if chromecast.name == self.hash["CASTNAME"] and self.cast is None:
-                self.logger.info("Discovered cast: " + chromecast.name)
-                self.cast = chromecast
-                # add status listener
-                self.cast.register_connection_listener(self)
-                self.cast.register_status_listener(self)
-                # add media controller listener
-                self.cast.media_controller.register_status_listener(self)
-                self.logger.debug("wait for chromecast")
-                # timeout 0.001 just waits for status to be ready
-                # but we just need the thread to start by calling wait()
-                self.cast.wait(0.001)
-                self.logger.debug("wait finished")
+            with self.castLock:
+                if chromecast.name == self.hash["CASTNAME"] and self.cast is None:
+                    self.logger.info("Discovered cast: " + chromecast.name)
+                    self.useCast(chromecast)
 
         self.logger.debug("Start discovery")
         self.browser = pychromecast.get_chromecasts(blocking=False, tries=None, retry_wait=5, timeout=5, callback=castFound)
 
+    async def connectCachedCast(self):
+        # the discovery keeps running, it finds the cast if its address changed
+        try:
+            await self.loop.run_in_executor(None, self.connectCachedCastBlocking)
+        except Exception:
+            self.logger.debug("Cached cast address not usable, wait for discovery", exc_info=True)
+
+    # THREADING: runs in an executor thread
+    def connectCachedCastBlocking(self):
+        c = self.cachedCast
+        # blocking connects right away and raises if the cast isn't at this address anymore,
+        # only a connected cast is used, otherwise the discovery result would be ignored
+        chromecast = pychromecast.get_chromecast_from_host(
+            (c["host"], c["port"], c["uuid"], c["model_name"], self.hash["CASTNAME"]), tries=1, timeout=5, blocking=True)
+        with self.castLock:
+            if self.cast is None:
+                self.logger.info(f"Connected cast {self.hash['CASTNAME']} at cached address {c['host']}")
+                self.useCast(chromecast)
+                return
+        # discovery was faster
+        chromecast.disconnect()
+
     # THREADING: this function is called by run_once pychromecast thread
     def new_connection_status(self, status):
         # connection update might come from different threads
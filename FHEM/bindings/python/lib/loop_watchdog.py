@@ -0,0 +1,171 @@
+
+import asyncio
+import collections
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+
+from . import fhem
+
+logger = logging.getLogger(__name__)
+
+# watchdog thread which detects blocking code on the event loop and
+# attributes it to the module whose code was running
+# code of the module packages: <binding>/lib/<type>/..., not /usr/lib/python3/...
+# same path as co_filename and tracemalloc filenames, build_bundle.py compiles the
+# bundled code with its path inside pythonbinding.pyz, which starts with this one as well
+LIB_DIR = os.path.dirname(__file__).replace("\\", "/")
+MODULE_DIRS = [LIB_DIR]
+MODULE_RE = re.compile(re.escape(LIB_DIR) + r"/(\w+)/")
+# the binding itself (lib/*.py)
+BINDING_RE = re.compile(re.escape(LIB_DIR) + r"/\w+\.py$")
+
+watchdog = None
+
+def add_module_dir(path):
+    """module types outside of lib/ (--module-dir), e.g. synthetic_load of the benchmark"""
+    global MODULE_RE
+    MODULE_DIRS.append(path.replace("\\", "/"))
+    MODULE_RE = re.compile("(?:" + "|".join(re.escape(d) for d in MODULE_DIRS) + r")/(\w+)/")
+
+def attribute(frame, instances):
+    """returns (pythontype, device, function, filename, lineno) of the innermost module frame"""
+    try:
+        names = {id(instance): name for name, instance in list(instances.items())}
+    except RuntimeError:
+        names = {}
+    location = None
+    device = None
+    f = frame
+    while f is not None:
+        filename = f.f_code.co_filename.replace("\\", "/")
+        m = MODULE_RE.search(filename)
+        if m:
+            if location is None:
+                location = (m.group(1), f.f_code.co_name, os.path.basename(filename), f.f_lineno)
+            if device is None:
+                local_vars = f.f_locals
+                if id(local_vars.get("self")) in names:
+                    device = names[id(local_vars.get("self"))]
+                elif isinstance(local_vars.get("hash"), dict) and "NAME" in local_vars["hash"]:
+                    device = local_vars["hash"]["NAME"]
+        f = f.f_back
+    if location is None:
+        return (None, None, None, None, None)
+    if device is None:
+        # only one device of that type, it must be this one
+        same_type = [name for name, instance in list(instances.items())
+            if instance.__class__.__module__.split(".")[1:2] == [location[0]]]
+        if len(same_type) == 1:
+            device = same_type[0]
+    return (location[0], device, location[1], location[2], location[3])
+
+class Stall:
+
+    def __init__(self, duration, pythontype, device, function, filename, lineno, stack):
+        self.time = time.time()
+        self.duration = duration
+        self.pythontype = pythontype
+        self.device = device
+        self.function = function
+        self.filename = filename
+        self.lineno = lineno
+        self.stack = stack
+
+    def location(self):
+        if self.function is None:
+            return "unknown location"
+        return f"{self.function} ({self.filename}:{self.lineno})"
+
+    def culprit(self):
+        return self.device or self.pythontype or "binding"
+
+class LoopWatchdog(threading.Thread):
+
+    BEAT_INTERVAL = 0.1
+    CHECK_INTERVAL = 0.05
+
+    def __init__(self, loop, threshold, instances):
+        super().__init__(name="pythonbinding-watchdog", daemon=True)
+        self.loop = loop
+        self.threshold = threshold
+        self.instances = instances
+        self.loop_thread = threading.get_ident()
+        self.beat = time.perf_counter()
+        self.stalls = collections.deque(maxlen=50)
+        # pythontype -> [count, seconds]
+        self.blocked = {}
+
+    def start(self):
+        self.loop.call_soon(self._beat)
+        super().start()
+
+    def _beat(self):
+        self.beat = time.perf_counter()
+        self.loop.call_later(self.BEAT_INTERVAL, self._beat)
+
+    def run(self):
+        samples = None
+        stall_beat = None
+        stack = None
+        while True:
+            time.sleep(self.CHECK_INTERVAL)
+            beat = self.beat
+            if samples is not None and beat != stall_beat:
+                # loop is running again
+                duration = beat - stall_beat - self.BEAT_INTERVAL
+                self.loop.call_soon_threadsafe(self.report, duration, samples, stack)
+                samples = None
+                stack = None
+            lag = time.perf_counter() - beat - self.BEAT_INTERVAL
+            if lag <= self.threshold:
+                continue
+            # stall detected, sample the stack of the loop thread
+            if samples is None:
+                samples = collections.Counter()
+                stall_beat = beat
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                continue
+            try:
+                if stack is None:
+                    stack = "".join(traceback.format_stack(frame, limit=12))
+                samples[attribute(frame, self.instances)] += 1
+            except Exception:
+                logger.debug("Failed to sample stack", exc_info=True)
+            finally:
+                del frame
+
+    def report(self, duration, samples, stack):
+        (pythontype, device, function, filename, lineno), cnt = samples.most_common(1)[0]
+        stall = Stall(duration, pythontype, device, function, filename, lineno, stack)
+        self.stalls.append(stall)
+        key = pythontype or "binding"
+        entry = self.blocked.setdefault(key, [0, 0.0])
+        entry[0] += 1
+        entry[1] += duration
+        ms = round(duration * 1000)
+        logger.warning(f"Event loop blocked for {ms} ms by {stall.culprit()} in {stall.location()}\n{stack or ''}")
+        if device is not None and device in self.instances:
+            asyncio.create_task(fhem.readingsSingleUpdate({"NAME": device}, "loop_blocked",
+                f"{ms} ms in {stall.location()}", 1))
+
+def start(loop, threshold, instances):
+    global watchdog
+    watchdog = LoopWatchdog(loop, threshold, instances)
+    watchdog.start()
+    return watchdog
+
+def format_stalls():
+    if watchdog is None:
+        return "Watchdog not running"
+    lines = ["{:<20} {:>9}  {:<25} {}".format("time", "ms", "device", "location")]
+    for stall in watchdog.stalls:
+        lines.append("{:<20} {:>9}  {:<25} {}".format(
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stall.time)),
+            round(stall.duration * 1000), stall.culprit()[:25], stall.location()))
+    return "\n".join(lines)
@@ -0,0 +1,135 @@
+
+import logging
+import time
+import tracemalloc
+
+from . import fhem
+from . import utils
+from . import loop_watchdog
+from .loop_watchdog import BINDING_RE, LIB_DIR
+
+logger = logging.getLogger(__name__)
+
+# tracemalloc based memory accounting per module package under lib/
+# allocations are attributed to the innermost frame of lib/<type>/,
+# allocations of the binding itself (lib/*.py) to "binding"
+NFRAMES = 25
+REPORT_INTERVAL = 300
+
+baseline = None
+baseline_time = None
+last_totals = {}
+report_job = None
+reading_device = None
+
+def owner(traceback):
+    binding = False
+    for frame in reversed(traceback):
+        filename = frame.filename.replace("\\", "/")
+        m = loop_watchdog.MODULE_RE.search(filename)
+        if m:
+            return m.group(1)
+        if BINDING_RE.search(filename):
+            binding = True
+    return "binding" if binding else "other"
+
+def take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>")])
+
+def totals(snapshot):
+    res = {}
+    owners = {}
+    for trace in snapshot.traces:
+        tb = trace.traceback
+        if tb not in owners:
+            owners[tb] = owner(tb)
+        res[owners[tb]] = res.get(owners[tb], 0) + trace.size
+    return res
+
+def is_tracing():
+    return tracemalloc.is_tracing()
+
+def start(name=None, interval=REPORT_INTERVAL):
+    """start tracing, name is the device which gets the memory readings"""
+    global report_job, reading_device
+    if name is not None:
+        reading_device = name
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(NFRAMES)
+    if report_job is None:
+        report_job = utils.schedule_periodic({"NAME": reading_device or "pythonbinding"}, interval, report,
+            initial_delay=interval)
+
+def stop():
+    global baseline, baseline_time, last_totals, report_job
+    if report_job is not None:
+        report_job.cancel()
+        report_job = None
+    tracemalloc.stop()
+    baseline = None
+    baseline_time = None
+    last_totals = {}
+
+async def report():
+    global last_totals
+    if not tracemalloc.is_tracing():
+        return
+    last_totals = totals(take_snapshot())
+    logger.info("Memory per module: " + ", ".join(
+        f"{name}={size // 1024}kB" for name, size in sorted(last_totals.items(), key=lambda x: -x[1])))
+    if reading_device is not None:
+        hash = {"NAME": reading_device}
+        await fhem.readingsBeginUpdate(hash)
+        for name, size in last_totals.items():
+            await fhem.readingsBulkUpdateIfChanged(hash, "memory_" + name, size // 1024)
+        await fhem.readingsEndUpdate(hash, 1)
+
+def save_baseline():
+    global baseline, baseline_time
+    if not tracemalloc.is_tracing():
+        return "Memory tracking is off"
+    baseline = take_snapshot()
+    baseline_time = time.time()
+    return ""
+
+def format_totals():
+    global last_totals
+    if not tracemalloc.is_tracing():
+        return "Memory tracking is off"
+    last_totals = totals(take_snapshot())
+    current, peak = tracemalloc.get_traced_memory()
+    lines = ["{:<30} {:>12}".format("module", "kB")]
+    for name, size in sorted(last_totals.items(), key=lambda x: -x[1]):
+        lines.append("{:<30} {:>12}".format(name, size // 1024))
+    lines.append("")
+    lines.append(f"traced {current // 1024} kB, peak {peak // 1024} kB")
+    return "\n".join(lines)
+
+def format_diff(count=15):
+    if not tracemalloc.is_tracing():
+        return "Memory tracking is off"
+    if baseline is None:
+        return "No snapshot, use set memorySnapshot first"
+    current = take_snapshot()
+    before = totals(baseline)
+    after = totals(current)
+    lines = ["since " + time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(baseline_time)), ""]
+    lines.append("{:<30} {:>12} {:>12}".format("module", "kB", "diff kB"))
+    for name in sorted(set(before) | set(after), key=lambda n: -(after.get(n, 0) - before.get(n, 0))):
+        lines.append("{:<30} {:>12} {:>+12}".format(name, after.get(name, 0) // 1024,
+            (after.get(name, 0) - before.get(name, 0)) // 1024))
+    lines.append("")
+    lines.append("largest growth:")
+    for stat in current.compare_to(baseline, "traceback")[:count]:
+        # show the allocating line of the module
+        frame = stat.traceback[-1]
+        for f in reversed(stat.traceback):
+            if loop_watchdog.MODULE_RE.search(f.filename.replace("\\", "/")):
+                frame = f
+                break
+        lines.append("{:>+10} kB {:>+8} blocks  {:<20} {}:{}".format(stat.size_diff // 1024, stat.count_diff,
+            owner(stat.traceback), frame.filename.replace("\\", "/").replace(LIB_DIR + "/", ""), frame.lineno))
+    return "\n".join(lines)
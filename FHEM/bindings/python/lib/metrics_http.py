@@ -0,0 +1,176 @@
+
+import asyncio
+import logging
+
+from . import fhem
+from . import stats
+from . import utils
+from . import loop_watchdog
+from . import memory
+from . import module_loader
+from . import workers
+from . import fhem_pythonbinding
+
+logger = logging.getLogger(__name__)
+
+# minimal HTTP server which serves /metrics in Prometheus text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Metrics:
+    # samples are collected per metric family, the text format requires all
+    # samples of a family directly after its HELP and TYPE lines
+
+    def __init__(self):
+        # name -> (help, type, sample lines), in order of the first sample
+        self.families = {}
+
+    def family(self, name, mtype, help):
+        name = "pythonbinding_" + name
+        if name not in self.families:
+            self.families[name] = (help, mtype, [])
+        return name
+
+    def add(self, name, mtype, help, value, labels=None):
+        name = self.family(name, mtype, help)
+        self.sample(name, name, value, labels)
+
+    def sample(self, family, name, value, labels=None):
+        if labels:
+            lbl = ",".join(f'{k}="{escape(v)}"' for k, v in labels.items())
+            self.families[family][2].append(f"{name}{{{lbl}}} {value}")
+        else:
+            self.families[family][2].append(f"{name} {value}")
+
+    def summary(self, name, help, hist, labels):
+        name = self.family(name, "summary", help)
+        for q in (0.5, 0.95, 0.99):
+            self.sample(name, name, hist.percentile(q * 100), dict(labels, quantile=q))
+        self.sample(name, name + "_sum", hist.sum, labels)
+        self.sample(name, name + "_count", hist.count, labels)
+
+    def text(self):
+        lines = []
+        for name, (help, mtype, samples) in self.families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {mtype}")
+            lines += samples
+        return "\n".join(lines) + "\n"
+
+def collect():
+    m = Metrics()
+    m.add("uptime_seconds", "gauge", "Seconds since the binding was started", round(asyncio.get_event_loop().time() - start_time, 3))
+    m.add("reconnects_total", "counter", "FHEM websocket reconnects", stats.reconnects())
+    for (direction, msgtype), cnt in sorted(stats.messages.items()):
+        m.add("messages_total", "counter", "Websocket messages by direction and msgtype", cnt,
+            {"direction": direction, "msgtype": msgtype})
+
+    # queues
+    m.add("pending_commands", "gauge", "Commands sent to FHEM waiting for a reply",
+        len(fhem_pythonbinding.PyBinding.msg_listeners))
+    m.add("function_active_depth", "gauge", "Depth of the function_active stack", len(fhem.function_active))
+    m.add("asyncio_tasks", "gauge", "Tasks of the event loop", len(asyncio.all_tasks()))
+    ws = fhem.wsconnection.wsconnection if fhem.wsconnection else None
+    if ws is not None and ws.transport is not None:
+        m.add("websocket_write_buffer_bytes", "gauge", "Bytes waiting in the websocket send buffer",
+            ws.transport.get_write_buffer_size())
+
+    # executor
+    ex = stats.executor
+    if ex is not None:
+        m.add("executor_max_workers", "gauge", "Threads of the default executor", ex._max_workers)
+        m.add("executor_busy_threads", "gauge", "Busy threads of the default executor", ex.busy)
+        m.add("executor_queued", "gauge", "Jobs waiting for an executor thread", ex.queued)
+        m.add("executor_completed_total", "counter", "Jobs finished by the default executor", ex.completed)
+        m.add("executor_busy_seconds_total", "counter", "Thread time spent in executor jobs", round(ex.busy_seconds, 6))
+
+    # event loop lag
+    loop = asyncio.get_running_loop()
+    m.add("event_loop_info", "gauge", "Event loop implementation", 1,
+        {"impl": type(loop).__module__ + "." + type(loop).__name__, "debug": str(loop.get_debug()).lower()})
+    m.add("loop_lag_seconds", "gauge", "Last measured event loop lag", round(stats.loop_lag.last, 6))
+    m.summary("loop_lag_summary_seconds", "Event loop lag", stats.loop_lag.hist, {})
+
+    if loop_watchdog.watchdog is not None:
+        for pythontype, (cnt, seconds) in sorted(loop_watchdog.watchdog.blocked.items()):
+            m.add("loop_blocked_total", "counter", "Event loop stalls above the threshold per module type", cnt, {"type": pythontype})
+            m.add("loop_blocked_seconds_total", "counter", "Duration of event loop stalls per module type", round(seconds, 3), {"type": pythontype})
+
+    # memory and devices
+    m.add("resident_memory_bytes", "gauge", "Resident memory of the binding process", stats.rss_bytes())
+    types = {}
+    for instance in fhem_pythonbinding.loadedModuleInstances.values():
+        name = instance.__class__.__name__
+        types[name] = types.get(name, 0) + 1
+    for pythontype, cnt in sorted(types.items()):
+        m.add("module_instances", "gauge", "Loaded module instances per type", cnt, {"type": pythontype})
+    # updated by the periodic memory report while memory tracking is on
+    for pythontype, size in sorted(memory.last_totals.items()):
+        m.add("module_memory_bytes", "gauge", "Memory allocated by module code (tracemalloc)", size, {"type": pythontype})
+    m.add("device_tasks", "gauge", "Tasks created with utils.create_task", sum(len(t) for t in utils.tasks.tasks.values()))
+    m.add("leaked_tasks", "gauge", "Tasks still running after Undefine", len(utils.tasks.leaked))
+    m.add("scheduled_jobs", "gauge", "Periodic jobs of the shared scheduler", utils.scheduler.job_count())
+
+    for pythontype, (seconds, modules) in sorted(stats.import_times.items()):
+        m.add("module_import_seconds", "gauge", "Time to import the module package", round(seconds, 3), {"type": pythontype})
+    for phase, seconds in stats.startup.items():
+        m.add("startup_seconds", "gauge", "Seconds from process start to the startup phase", round(seconds, 3), {"phase": phase})
+    m.add("devices_loading", "gauge", "Devices waiting for their module import", len(module_loader.loader.pending))
+    if workers.supervisor is not None:
+        for worker in workers.supervisor.all_workers():
+            labels = {"worker": worker.id}
+            m.add("worker_devices", "gauge", "Devices assigned to the worker process", len(worker.devices()), labels)
+            m.add("worker_messages_total", "counter", "Messages between binding and worker process",
+                worker.messages_in, dict(labels, direction="in"))
+            m.add("worker_messages_total", "counter", "Messages between binding and worker process",
+                worker.messages_out, dict(labels, direction="out"))
+            m.add("worker_restarts_total", "counter", "Restarts of the worker process after a crash", worker.restarts, labels)
+
+    # latency
+    for (pythontype, function), stat in sorted(stats.functions.items()):
+        labels = {"type": pythontype, "function": function}
+        m.summary("function_duration_seconds", "Duration of functions called by FHEM", stat.hist, labels)
+        m.add("function_inflight", "gauge", "Running functions called by FHEM", stat.inflight, labels)
+        m.add("function_timeouts_total", "counter", "Functions cancelled after timeout", stat.timeouts, labels)
+        m.add("function_errors_total", "counter", "Functions which raised an exception", stat.errors, labels)
+    for command, stat in sorted(stats.commands.items()):
+        labels = {"command": command}
+        m.summary("command_duration_seconds", "Round-trip time of commands sent to FHEM", stat.hist, labels)
+        m.add("command_inflight", "gauge", "Commands waiting for FHEM", stat.inflight, labels)
+        m.add("command_timeouts_total", "counter", "Commands without reply from FHEM", stat.timeouts, labels)
+        m.add("command_errors_total", "counter", "Commands which failed in FHEM", stat.errors, labels)
+    return m.text()
+
+async def handle(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), 10)
+        # skip headers
+        while True:
+            line = await asyncio.wait_for(reader.readline(), 10)
+            if line in (b"\r\n", b"\n", b""):
+                break
+        parts = request.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status = "200 OK"
+            body = collect().encode("utf-8")
+        else:
+            status = "404 Not Found"
+            body = b"not found\n"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+    except Exception:
+        logger.error("Failed to handle metrics request", exc_info=True)
+    finally:
+        writer.close()
+
+start_time = 0
+
+async def start(host, port):
+    global start_time
+    start_time = asyncio.get_event_loop().time()
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -48,14 +48,18 @@ class miio:
                         elif inspect.isclass(annot) and issubclass(annot, bool):
                             self._set_list[dev_cmd]["options"] = "on,off"
 
+        self._set_list.update(utils.ADAPTIVE_POLL_SET)
+
         self._device = self._miio_device_class(ip=self._miio_ip, token=self._miio_token)
         await fhem.readingsSingleUpdateIfChanged(hash, "state", "active", 1)
-        asyncio.create_task(self.status_request_loop())
+        # poll every 300s as before while the status changes, back off up to 1200s
+        self._poller = utils.AdaptivePoller(hash, self.status_request_job, 300, 1200)
+
+    async def status_request_job(self):
+        return await self.status_request(getattr(self._device, "status"))
 
-    async def status_request_loop(self):
-        while True:
-            await self.set_command(self.hash, {"cmd": "status"})
-            await asyncio.sleep(300)
+    async def set_pollFast(self, hash, params):
+        self._poller.boost(params['seconds'])
 
     # FHEM FUNCTION
     async def Undefine(self, hash):
@@ -123,5 +127,8 @@ class miio:
             for prop in st:
                 await fhem.readingsBulkUpdateIfChanged(self.hash, prop, st[prop])
         except:
+            st = str(reply)
             await fhem.readingsBulkUpdateIfChanged(self.hash, "cmd_reply_val", reply)
-        await fhem.readingsEndUpdate(self.hash, 1)
\ No newline at end of file
+        await fhem.readingsEndUpdate(self.hash, 1)
+        # used by the poller to detect changes
+        return str(st)
\ No newline at end of file
@@ -0,0 +1,303 @@
+
+import asyncio
+import concurrent.futures
+import functools
+import importlib
+import logging
+import os
+import site
+import sys
+import time
+import types
+from . import fhem
+from . import stats
+from . import tracing
+from . import loop_watchdog
+from . import pkg_installer
+
+logger = logging.getLogger(__name__)
+
+# log the startup progress every n seconds while devices are loading
+PROGRESS_INTERVAL = 5
+# FHEM defines devices one by one, a batch ends when nothing was loaded for n seconds
+BATCH_GRACE = 2
+# collect the module types which need an installation for n seconds, they are installed with one pip call
+INSTALL_DELAY = 1
+
+async def import_module(pythontype):
+    pymodule = "lib." + pythontype + "." + pythontype
+    module_object = sys.modules.get(pymodule)
+    # a module which is still executed (e.g. imported by dlna_dmr in an executor thread)
+    # is already in sys.modules, import_module waits for it under the import lock
+    if module_object is not None and not getattr(getattr(module_object, "__spec__", None), "_initializing", False):
+        return module_object
+    imported_by_other = module_object is not None
+    # heavy dependencies take seconds to import, don't block other devices
+    start = time.time()
+    modules_before = len(sys.modules)
+    try:
+        module_object = await asyncio.get_running_loop().run_in_executor(None, importlib.import_module, pymodule)
+    except RuntimeError as e:
+        if "event loop" not in str(e):
+            raise
+        # module needs the event loop while importing (asyncio.get_event_loop() on module level)
+        module_object = importlib.import_module(pymodule)
+    if imported_by_other:
+        return module_object
+    stats.import_times[pythontype] = (time.time() - start, len(sys.modules) - modules_before)
+    logger.info(f"Imported {pythontype} in {time.time() - start:.2f}s ({len(sys.modules) - modules_before} modules)")
+    return module_object
+
+def add_module_dir(path):
+    """import module types from this directory too, lib.<type> is looked up there"""
+    path = os.path.abspath(path)
+    sys.modules[__package__].__path__.append(path)
+    loop_watchdog.add_module_dir(path)
+
+def module_type(module_name):
+    # lib.<type>.<module> or the package lib.<type>, core modules like lib.fhem aren't a type
+    parts = (module_name or "").split(".")
+    if len(parts) < 2 or parts[0] != "lib":
+        return None
+    if len(parts) == 2 and not hasattr(sys.modules.get(module_name), "__path__"):
+        return None
+    return parts[1]
+
+def _imported_types():
+    # PYTHONTYPE: module types it imports from, e.g. dlna_dmr: {discover_upnp}
+    imports = {}
+    for module_name, module in list(sys.modules.items()):
+        pythontype = module_type(module_name)
+        if pythontype is None or module is None:
+            continue
+        deps = imports.setdefault(pythontype, set())
+        for value in list(vars(module).values()):
+            try:
+                name = value.__name__ if isinstance(value, types.ModuleType) else getattr(value, "__module__", None)
+            except Exception:
+                continue
+            dep = module_type(name) if isinstance(name, str) else None
+            if dep is not None and dep != pythontype:
+                deps.add(dep)
+    return imports
+
+def reload_order(pythontype):
+    """pythontype and all loaded types which import from it, dependencies first"""
+    imports = _imported_types()
+    affected = {pythontype}
+    changed = True
+    while changed:
+        changed = False
+        for other, deps in imports.items():
+            if other not in affected and deps & affected:
+                affected.add(other)
+                changed = True
+    order = []
+    visiting = set()
+    def visit(t):
+        # skip types which are done and import cycles
+        if t in order or t in visiting:
+            return
+        visiting.add(t)
+        for dep in sorted(imports.get(t, set()) & affected):
+            visit(dep)
+        visiting.discard(t)
+        order.append(t)
+    for t in sorted(affected):
+        visit(t)
+    return order
+
+class ModuleLoader:
+    # Every PYTHONTYPE is checked and imported exactly once, all devices
+    # of that type wait for the same import. Different types load in parallel.
+
+    def __init__(self):
+        # PYTHONTYPE: future of the imported module
+        self.modules = {}
+        # PYTHONTYPE: loading, installing, loaded or failed
+        self.state = {}
+        # PYTHONTYPE: hashes of the devices waiting for the module
+        self.waiting = {}
+        # NAME: (PYTHONTYPE, start) of devices which are loading right now
+        self.pending = {}
+        self.loaded = 0
+        self.failed = []
+        self.batch_start = None
+        self.batch_end = None
+        self.progress_task = None
+        self.finish_handle = None
+        self.pip_lock = asyncio.Lock()
+        # (types, task) of the next pip run which still accepts types
+        self.install_round = None
+
+    async def load(self, hash):
+        pythontype = hash["PYTHONTYPE"]
+        self.begin(hash)
+        ok = False
+        try:
+            future = self.modules.get(pythontype)
+            if future is None or (future.done() and (future.cancelled() or future.exception() is not None)):
+                # first device of this type or last import failed
+                future = asyncio.ensure_future(self._load(pythontype))
+                self.modules[pythontype] = future
+            self.waiting.setdefault(pythontype, []).append(hash)
+            try:
+                # a device which times out must not cancel the import of the others
+                module_object = await asyncio.shield(future)
+            finally:
+                self.waiting[pythontype].remove(hash)
+            ok = True
+            return module_object
+        finally:
+            self.end(hash, ok)
+
+    async def _load(self, pythontype):
+        self.state[pythontype] = "loading"
+        loop = asyncio.get_running_loop()
+        try:
+            # reads manifest and package metadata, run it next to the other types
+            with tracing.span("dependency_check"):
+                deps_ok = await loop.run_in_executor(None, pkg_installer.check_dependencies, pythontype)
+            if deps_ok == False:
+                self.state[pythontype] = "installing"
+                await self.notify(pythontype, "Installing updates...")
+                await self.install(pythontype)
+                # when installation finished, inform user
+                await self.notify(pythontype, "Installation finished. Define now...")
+                # wait 5s so that user can read the msg about installation
+                await asyncio.sleep(5)
+                self.state[pythontype] = "loading"
+
+            with tracing.span("import", module=pythontype):
+                module_object = await import_module(pythontype)
+            self.state[pythontype] = "loaded"
+            return module_object
+        except BaseException:
+            self.state[pythontype] = "failed"
+            raise
+
+    async def install(self, pythontype):
+        if self.install_round is None:
+            types = set()
+            self.install_round = (types, asyncio.ensure_future(self._install(types)))
+        types, task = self.install_round
+        types.add(pythontype)
+        await asyncio.shield(task)
+
+    async def _install(self, types):
+        # FHEM defines the other devices meanwhile, their types join this round
+        await asyncio.sleep(INSTALL_DELAY)
+        loop = asyncio.get_running_loop()
+        # run only one installation and do depcheck before any other installation
+        async with self.pip_lock:
+            if self.install_round is not None and self.install_round[0] is types:
+                # types from now on are installed by the next round
+                self.install_round = None
+            # make sure that all import caches are up2date before check
+            importlib.invalidate_caches()
+            # check again, requirements might have been installed by the last round
+            requirements = await loop.run_in_executor(None, pkg_installer.missing_requirements, sorted(types))
+            if len(requirements) == 0:
+                return
+            logger.info(f"Installing {len(requirements)} requirements of {', '.join(sorted(types))}"
+                + (f" from {pkg_installer.wheelhouse}" if pkg_installer.wheelhouse else ""))
+            start = time.time()
+            # start installation in a separate asyncio thread
+            with concurrent.futures.ThreadPoolExecutor() as pool:
+                ok = await loop.run_in_executor(
+                        pool, functools.partial(
+                            pkg_installer.install_requirements,
+                            requirements))
+            logger.info(f"Installation {'finished' if ok else 'failed'} after {time.time() - start:.1f}s")
+            # update cache again after install
+            if not site.getusersitepackages() in sys.path:
+                logger.debug("add pip path: " + site.getusersitepackages())
+                sys.path.append(site.getusersitepackages())
+            importlib.invalidate_caches()
+            for pythontype in sorted(types):
+                # remembers the verdict for the next start
+                if not await loop.run_in_executor(None, pkg_installer.check_dependencies, pythontype):
+                    logger.error(f"Requirements of {pythontype} are still missing after installation")
+
+    def unload(self, pythontypes):
+        """Remove the module packages from sys.modules, the next load imports them again"""
+        for pythontype in pythontypes:
+            if pythontype in self.modules and not self.modules[pythontype].done():
+                raise RuntimeError(pythontype + " is loading right now")
+        for pythontype in pythontypes:
+            self.modules.pop(pythontype, None)
+            self.state.pop(pythontype, None)
+        for module_name in list(sys.modules):
+            if module_type(module_name) in pythontypes:
+                del sys.modules[module_name]
+        importlib.invalidate_caches()
+
+    async def notify(self, pythontype, msg):
+        for hash in list(self.waiting.get(pythontype, [])):
+            await fhem.readingsSingleUpdate(hash, "state", msg, 1)
+
+    def begin(self, hash):
+        if self.finish_handle is not None:
+            # next device of the running batch
+            self.finish_handle.cancel()
+            self.finish_handle = None
+        elif len(self.pending) == 0:
+            # new batch, e.g. FHEM startup or a single define
+            self.batch_start = time.time()
+            self.batch_end = None
+            self.loaded = 0
+            self.failed = []
+            if self.progress_task is None or self.progress_task.done():
+                self.progress_task = asyncio.ensure_future(self.log_progress())
+        self.pending[hash["NAME"]] = (hash["PYTHONTYPE"], time.time())
+
+    def end(self, hash, ok):
+        self.pending.pop(hash["NAME"], None)
+        if ok:
+            self.loaded += 1
+        else:
+            self.failed.append(hash["NAME"])
+        if len(self.pending) == 0:
+            self.batch_end = time.time()
+            self.finish_handle = asyncio.get_running_loop().call_later(BATCH_GRACE, self.finish_batch)
+
+    def finish_batch(self):
+        self.finish_handle = None
+        if self.loaded + len(self.failed) > 1:
+            logger.info(self.summary())
+
+    async def log_progress(self):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            if len(self.pending) == 0:
+                return
+            types = sorted(set(pythontype for pythontype, start in self.pending.values()))
+            logger.info(f"Loading devices: {self.loaded + len(self.failed)}/{self.loaded + len(self.failed) + len(self.pending)} done, "
+                + "waiting for " + ", ".join(f"{pythontype} ({self.state.get(pythontype, 'loading')})" for pythontype in types))
+
+    def summary(self):
+        duration = (self.batch_end or time.time()) - self.batch_start
+        types = len([pythontype for pythontype, state in self.state.items() if state == "loaded"])
+        msg = f"Loaded {self.loaded} devices of {types} module types in {duration:.2f}s"
+        if len(self.failed):
+            msg += ", failed: " + ", ".join(self.failed)
+        return msg
+
+    def format_progress(self):
+        if self.batch_start is None:
+            return "No devices loaded yet"
+        lines = []
+        if len(self.pending):
+            lines.append(f"Loading {len(self.pending)} devices, {self.loaded + len(self.failed)} done "
+                + f"since {time.time() - self.batch_start:.1f}s")
+        else:
+            lines.append(self.summary())
+        lines.append("")
+        lines.append("{:<30} {:<12} {:>8} {:>10}".format("module", "state", "waiting", "import s"))
+        for pythontype in sorted(self.state):
+            seconds = stats.import_times.get(pythontype, (0, 0))[0]
+            lines.append("{:<30} {:<12} {:>8} {:>10.3f}".format(
+                pythontype, self.state[pythontype], len(self.waiting.get(pythontype, [])), seconds))
+        return "\n".join(lines)
+
+loader = ModuleLoader()
@@ -161,13 +161,12 @@ class NespressoDetect:
                     self.dev = None
                     self.dev.disconnect()
             except (BLEError, NotConnectedError, NotificationTimeout):
+                # retries are handled by the circuit breaker of the caller
                 _LOGGER.debug("Failed to connect")
-                time.sleep(5) # wait 5s
-                if tries < 3:
-                    _LOGGER.debug("Failed to get_info, 3 times")
-                    self.get_info(tries+1) #retry
-                else:
-                    _LOGGER.error("Failed to get_info, more than 3 times")
+                self.dev = None
+                if self.keep_connected is False:
+                    self.adapter.stop()
+                raise
             if self.keep_connected is False:
                 self.adapter.stop()
             self.devices[mac] = device
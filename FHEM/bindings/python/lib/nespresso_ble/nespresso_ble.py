@@ -14,6 +14,7 @@ class nespresso_ble:
         self.logger = logger
         self.nespressodetect = None
         self.task = None
+        self.breaker = None
         self.auth = None
         logging.getLogger("pygatt.backends.gatttool.gatttool").setLevel(logging.ERROR)
         #logging.getLogger("nespresso_ble").setLevel(logging.DEBUG)
@@ -41,18 +42,14 @@ class nespresso_ble:
         self.auth = args[4]
         self.nespressodetect = NespressoDetect(self.auth, self.mac)
         self.nespressodetect.set_keep_connected(True)
-        self.task = asyncio.create_task(self.update_status_task())
+        self.breaker = fpyutils.CircuitBreaker(self.mac, failure_threshold=2, base_delay=60, max_delay=3600)
+        self.task = fpyutils.AdaptivePoller(hash, self.update_status, 300, 1200)
       return ""
 
-    async def update_status_task(self):
-      while True:
-        if self.nespressodetect:
-          await self.update_status()
-        await asyncio.sleep(300)
-
     # FHEM FUNCTION
     async def Undefine(self, hash):
-      self.task.cancel()
+      if self.task:
+        self.task.cancel()
       return
 
     # FHEM FUNCTION
@@ -62,7 +59,8 @@ class nespresso_ble:
         "brew": {"args": ["coffee_type", "temperature"], "params": {"temperature": {"default":"high", "optional":True}, "coffee_type": {"default":"lungo", "optional":True}}},
         "easybrew": {"args": ["coffee_type"], "options": "ristretto,espresso,lungo,hotwater,americano"},
         "recipe": {},
-        "updateStatus": {}
+        "updateStatus": {},
+        **fpyutils.ADAPTIVE_POLL_SET
       }
       if self.auth:
         del set_conf_list['authkey']
@@ -75,7 +73,12 @@ class nespresso_ble:
         self.task.cancel()
       self.nespressodetect = NespressoDetect(self.auth, self.mac)
       self.nespressodetect.set_keep_connected(True)
-      self.task = asyncio.create_task(self.update_status_task())
+      self.breaker = fpyutils.CircuitBreaker(self.mac, failure_threshold=2, base_delay=60, max_delay=3600)
+      self.task = fpyutils.AdaptivePoller(self.hash, self.update_status, 300, 1200)
+
+    async def set_pollFast(self, hash, params):
+      if self.task:
+        self.task.boost(params['seconds'])
 
     async def set_easybrew(self, hash, params):
       params['temperature'] = "medium"
@@ -93,7 +96,19 @@ class nespresso_ble:
       asyncio.create_task(self.update_status())
 
     async def update_status(self):
-      await fpyutils.run_blocking(functools.partial(self.blocking_update_status))
+      if not self.breaker.allow():
+        # machine unreachable, don't block radio and executor threads
+        return None
+      try:
+        await fpyutils.run_blocking(functools.partial(self.blocking_update_status))
+      except Exception:
+        # run_blocking logged it, the breaker needs the result anyway
+        self.device_info = None
+      if self.device_info:
+        self.breaker.record_success()
+      else:
+        self.breaker.record_failure()
+      await self.breaker.update_readings(self.hash)
 
       if self.device_info:
         for mac, dev in self.device_info.items():
@@ -112,6 +127,7 @@ class nespresso_ble:
         for mac, data in self.sensors_data.items():
           for name, val in data.items():
             await fhem.readingsSingleUpdateIfChanged(self.hash, name, val, 1)
+        return str(self.sensors_data)
 
     def blocking_update_status(self):
       self.logger.debug("nespresso_ble updatestatus")
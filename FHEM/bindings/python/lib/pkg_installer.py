@@ -1,13 +1,24 @@
 # lot of parts copied from HomeAssistant, many thanks!
 
 import logging
-import pkg_resources
 import json
 import sys
 import os
+import pkgutil
+import site
+import threading
 import importlib
+from urllib.parse import urlparse
 from subprocess import PIPE, Popen
 
+try:
+    from packaging.requirements import InvalidRequirement, Requirement
+    from packaging.utils import canonicalize_name
+except ImportError:
+    # pip vendors packaging, it's available wherever pip is
+    from pip._vendor.packaging.requirements import InvalidRequirement, Requirement
+    from pip._vendor.packaging.utils import canonicalize_name
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -22,47 +33,202 @@ else:
         version,
     )
 
+# manifest path: (mtime, manifest)
+_manifests = {}
+# module: dependencies ok, valid as long as site-packages is unchanged
+_verdicts = {}
+# canonical project name: installed version or None
+_versions = {}
+# mtimes of all package directories the verdicts are based on
+_site_stamp = None
+_cache_lock = threading.Lock()
+_cache_loaded = False
+
+# verdicts survive restarts as long as site-packages is unchanged
+CACHE_FILE = "./log/pythonbinding_deps.json"
+
+# directory with wheels, when set pip installs from it only and never accesses the index
+wheelhouse = None
+
+def _package_dirs():
+    # only directories pip installs into, the mtime of source directories changes with every .pyc
+    dirs = set(p for p in sys.path if os.path.basename(p) in ("site-packages", "dist-packages"))
+    dirs.update(site.getsitepackages() if hasattr(site, "getsitepackages") else [])
+    dirs.add(site.getusersitepackages())
+    return sorted(dirs)
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _check_site_stamp():
+    """Drop cached versions and verdicts if a package was installed or removed,
+    pip adds/removes the .dist-info directory which changes the directory mtime.
+    """
+    global _site_stamp
+    stamp = tuple((path, _mtime(path)) for path in _package_dirs())
+    if stamp != _site_stamp:
+        if _site_stamp is not None:
+            logger.debug("site-packages changed, dependency cache cleared")
+        _site_stamp = stamp
+        _versions.clear()
+        _verdicts.clear()
+
+def _manifest(module):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), module, 'manifest.json')
+    mtime = _mtime(path)
+    if mtime is None:
+        return _bundled_manifest(module)
+    cached = _manifests.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r') as f:
+            cached = (mtime, json.load(f))
+        _manifests[path] = cached
+    return cached[1]
+
+def _bundled_manifest(module):
+    # running from the zipapp bundle, the manifest can't change while running
+    if module not in _manifests:
+        try:
+            data = pkgutil.get_data(__package__ + "." + module, "manifest.json")
+        except (ImportError, OSError):
+            data = None
+        if data is None:
+            raise FileNotFoundError(module + "/manifest.json")
+        _manifests[module] = (None, json.loads(data))
+    return _manifests[module][1]
+
+def _manifest_requirements(module):
+    return _manifest(module).get("requirements", [])
+
+def manifest_value(module, key, default=None):
+    """Returns an entry of the module manifest, default if the manifest or entry doesn't exist"""
+    try:
+        return _manifest(module).get(key, default)
+    except (OSError, ValueError):
+        return default
+
+def _load_cache():
+    global _site_stamp, _cache_loaded
+    _cache_loaded = True
+    try:
+        with open(CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return
+    stamp = tuple((path, _mtime(path)) for path in _package_dirs())
+    if tuple(tuple(entry) for entry in cache.get("site_stamp", [])) != stamp:
+        logger.debug("site-packages changed since last start, dependency cache not used")
+        return
+    _site_stamp = stamp
+    for module, requirements in cache.get("modules", {}).items():
+        try:
+            if _manifest_requirements(module) == requirements:
+                _verdicts[module] = True
+        except (OSError, ValueError):
+            pass
+
+def _save_cache():
+    modules = {}
+    for module, deps_ok in _verdicts.items():
+        if deps_ok:
+            try:
+                modules[module] = _manifest_requirements(module)
+            except FileNotFoundError:
+                modules[module] = []
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        with open(CACHE_FILE, 'w') as f:
+            json.dump({"site_stamp": _site_stamp, "modules": modules}, f)
+    except OSError:
+        logger.debug("Failed to write " + CACHE_FILE, exc_info=True)
+
+def _installed_version(name):
+    key = canonicalize_name(name)
+    if key not in _versions:
+        try:
+            _versions[key] = version(name)
+        except PackageNotFoundError:
+            _versions[key] = None
+    return _versions[key]
+
 def check_dependencies(module):
     """Checks the manifest of a specific module and check installation
-    of dependencies
+    of dependencies. The result is cached until site-packages changes.
     """
-    try:
-        with open('FHEM/bindings/python/lib/' + module + '/manifest.json', 'r') as f:
-            manifest = json.load(f)
-
-            if "requirements" in manifest:
-                for req in manifest["requirements"]:
-                    logger.debug("Check requirement: " + req);
-                    if is_installed(req) == False:
-                      logger.debug("  NOK")
-                      return False
-                    else:
-                      logger.debug("  OK")
-    except FileNotFoundError:
-        pass
+    with _cache_lock:
+        if not _cache_loaded:
+            _load_cache()
+        _check_site_stamp()
+        if module in _verdicts:
+            return _verdicts[module]
+        try:
+            requirements = _manifest_requirements(module)
+        except FileNotFoundError:
+            return True
 
-    return True
+        deps_ok = True
+        for req in requirements:
+            logger.debug("Check requirement: " + req);
+            if is_installed(req) == False:
+              logger.debug("  NOK")
+              deps_ok = False
+              break
+            else:
+              logger.debug("  OK")
+        _verdicts[module] = deps_ok
+        if deps_ok:
+            _save_cache()
+        return deps_ok
+
+def missing_requirements(modules):
+    """Returns the requirements of all modules which aren't installed,
+    each requirement only once.
+    """
+    missing = []
+    with _cache_lock:
+        _check_site_stamp()
+        for module in modules:
+            try:
+                requirements = _manifest_requirements(module)
+            except FileNotFoundError:
+                continue
+            for req in requirements:
+                if req not in missing and is_installed(req) == False:
+                    missing.append(req)
+    return missing
+
+def install_requirements(requirements):
+    """Install all requirements with one pip call, pip resolves them
+    together. If that fails, install them one by one so that a single
+    broken requirement doesn't stop the others.
+    Returns True if all requirements were installed.
+    """
+    if len(requirements) == 0:
+        return True
+    if install_package(requirements, find_links=wheelhouse, no_index=wheelhouse is not None):
+        return True
+
+    all_ok = True
+    for req in requirements:
+        if is_installed(req):
+            continue
+        inst_tries = 0
+        while inst_tries < 3:
+            if install_package(req, find_links=wheelhouse, no_index=wheelhouse is not None):
+                break
+            inst_tries += 1
+        else:
+            all_ok = False
+    return all_ok
 
 def check_and_install_dependencies(module):
     """Checks the manifest of a specific module and starts installation
     of dependencies
     """
-    try:
-        with open('FHEM/bindings/python/lib/' + module + '/manifest.json', 'r') as f:
-            manifest = json.load(f)
-
-            if "requirements" in manifest:
-                for req in manifest["requirements"]:
-                    if is_installed(req) == False:
-                        inst_tries = 0
-                        while inst_tries < 3:
-                            if install_package(req):
-                                break
-                            inst_tries += 1
-    except FileNotFoundError:
-        pass
-
-    return
+    install_requirements(missing_requirements([module]))
 
 def is_installed(package: str) -> bool:
     """Check if a package is installed and will be loaded when we import it.
@@ -70,17 +236,20 @@ def is_installed(package: str) -> bool:
     Returns False when the package is not installed or doesn't meet req.
     """
     try:
-        req = pkg_resources.Requirement.parse(package)
-    except ValueError:
+        req = Requirement(package)
+    except InvalidRequirement:
         # This is a zip file. We no longer use this in Home Assistant,
         # leaving it in for custom components.
-        req = pkg_resources.Requirement.parse(urlparse(package).fragment)
+        req = Requirement(urlparse(package).fragment)
 
-    try:
-        ret = version(req.project_name) in req
-        return ret
-    except PackageNotFoundError:
+    if req.marker is not None and not req.marker.evaluate():
+        # not needed on this platform/python version
+        return True
+
+    installed = _installed_version(req.name)
+    if installed is None:
         return False
+    return req.specifier.contains(installed, prereleases=True)
 
 
 def install_package(
@@ -90,14 +259,18 @@ def install_package(
     constraints: [str] = None,
     find_links: [str] = None,
     no_cache_dir: [bool] = False,
+    no_index: [bool] = False,
 ) -> bool:
-    """Install a package on PyPi. Accepts pip compatible package strings.
+    """Install a package on PyPi. Accepts pip compatible package strings
+    or a list of them, which are installed with one pip call.
     Return boolean if install successful.
     """
+    packages = [package] if isinstance(package, str) else list(package)
+    package = ", ".join(packages)
     # Not using 'import pip; pip.main([])' because it breaks the logger
     logger.info("Attempting install of %s", package)
     env = os.environ.copy()
-    args = [sys.executable, "-m", "pip", "install", "--quiet", package]
+    args = [sys.executable, "-m", "pip", "install", "--quiet"] + packages
     if no_cache_dir:
         args.append("--no-cache-dir")
     if upgrade:
@@ -106,6 +279,8 @@ def install_package(
         args += ["--constraint", constraints]
     if find_links is not None:
         args += ["--find-links", find_links, "--prefer-binary"]
+    if no_index:
+        args.append("--no-index")
     if target:
         assert not is_virtual_env()
         # This only works if not running in venv
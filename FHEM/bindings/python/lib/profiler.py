@@ -0,0 +1,188 @@
+
+import asyncio
+import collections
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+from . import fhem
+from . import stats
+from . import loop_watchdog
+
+logger = logging.getLogger(__name__)
+
+# on-demand profiling started with: set pyBinding profile <device|type|all> <seconds>
+#   all: cProfile of everything which runs on the event loop
+#   device or module type: statistical sampler of the module code on the
+#   event loop and of executor jobs submitted by the module
+MAX_SECONDS = 600
+SAMPLE_INTERVAL = 0.005
+TOP = 5
+
+running = None
+
+def output_file(target, ext):
+    os.makedirs("./log", exist_ok=True)
+    return os.path.join("./log", time.strftime("pythonbinding-profile-" + target + "-%Y%m%d-%H%M%S." + ext))
+
+def frame_name(code, lineno):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{lineno})"
+
+class SamplingProfiler(threading.Thread):
+
+    def __init__(self, pythontype, device, instances):
+        super().__init__(name="pythonbinding-profiler", daemon=True)
+        self.pythontype = pythontype
+        self.device = device
+        self.instances = instances
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.ticks = 0
+        self.stopped = threading.Event()
+
+    def matches(self, owner):
+        return owner[0] == self.pythontype and (self.device is None or owner[1] == self.device)
+
+    def run(self):
+        executor = stats.executor
+        while not self.stopped.is_set():
+            frames = sys._current_frames()
+            for tid, frame in frames.items():
+                if tid == self.ident:
+                    continue
+                if executor is not None and tid in executor.thread_owner:
+                    # jobs started before the profiler (e.g. run_blocking_task of object_detection)
+                    # have no owner, the module code is on the stack of the thread
+                    owner = executor.thread_owner.get(tid) or loop_watchdog.attribute(frame, self.instances)
+                    if not self.matches(owner):
+                        continue
+                    prefix = ["[executor]"]
+                elif self.matches(loop_watchdog.attribute(frame, self.instances)):
+                    prefix = []
+                else:
+                    continue
+                stack = []
+                f = frame
+                while f is not None:
+                    stack.append(frame_name(f.f_code, f.f_lineno))
+                    f = f.f_back
+                self.stacks[";".join(prefix + stack[::-1])] += 1
+                self.samples += 1
+            del frames
+            self.ticks += 1
+            time.sleep(SAMPLE_INTERVAL)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def summary(self, count):
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, cnt in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += cnt
+            for name in set(frames):
+                total[name] += cnt
+        return own.most_common(count), total.most_common(count)
+
+    def write(self, target):
+        folded = output_file(target, "folded")
+        with open(folded, "w") as f:
+            for stack, cnt in self.stacks.most_common():
+                f.write(f"{stack} {cnt}\n")
+        own, total = self.summary(30)
+        with open(output_file(target, "txt"), "w") as f:
+            f.write(f"{self.samples} samples in {self.ticks} ticks of {SAMPLE_INTERVAL * 1000}ms\n\n")
+            f.write("self samples:\n")
+            for name, cnt in own:
+                f.write(f"{cnt:>8}  {name}\n")
+            f.write("\ninclusive samples:\n")
+            for name, cnt in total:
+                f.write(f"{cnt:>8}  {name}\n")
+        top = ", ".join(f"{name} {round(cnt * 100 / max(1, self.samples))}%" for name, cnt in own[:TOP])
+        return folded, top or "no samples"
+
+class FullProfiler:
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, target):
+        filename = output_file(target, "prof")
+        self.profile.dump_stats(filename)
+        out = io.StringIO()
+        ps = pstats.Stats(self.profile, stream=out).sort_stats("cumulative")
+        ps.print_stats(40)
+        with open(output_file(target, "txt"), "w") as f:
+            f.write(out.getvalue())
+        top = []
+        ps.sort_stats("tottime")
+        for func in ps.fcn_list:
+            if len(top) == TOP:
+                break
+            if "of 'select." in func[2]:
+                # event loop waiting for IO
+                continue
+            cc, nc, tt, ct, callers = ps.stats[func]
+            top.append(f"{func[2]} ({os.path.basename(func[0])}:{func[1]}) {round(tt * 1000)}ms")
+        return filename, ", ".join(top)
+
+async def update_readings(name, state, top=None, filename=None):
+    hash = {"NAME": name}
+    await fhem.readingsBeginUpdate(hash)
+    if top is not None:
+        await fhem.readingsBulkUpdate(hash, "profile_top", top)
+    if filename is not None:
+        await fhem.readingsBulkUpdate(hash, "profile_file", filename)
+    await fhem.readingsBulkUpdate(hash, "profile_state", state)
+    await fhem.readingsEndUpdate(hash, 1)
+
+async def run_profile(name, target, seconds, profiler):
+    global running
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+        running = None
+    filename, top = profiler.write(target)
+    logger.info(f"Profile of {target} written to {filename}: {top}")
+    await update_readings(name, "done", top, filename)
+
+def stop_executor_attribution(task):
+    if stats.executor is not None:
+        stats.executor.owner_fn = None
+
+def start(hash, target, seconds, instances):
+    """start profiling, hash is the BindingsIo device which gets the readings"""
+    global running
+    if running is not None:
+        return "Profiler is already running"
+    seconds = min(float(seconds), MAX_SECONDS)
+    if target == "all":
+        profiler = FullProfiler()
+    elif target in instances:
+        pythontype = instances[target].__class__.__module__.split(".")[1]
+        profiler = SamplingProfiler(pythontype, target, instances)
+    elif target in [instance.__class__.__module__.split(".")[1] for instance in instances.values()]:
+        profiler = SamplingProfiler(target, None, instances)
+    else:
+        return "Unknown device or module type " + target
+    if stats.executor is not None:
+        stats.executor.owner_fn = lambda frame: loop_watchdog.attribute(frame, instances)[:2]
+    profiler.start()
+    running = asyncio.create_task(run_profile(hash["NAME"], target, seconds, profiler))
+    running.add_done_callback(stop_executor_attribution)
+    asyncio.create_task(update_readings(hash["NAME"], f"running {target} for {seconds}s"))
+    return ""
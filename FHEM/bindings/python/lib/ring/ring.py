@@ -25,6 +25,9 @@ class ring:
         self._lastrecording_url = ""
         self._livestreamjson = ""
         self._snapshot = None
+        self._update_job = None
+        self._dings_job = None
+        self._alert_active = 0
         self._attr_list = {
             "deviceUpdateInterval": { "default": 300, "format": "int" },
             "dingPollInterval": { "default": 2, "format": "int" }
@@ -49,7 +52,7 @@ class ring:
 
         await utils.handle_define_attr(self._attr_list, self, hash)
 
-        asyncio.create_task(self.ring_login())
+        utils.create_task(hash, self.ring_login())
         return ""
 
     async def ring_login(self):
@@ -90,42 +93,58 @@ class ring:
 
             await self.update_readings()
 
-            asyncio.create_task(self.update_dings_loop())
-
-            while True:
-                try:
-                    await utils.run_blocking(functools.partial(self.poll_device))
-                    await self.update_readings()
-                    # handle history
-                    if len(self._history) > 0:
-                        i = 1
-                        for event in self._history:
-                            await self.update_history_readings(event, i)
-                            i += 1
-                except:
-                    self.logger.exception("Failed to poll devices")
-                await asyncio.sleep(self._attr_deviceUpdateInterval)
+            # login might run again (new password, 2fa code), restart jobs
+            self.cancel_jobs()
+            self._dings_job = utils.schedule_periodic(self.hash, self._attr_dingPollInterval, self.update_dings, jitter=0)
+            # poll every deviceUpdateInterval while there are new events, back off up to 4x without
+            self._update_job = utils.AdaptivePoller(self.hash, self.update_device, self._attr_deviceUpdateInterval,
+                4 * self._attr_deviceUpdateInterval, initial_delay=self._attr_deviceUpdateInterval)
         except:
             self.logger.exception("Failed to update devices")
 
-    async def update_dings_loop(self):
-        alert_active = 0
-        while True:
-            try:
-                await utils.run_blocking(functools.partial(self.poll_dings))
-                # handle alerts
-                alerts = self._ring.active_alerts()
-                self.logger.debug("Received dings: " + str(alerts))
-                if len(alerts) > 0:
-                    alert_active = 1
-                    for alert in alerts:
-                        await self.update_alert_readings(alert)
-                elif alert_active == 1:
-                    alert_active = 0
-                    await fhem.readingsSingleUpdateIfChanged(self.hash, "state", "connected", 1)
-            except:
-                self.logger.exception("Failed to poll dings...")
-            await asyncio.sleep(self._attr_dingPollInterval)
+    def cancel_jobs(self):
+        if self._update_job:
+            self._update_job.cancel()
+        if self._dings_job:
+            self._dings_job.cancel()
+
+    async def update_device(self):
+        try:
+            await utils.run_blocking(functools.partial(self.poll_device))
+            await self.update_readings()
+            # handle history
+            if len(self._history) > 0:
+                i = 1
+                for event in self._history:
+                    await self.update_history_readings(event, i)
+                    i += 1
+            return (self._lastrecording_url, [event["id"] for event in self._history])
+        except:
+            self.logger.exception("Failed to poll devices")
+
+    async def update_dings(self):
+        try:
+            await utils.run_blocking(functools.partial(self.poll_dings))
+            # handle alerts
+            alerts = self._ring.active_alerts()
+            self.logger.debug("Received dings: " + str(alerts))
+            if len(alerts) > 0:
+                self._alert_active = 1
+                for alert in alerts:
+                    await self.update_alert_readings(alert)
+            elif self._alert_active == 1:
+                self._alert_active = 0
+                await fhem.readingsSingleUpdateIfChanged(self.hash, "state", "connected", 1)
+        except:
+            self.logger.exception("Failed to poll dings...")
+
+    async def set_attr_deviceUpdateInterval(self, hash):
+        if self._update_job:
+            self._update_job.set_bounds(self._attr_deviceUpdateInterval, 4 * self._attr_deviceUpdateInterval)
+
+    async def set_attr_dingPollInterval(self, hash):
+        if self._dings_job:
+            self._dings_job.set_interval(self._attr_dingPollInterval)
 
     async def update_alert_readings(self, alert):
         await fhem.readingsBeginUpdate(self.hash)
@@ -217,13 +236,15 @@ class ring:
 
     # FHEM FUNCTION
     async def Undefine(self, hash):
+        self.cancel_jobs()
         return
 
     # FHEM FUNCTION
     async def Set(self, hash, args, argsh):
         set_list_conf = {
            "password": { "args": ["password"] },
-           "2fa_code": { "args": ["2facode"] }
+           "2fa_code": { "args": ["2facode"] },
+           **utils.ADAPTIVE_POLL_SET
         }
         return await utils.handle_set(set_list_conf, self, hash, args, argsh)
 
@@ -231,11 +252,15 @@ class ring:
         self._password = params['password']
         encrypted_password = utils.encrypt_string(self._password, self._reading_encryption_key)
         await fhem.readingsSingleUpdateIfChanged(self.hash, "password", encrypted_password, 1)
-        asyncio.create_task(self.ring_login())
+        utils.create_task(self.hash, self.ring_login())
+
+    async def set_pollFast(self, hash, params):
+        if self._update_job:
+            self._update_job.boost(params['seconds'])
 
     async def set_2fa_code(self, hash, params):
         self._2facode = params['2facode']
-        asyncio.create_task(self.ring_login())
+        utils.create_task(self.hash, self.ring_login())
 
     async def Attr(self, hash, args, argsh):
         return await utils.handle_attr(self._attr_list, self, hash, args, argsh)
\ No newline at end of file
@@ -0,0 +1,116 @@
+
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# warm restart: modules which implement snapshot()/restore() keep state that takes
+# long to rebuild (device lists, discovery results) over a restart of the binding,
+# one file per device, written on shutdown and read before Define
+SNAPSHOT_DIR = "./log/snapshots"
+# FHEM kills the binding 5s after SIGTERM, snapshot() of all devices runs in parallel
+SNAPSHOT_TIMEOUT = 2
+
+# snapshots taken in memory (set reload), used instead of the file
+_pending = {}
+
+def _path(name):
+    return os.path.join(SNAPSHOT_DIR, name + ".json")
+
+def _definition(hash):
+    # a snapshot belongs to the definition, not to the name (define args without the name)
+    return list(hash.get("defargs", [])[1:])
+
+async def take(name, instance, hash):
+    """snapshot of the instance, None if the module doesn't implement snapshot()"""
+    func = getattr(instance, "snapshot", None)
+    if func is None:
+        return None
+    try:
+        state = await asyncio.wait_for(func(), SNAPSHOT_TIMEOUT)
+    except Exception:
+        logger.exception(f"Snapshot of {name} failed")
+        return None
+    if state is None:
+        return None
+    return {"definition": _definition(hash), "saved": time.time(), "state": state}
+
+def keep(name, snapshot):
+    """restore the snapshot on the next Define of the device in this process"""
+    if snapshot is not None:
+        _pending[name] = snapshot
+
+def write(name, snapshot):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    tmp = _path(name) + ".tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, _path(name))
+    except (OSError, TypeError, ValueError):
+        logger.exception(f"Failed to write snapshot of {name}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    return True
+
+async def save_all(instances, definitions):
+    """writes the snapshots of all instances, returns the number of written snapshots"""
+    names = [name for name in instances if name in definitions]
+    snapshots = await asyncio.gather(*[take(name, instances[name], definitions[name]) for name in names])
+    count = 0
+    for name, snapshot in zip(names, snapshots):
+        if snapshot is not None and write(name, snapshot):
+            count += 1
+    return count
+
+def _read(name):
+    try:
+        with open(_path(name), "r") as f:
+            return json.load(f)
+    except OSError:
+        return None
+    except ValueError:
+        logger.warning(f"Snapshot of {name} is damaged, ignored")
+        return None
+
+async def restore(instance, hash):
+    """calls restore() of the instance with the last snapshot of the device, before Define"""
+    name = hash["NAME"]
+    snapshot = _pending.pop(name, None)
+    func = getattr(instance, "restore", None)
+    if func is None:
+        return False
+    if snapshot is None:
+        snapshot = _read(name)
+    if snapshot is None:
+        return False
+    if snapshot.get("definition") != _definition(hash):
+        logger.info(f"Snapshot of {name} belongs to another definition, ignored")
+        return False
+    try:
+        await asyncio.wait_for(func(hash, snapshot["state"]), SNAPSHOT_TIMEOUT)
+    except Exception:
+        logger.exception(f"Restore of {name} failed, defined without snapshot")
+        return False
+    logger.info(f"Restored {name} from snapshot of "
+        + time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot.get("saved", 0))))
+    return True
+
+def remove(name):
+    _pending.pop(name, None)
+    try:
+        os.remove(_path(name))
+    except OSError:
+        pass
+
+def rename(old_name, new_name):
+    if old_name in _pending:
+        _pending[new_name] = _pending.pop(old_name)
+    try:
+        os.replace(_path(old_name), _path(new_name))
+    except OSError:
+        pass
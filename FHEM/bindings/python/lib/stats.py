@@ -0,0 +1,282 @@
+
+import asyncio
+import concurrent.futures
+import math
+import os
+import re
+import resource
+import sys
+import threading
+import time
+
+# latency statistics for functions called by FHEM and commands sent to FHEM
+# histograms use logarithmic buckets, 4 per power of two, from 0.1ms to ~100s
+BUCKET_MIN = 0.0001
+BUCKETS_PER_OCTAVE = 4
+BUCKET_COUNT = 80
+
+CMD_RE = re.compile(r"\s*(\w+)")
+
+functions = {}
+commands = {}
+# websocket messages per direction and msgtype
+messages = {}
+connections = 0
+# pythontype -> (seconds, number of imported modules)
+import_times = {}
+started = time.time()
+
+def bucket_index(seconds):
+    if seconds <= BUCKET_MIN:
+        return 0
+    idx = int(math.log2(seconds / BUCKET_MIN) * BUCKETS_PER_OCTAVE) + 1
+    return min(idx, BUCKET_COUNT - 1)
+
+def bucket_upper(idx):
+    return BUCKET_MIN * 2 ** (idx / BUCKETS_PER_OCTAVE)
+
+class Histogram:
+
+    def __init__(self):
+        self.buckets = [0] * BUCKET_COUNT
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bucket_index(seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct):
+        if self.count == 0:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for idx, cnt in enumerate(self.buckets):
+            seen += cnt
+            if seen >= rank:
+                return min(bucket_upper(idx), self.max)
+        return self.max
+
+class Stat:
+
+    def __init__(self):
+        self.hist = Histogram()
+        self.inflight = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def start(self):
+        self.inflight += 1
+        return time.perf_counter()
+
+    def stop(self, start, error=False, timeout=False):
+        self.inflight -= 1
+        self.hist.observe(time.perf_counter() - start)
+        if timeout:
+            self.timeouts += 1
+        elif error:
+            self.errors += 1
+
+    def to_dict(self):
+        return {
+            "count": self.hist.count,
+            "inflight": self.inflight,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "sum": self.hist.sum,
+            "p50": self.hist.percentile(50),
+            "p95": self.hist.percentile(95),
+            "p99": self.hist.percentile(99),
+            "max": self.hist.max
+        }
+
+def function_stat(pythontype, function):
+    key = (pythontype or "binding", function)
+    if key not in functions:
+        functions[key] = Stat()
+    return functions[key]
+
+def command_name(cmd):
+    m = CMD_RE.match(cmd)
+    return m.group(1) if m else "unknown"
+
+def command_stat(name):
+    if name not in commands:
+        commands[name] = Stat()
+    return commands[name]
+
+# measures one function call from FHEM
+class FunctionTimer:
+
+    def __init__(self, hash):
+        self.stat = function_stat(hash.get("PYTHONTYPE"), hash.get("function"))
+        self.start = self.stat.start()
+        self.error = False
+        self.timeout = False
+
+    def stop(self):
+        self.stat.stop(self.start, self.error, self.timeout)
+
+def count_message(direction, msgtype):
+    key = (direction, msgtype)
+    messages[key] = messages.get(key, 0) + 1
+
+def count_connection():
+    global connections
+    connections += 1
+
+def reconnects():
+    return max(0, connections - 1)
+
+# measures how late the event loop wakes up a sleeping task
+class LoopLag:
+
+    INTERVAL = 0.5
+
+    def __init__(self):
+        self.hist = Histogram()
+        self.last = 0
+        self.task = None
+        self._window_max = 0
+        self._window_sum = 0
+        self._window_count = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_event_loop().create_task(self.run())
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.INTERVAL)
+            self.last = max(0, time.perf_counter() - start - self.INTERVAL)
+            self.hist.observe(self.last)
+            self._window_max = max(self._window_max, self.last)
+            self._window_sum += self.last
+            self._window_count += 1
+
+    def read_window(self):
+        """max and mean lag since the last call"""
+        res = {
+            "last_ms": round(self.last * 1000, 3),
+            "max_ms": round(self._window_max * 1000, 3),
+            "mean_ms": round(self._window_sum / self._window_count * 1000, 3) if self._window_count else 0
+        }
+        self._window_max = 0
+        self._window_sum = 0
+        self._window_count = 0
+        return res
+
+loop_lag = LoopLag()
+
+# default executor of the event loop, counts busy threads and queue wait time
+class InstrumentedExecutor(concurrent.futures.ThreadPoolExecutor):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # optional function(frame) -> owner of the job, used by the profiler
+        self.owner_fn = None
+        # thread ident -> owner of the running job, None if it was submitted without owner_fn
+        self.thread_owner = {}
+        self.busy = 0
+        self.queued = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.wait = Histogram()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        submitted = time.perf_counter()
+        owner = self.owner_fn(sys._getframe(1)) if self.owner_fn else None
+        with self._lock:
+            self.queued += 1
+
+        def run():
+            start = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.busy += 1
+                self.wait.observe(start - submitted)
+            self.thread_owner[threading.get_ident()] = owner
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.thread_owner.pop(threading.get_ident(), None)
+                with self._lock:
+                    self.busy -= 1
+                    self.completed += 1
+                    self.busy_seconds += time.perf_counter() - start
+
+        return super().submit(run)
+
+executor = None
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # peak instead of current on systems without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def process_start():
+    # includes interpreter startup and imports, which dominate cold starts
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return started
+
+process_started = process_start()
+# startup phase -> seconds since process start
+startup = {}
+
+def mark_startup(phase):
+    if phase not in startup:
+        startup[phase] = time.time() - process_started
+
+def format_startup():
+    return ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup.items())
+
+def install_executor(loop):
+    global executor
+    # run_blocking jobs of the modules share it, some of them run as long as the device
+    # (object_detection streams), threads are only started when needed
+    executor = InstrumentedExecutor(max_workers=32, thread_name_prefix="pybinding")
+    loop.set_default_executor(executor)
+
+def reset():
+    global started
+    functions.clear()
+    commands.clear()
+    started = time.time()
+
+def inflight():
+    return {
+        "functions": sum(s.inflight for s in functions.values()),
+        "commands": sum(s.inflight for s in commands.values())
+    }
+
+def format_table():
+    lines = []
+    header = "{:<45} {:>8} {:>6} {:>6} {:>6} {:>9} {:>9} {:>9} {:>9}".format(
+        "", "count", "infl", "tmout", "err", "p50 ms", "p95 ms", "p99 ms", "max ms")
+    for title, table, keyfn in [
+            ("functions", functions, lambda k: k[0] + ":" + k[1]),
+            ("commands", commands, lambda k: k)]:
+        lines.append(title + header[len(title):])
+        for key in sorted(table, key=keyfn):
+            s = table[key].to_dict()
+            lines.append("{:<45} {:>8} {:>6} {:>6} {:>6} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                keyfn(key)[:45], s["count"], s["inflight"], s["timeouts"], s["errors"],
+                s["p50"] * 1000, s["p95"] * 1000, s["p99"] * 1000, s["max"] * 1000))
+        lines.append("")
+    lines.append("collected since " + time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started)))
+    return "\n".join(lines)
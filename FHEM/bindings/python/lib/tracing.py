@@ -0,0 +1,146 @@
+
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import time
+
+# end-to-end tracing of function calls from FHEM
+# the trace id is the id of the function message (waitingForId in BindingsIo),
+# all commands issued while handling the call carry it as traceId
+enabled = False
+traces = collections.deque(maxlen=500)
+current = contextvars.ContextVar("pythonbinding_trace", default=None)
+
+class Trace:
+
+    def __init__(self, hash, received):
+        self.id = hash["id"]
+        self.name = hash["NAME"]
+        self.pythontype = hash.get("PYTHONTYPE")
+        self.function = hash["function"]
+        self.start = received
+        self.end = None
+        self.replied = None
+        self.spans = []
+        if "sent" in hash:
+            # sent is set by BindingsIo_Write, same host clock required
+            self.start = min(received, hash["sent"])
+            self.add("fhem_to_python", hash["sent"], received)
+        self.add("queue", received, time.time())
+
+    def add(self, name, start, end, **args):
+        if self.end is not None:
+            # finished and stored, e.g. a Span which outlived the call
+            return
+        self.spans.append({"name": name, "start": start, "end": end, "args": args})
+
+    def finish(self):
+        self.end = time.time()
+        traces.append(self)
+
+    def to_dict(self):
+        return {
+            "traceId": self.id,
+            "NAME": self.name,
+            "PYTHONTYPE": self.pythontype,
+            "function": self.function,
+            "start": self.start,
+            "duration_ms": round((self.end - self.start) * 1000, 3),
+            "reply_ms": round((self.replied - self.start) * 1000, 3) if self.replied else None,
+            "spans": [dict(span, duration_ms=round((span["end"] - span["start"]) * 1000, 3))
+                for span in self.spans]
+        }
+
+def start_trace(hash, received):
+    if not enabled:
+        return None
+    trace = Trace(hash, received)
+    current.set(trace)
+    return trace
+
+def active():
+    # tasks created during a call inherit its context, but the trace ends with the call
+    trace = current.get()
+    if trace is None or trace.end is not None:
+        return None
+    return trace
+
+def detached(function, *args):
+    """Calls function (e.g. asyncio.create_task, call_later) without the trace of the
+    current call, tasks and callbacks created by it outlive the call"""
+    if current.get() is None:
+        return function(*args)
+    def run():
+        current.set(None)
+        return function(*args)
+    return contextvars.copy_context().run(run)
+
+def trace_id():
+    trace = active()
+    return trace.id if trace else None
+
+def mark_reply():
+    trace = active()
+    if trace and trace.replied is None:
+        trace.replied = time.time()
+
+class Span:
+
+    def __init__(self, trace, name, args):
+        self.trace = trace
+        self.name = name
+        self.args = args
+        self.start = time.time()
+
+    def child(self, name, start, end, **args):
+        self.trace.add(name, start, end, **args)
+
+@contextlib.contextmanager
+def span(name, **args):
+    trace = active()
+    if trace is None:
+        yield None
+        return
+    sp = Span(trace, name, args)
+    try:
+        yield sp
+    finally:
+        trace.add(name, sp.start, time.time(), **sp.args)
+
+def find(trace_id):
+    for trace in traces:
+        if str(trace.id) == str(trace_id):
+            return trace
+    return None
+
+def format_list(count=20):
+    lines = ["{:>10} {:<30} {:<25} {:>10} {:>10}".format("traceId", "device", "function", "reply ms", "total ms")]
+    for trace in list(traces)[-count:]:
+        t = trace.to_dict()
+        lines.append("{:>10} {:<30} {:<25} {:>10} {:>10}".format(
+            t["traceId"], t["NAME"][:30], (str(t["PYTHONTYPE"]) + ":" + t["function"])[:25],
+            t["reply_ms"] if t["reply_ms"] is not None else "-", t["duration_ms"]))
+    return "\n".join(lines)
+
+def chrome_trace():
+    """all recorded traces in Chrome trace event format (chrome://tracing, Perfetto)"""
+    events = []
+    for trace in traces:
+        tid = trace.name
+        events.append({"name": f"{trace.pythontype}:{trace.function}", "cat": "function", "ph": "X",
+            "ts": trace.start * 1e6, "dur": (trace.end - trace.start) * 1e6, "pid": 1, "tid": tid,
+            "args": {"traceId": trace.id}})
+        for span in trace.spans:
+            events.append({"name": span["name"], "cat": span["name"].split(":")[0], "ph": "X",
+                "ts": span["start"] * 1e6, "dur": (span["end"] - span["start"]) * 1e6, "pid": 1, "tid": tid,
+                "args": dict(span["args"], traceId=trace.id)})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def export(directory="./log"):
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, time.strftime("pythonbinding-trace-%Y%m%d-%H%M%S.json"))
+    with open(filename, "w") as f:
+        json.dump(chrome_trace(), f)
+    return filename
@@ -1,37 +1,488 @@
 
 import asyncio
+import importlib.util
 import logging
-import concurrent.futures
-from cryptography.fernet import Fernet
+import random
+import sys
+import time
+import threading
+import weakref
 from codecs import encode, decode
 from functools import reduce
 import base64
 from . import fhem
+from . import tracing
 
 def encrypt_string(plain_text, fhem_unique_id):
+  # imported here, utils is also used by the binding itself
+  from cryptography.fernet import Fernet
   key = base64.b64encode(fhem_unique_id.encode('utf-8'))
   cipher_suite = Fernet(key)
   encrypted_text = cipher_suite.encrypt(plain_text.encode("utf-8"))
   return reduce(encode, ('zlib', 'base64'),encrypted_text).decode("utf-8")
 
 def decrypt_string(encrypted_text, fhem_unique_id):
+  from cryptography.fernet import Fernet
   key = base64.b64encode(fhem_unique_id.encode('utf-8'))
   encrypted_text = encrypted_text.encode("utf-8")
   uncompressed_text = reduce(decode, ('base64', 'zlib'),encrypted_text)
   cipher_suite = Fernet(key)
   return cipher_suite.decrypt(uncompressed_text).decode("utf-8")
 
+def lazy_import(name):
+  """Import module on first attribute access, use it for heavy dependencies
+  which are only needed by rarely used functions:
+    youtube_dl = utils.lazy_import("youtube_dl")
+  """
+  if name in sys.modules:
+    return sys.modules[name]
+  spec = importlib.util.find_spec(name)
+  if spec is None:
+    raise ImportError("No module named " + name, name=name)
+  loader = importlib.util.LazyLoader(spec.loader)
+  spec.loader = loader
+  module = importlib.util.module_from_spec(spec)
+  sys.modules[name] = module
+  loader.exec_module(module)
+  return module
+
 async def run_blocking(function):
+  # default executor of the binding, its jobs show up in the executor stats and profiles
   try:
-    with concurrent.futures.ThreadPoolExecutor() as pool:
-      return await asyncio.get_event_loop().run_in_executor(
-          pool, function)
+    return await asyncio.get_event_loop().run_in_executor(None, function)
   except:
     logging.getLogger(__name__).exception("Error in asyncio thread")
     raise
 
 def run_blocking_task(function):
-  return asyncio.create_task(run_blocking(function))
+  return tracing.detached(asyncio.create_task, run_blocking(function))
+
+# hierarchical timer wheel, each level has SLOTS slots and one slot of a
+# level covers a whole rotation of the level below
+class TimerWheel:
+
+  SLOTS = 64
+  LEVELS = 4
+
+  def __init__(self):
+    self.current_tick = 0
+    self.count = 0
+    self.wheels = [[[] for _ in range(self.SLOTS)] for _ in range(self.LEVELS)]
+
+  def add(self, expire_tick, entry):
+    self.count += 1
+    self._insert(max(expire_tick, self.current_tick + 1), entry)
+
+  def _insert(self, expire_tick, entry):
+    delta = expire_tick - self.current_tick
+    level = 0
+    span = self.SLOTS
+    while delta >= span and level < self.LEVELS - 1:
+      level += 1
+      span *= self.SLOTS
+    slot = (expire_tick // (span // self.SLOTS)) % self.SLOTS
+    self.wheels[level][slot].append((expire_tick, entry))
+
+  def advance(self):
+    """Move one tick forward and return all entries which expired"""
+    self.current_tick += 1
+    # cascade entries of higher levels down when a lower level wrapped
+    span = 1
+    for level in range(1, self.LEVELS):
+      span *= self.SLOTS
+      if self.current_tick % span != 0:
+        break
+      slot = (self.current_tick // span) % self.SLOTS
+      entries = self.wheels[level][slot]
+      self.wheels[level][slot] = []
+      for expire_tick, entry in entries:
+        self._insert(expire_tick, entry)
+    slot = self.current_tick % self.SLOTS
+    expired = self.wheels[0][slot]
+    self.wheels[0][slot] = []
+    self.count -= len(expired)
+    return [entry for expire_tick, entry in expired]
+
+class ScheduledJob:
+
+  def __init__(self, scheduler, owner, interval, function, jitter, coalesce):
+    self._scheduler = scheduler
+    self.owner = owner
+    self.interval = interval
+    self.function = function
+    self.jitter = jitter
+    self.coalesce = coalesce
+    self.paused = False
+    self.cancelled = False
+    self._task = None
+    # generation of the wheel entry, outdated entries are ignored
+    self._generation = 0
+
+  @property
+  def running(self):
+    return self._task is not None and not self._task.done()
+
+  def cancel(self):
+    self.cancelled = True
+    self._generation += 1
+    if self.running:
+      self._task.cancel()
+    self._scheduler._remove(self)
+
+  def pause(self):
+    self.paused = True
+    self._generation += 1
+
+  def resume(self):
+    if self.paused and not self.cancelled:
+      self.paused = False
+      self._scheduler._arm(self, self.interval)
+
+  def set_interval(self, interval):
+    if interval == self.interval:
+      return
+    self.interval = interval
+    if not self.paused and not self.cancelled:
+      self._scheduler._arm(self, interval)
+
+  def run_now(self):
+    """Run the job on the next tick and continue with the interval afterwards"""
+    if not self.paused and not self.cancelled:
+      self._scheduler._arm(self, 0)
+
+  def _fire(self, generation):
+    if generation != self._generation or self.paused or self.cancelled:
+      return
+    self._scheduler._arm(self, self.interval)
+    # skip this run if the previous one is still running
+    if not self.running:
+      self._task = asyncio.create_task(self._run())
+
+  async def _run(self):
+    try:
+      await self.function()
+    except asyncio.CancelledError:
+      raise
+    except Exception:
+      logging.getLogger(__name__).exception(f"Scheduled job {self.owner}:{getattr(self.function, '__name__', '')} failed")
+
+class Scheduler:
+  """Runs periodic jobs of all devices from one timer wheel instead of
+  one sleeping task per device"""
+
+  TICK = 0.5
+
+  def __init__(self):
+    self.wheel = TimerWheel()
+    self.jobs = {}
+    self._driver = None
+    self._start = 0
+
+  def schedule(self, owner, interval, function, jitter=0.1, coalesce=False, initial_delay=0):
+    job = ScheduledJob(self, owner, interval, function, jitter, coalesce)
+    self.jobs.setdefault(owner, []).append(job)
+    if jitter > 0 and not coalesce:
+      initial_delay += random.uniform(0, jitter * interval)
+    self._arm(job, initial_delay, aligned=False)
+    return job
+
+  def cancel_owner(self, owner):
+    for job in list(self.jobs.get(owner, [])):
+      job.cancel()
+
+  def rename_owner(self, old_owner, new_owner):
+    if old_owner in self.jobs:
+      jobs = self.jobs.pop(old_owner)
+      for job in jobs:
+        job.owner = new_owner
+      self.jobs.setdefault(new_owner, []).extend(jobs)
+
+  def job_count(self, owner=None):
+    if owner is None:
+      return sum(len(jobs) for jobs in self.jobs.values())
+    return len(self.jobs.get(owner, []))
+
+  def _remove(self, job):
+    if job.owner in self.jobs and job in self.jobs[job.owner]:
+      self.jobs[job.owner].remove(job)
+      if len(self.jobs[job.owner]) == 0:
+        del self.jobs[job.owner]
+
+  def _arm(self, job, delay, aligned=True):
+    loop = asyncio.get_event_loop()
+    if self._driver is None or self._driver.done():
+      self.wheel = TimerWheel()
+      self._start = loop.time()
+      # the driver runs the jobs of all devices, not part of the call which armed it
+      self._driver = tracing.detached(loop.create_task, self._run())
+    job._generation += 1
+    now_tick = self.wheel.current_tick
+    if aligned and job.coalesce and delay > 0:
+      # same interval jobs share the same ticks and fire together
+      interval_ticks = max(1, round(delay / self.TICK))
+      expire_tick = (now_tick // interval_ticks + 1) * interval_ticks
+    else:
+      if aligned and job.jitter > 0 and delay > 0:
+        delay += random.uniform(-job.jitter, job.jitter) * delay
+      expire_tick = now_tick + max(1, round(delay / self.TICK))
+    self.wheel.add(expire_tick, (job, job._generation))
+
+  async def _run(self):
+    loop = asyncio.get_event_loop()
+    # outdated entries of cancelled jobs don't keep the driver alive
+    while self.wheel.count > 0 and len(self.jobs) > 0:
+      next_tick_time = self._start + (self.wheel.current_tick + 1) * self.TICK
+      await asyncio.sleep(max(0, next_tick_time - loop.time()))
+      # catch up on all ticks in case the loop was blocked
+      while self.wheel.current_tick < int((loop.time() - self._start) / self.TICK):
+        for job, generation in self.wheel.advance():
+          job._fire(generation)
+
+scheduler = Scheduler()
+
+def schedule_periodic(hash, interval, function, jitter=0.1, coalesce=False, initial_delay=0):
+  """Run coroutine function every interval seconds. The job belongs to the
+  device and is cancelled on Undefine. Returns a handle which supports
+  cancel(), pause(), resume(), set_interval() and run_now().
+  jitter: random deviation of the interval (0.1 = +-10%)
+  coalesce: align the job with all other jobs of the same interval
+  """
+  return scheduler.schedule(hash["NAME"], interval, function, jitter, coalesce, initial_delay)
+
+def cancel_scheduled(name):
+  scheduler.cancel_owner(name)
+
+class TaskRegistry:
+  """Keeps track of all tasks of a device instance, they are cancelled
+  by the binding on Undefine"""
+
+  # seconds after Undefine until remaining tasks are reported as leaked
+  LEAK_CHECK_DELAY = 10
+
+  def __init__(self):
+    self.tasks = {}
+    self.owners = {}
+    self.leaked = []
+
+  def create_task(self, owner, coro):
+    task = tracing.detached(asyncio.create_task, coro)
+    self.tasks.setdefault(owner, set()).add(task)
+    self.owners[task] = owner
+    task.add_done_callback(self._task_done)
+    return task
+
+  def _task_done(self, task):
+    owner = self.owners.pop(task, None)
+    if owner in self.tasks:
+      self.tasks[owner].discard(task)
+      if len(self.tasks[owner]) == 0:
+        del self.tasks[owner]
+
+  def count(self, owner):
+    return len(self.tasks.get(owner, []))
+
+  def rename_owner(self, old_owner, new_owner):
+    if old_owner in self.tasks:
+      moved = self.tasks.pop(old_owner)
+      for task in moved:
+        self.owners[task] = new_owner
+      self.tasks.setdefault(new_owner, set()).update(moved)
+
+  def cancel_owner(self, owner, instance=None):
+    for task in list(self.tasks.get(owner, [])):
+      task.cancel()
+    if instance is not None:
+      asyncio.get_event_loop().call_later(
+        self.LEAK_CHECK_DELAY, self._check_leaks, owner, weakref.ref(instance))
+
+  def _check_leaks(self, owner, instance_ref):
+    # find tasks which still run code of the undefined instance, this
+    # includes tasks which were created without the registry
+    instance = instance_ref()
+    if instance is None:
+      return
+    for task in asyncio.all_tasks():
+      if task.done() or not self._task_uses(task, instance):
+        continue
+      logging.getLogger(__name__).warning(f"Task outlived device {owner}: {task.get_coro()}")
+      self.leaked.append({"owner": owner, "task": repr(task.get_coro()), "time": time.time()})
+      task.cancel()
+    # keep only the latest reports
+    del self.leaked[:-100]
+
+  def format_leaked(self):
+    if len(self.leaked) == 0:
+      return "No leaked tasks"
+    now = time.time()
+    lines = ["{:<25} {:>10}  {}".format("device", "age", "coroutine")]
+    for leak in reversed(self.leaked):
+      lines.append("{:<25} {:>9.0f}s  {}".format(leak["owner"][:25], now - leak["time"], leak["task"]))
+    return "\n".join(lines)
+
+  def _task_uses(self, task, instance):
+    coro = task.get_coro()
+    while coro is not None:
+      frame = getattr(coro, "cr_frame", None)
+      if frame is not None and frame.f_locals.get("self") is instance:
+        return True
+      coro = getattr(coro, "cr_await", None)
+    return False
+
+tasks = TaskRegistry()
+
+def create_task(hash, coro):
+  """Like asyncio.create_task, but the task belongs to the device and is
+  cancelled on Undefine"""
+  return tasks.create_task(hash["NAME"], coro)
+
+class AdaptivePoller:
+  """Calls the poll function with min_interval as long as the returned
+  state changes and backs off exponentially up to max_interval while it
+  stays the same. boost() forces fast polling, e.g. via set pollFast.
+  """
+
+  def __init__(self, hash, function, min_interval, max_interval, factor=2, initial_delay=0):
+    self._function = function
+    self.min_interval = min_interval
+    self.max_interval = max_interval
+    self.factor = factor
+    self.interval = min_interval
+    self._last_state = None
+    self._boost_until = 0
+    self.job = schedule_periodic(hash, min_interval, self._poll, initial_delay=initial_delay)
+
+  async def _poll(self):
+    self.observe(await self._function())
+
+  def observe(self, state):
+    if state != self._last_state:
+      self.interval = self.min_interval
+    else:
+      self.interval = min(self.interval * self.factor, self.max_interval)
+    self._last_state = state
+    self._update_job()
+
+  def boost(self, seconds):
+    self._boost_until = time.time() + seconds
+    self.interval = self.min_interval
+    self._update_job()
+    self.job.run_now()
+
+  def set_bounds(self, min_interval=None, max_interval=None):
+    if min_interval is not None:
+      self.min_interval = min_interval
+    if max_interval is not None:
+      self.max_interval = max_interval
+    self.interval = max(self.min_interval, min(self.interval, self.max_interval))
+    self._update_job()
+
+  def _update_job(self):
+    if time.time() < self._boost_until:
+      self.job.set_interval(self.min_interval)
+    else:
+      self.job.set_interval(self.interval)
+
+  def cancel(self):
+    self.job.cancel()
+
+# add to set_list_conf of modules which use AdaptivePoller
+ADAPTIVE_POLL_SET = {"pollFast": { "args": ["seconds"], "params": { "seconds": { "format": "int" }}}}
+
+class CircuitBreaker:
+  """Stops talking to an unreachable device for an exponentially growing,
+  jittered time. States:
+    closed - requests are allowed
+    open - requests are rejected until the retry time is reached
+    half-open - one probe request is allowed, success closes the breaker,
+      without result within probe_timeout the next probe is allowed
+  Thread safe, can be used in run_blocking functions.
+  """
+
+  CLOSED = "closed"
+  OPEN = "open"
+  HALF_OPEN = "half-open"
+
+  def __init__(self, name, failure_threshold=3, base_delay=5, max_delay=600, probe_timeout=60):
+    self.name = name
+    self.failure_threshold = failure_threshold
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.state = self.CLOSED
+    self.failures = 0
+    self.total_failures = 0
+    self.open_count = 0
+    self.open_until = 0
+    self.probe_timeout = probe_timeout
+    self.probe_until = 0
+    self._lock = threading.Lock()
+
+  def allow(self):
+    with self._lock:
+      if self.state == self.CLOSED:
+        return True
+      if self.state == self.OPEN and time.time() >= self.open_until:
+        self.state = self.HALF_OPEN
+        self.probe_until = time.time() + self.probe_timeout
+        return True
+      if self.state == self.HALF_OPEN and time.time() >= self.probe_until:
+        # the caller of the last probe never reported its result
+        self.probe_until = time.time() + self.probe_timeout
+        return True
+      return False
+
+  def record_success(self):
+    with self._lock:
+      self.state = self.CLOSED
+      self.failures = 0
+      self.open_count = 0
+
+  def record_failure(self):
+    with self._lock:
+      self.failures += 1
+      self.total_failures += 1
+      if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+        delay = min(self.max_delay, self.base_delay * (2 ** self.open_count))
+        # jitter avoids that all devices retry at the same time
+        delay = random.uniform(delay / 2, delay)
+        self.open_count += 1
+        self.open_until = time.time() + delay
+        self.state = self.OPEN
+        logging.getLogger(__name__).debug(f"{self.name}: circuit open, retry in {delay:.0f}s")
+
+  def retry_in(self):
+    if self.state == self.OPEN:
+      return max(0, self.open_until - time.time())
+    if self.state == self.HALF_OPEN:
+      return max(0, self.probe_until - time.time())
+    return 0
+
+  def call(self, function, *args, **kwargs):
+    """Call blocking function if allowed, raises CircuitOpenError otherwise"""
+    if not self.allow():
+      raise CircuitOpenError(f"{self.name}: circuit open, retry in {self.retry_in():.0f}s")
+    try:
+      ret = function(*args, **kwargs)
+    except Exception:
+      self.record_failure()
+      raise
+    self.record_success()
+    return ret
+
+  async def update_readings(self, hash):
+    if self.state == self.OPEN:
+      next_retry = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.open_until))
+    else:
+      next_retry = "-"
+    await fhem.readingsBeginUpdate(hash)
+    try:
+      await fhem.readingsBulkUpdateIfChanged(hash, "health_state", self.state)
+      await fhem.readingsBulkUpdateIfChanged(hash, "health_failures", self.total_failures)
+      await fhem.readingsBulkUpdateIfChanged(hash, "health_next_retry", next_retry)
+    finally:
+      await fhem.readingsEndUpdate(hash, 1)
+
+class CircuitOpenError(Exception):
+  pass
 
 # example config
 # attr_list = {
@@ -108,6 +559,7 @@ def convert2format(attr_val, target_format):
 #    "desiredTemp": { "args": ["temperature"], "options": "slider,10,1,30"},
 #    "holidayMode": { "args": ["start", "end", "temperature"], "params": { "start": {"default": "Monday"}, "end": {"default": "23:59"}}},
 #    "on": { "args": ["seconds"], "params": { "seconds": {"optional": True}}},
+#    "pollFast": { "args": ["seconds"], "params": { "seconds": {"format": "int"}}},
 #    "off": {}
 # }
 async def handle_set(set_list_conf, obj, hash, args, argsh):
@@ -157,6 +609,12 @@ async def handle_set(set_list_conf, obj, hash, args, argsh):
           elif "optional" not in cmd_def["params"][param] or cmd_def["params"][param]["optional"] is False:
             # no value found, check if optional
             return f"Required argument {param} missing."
+          if "format" in cmd_def["params"][param] and param in final_params:
+            try:
+              final_params[param] = convert2format(final_params[param], cmd_def["params"][param]["format"])
+            except (TypeError, ValueError):
+              return (f"Argument {param} must be {cmd_def['params'][param]['format']}. "
+                + f"Usage: set {hash['NAME']} {cmd} " + " ".join(cmd_def.get("args", [])))
 
       # call function with params
       if "function" in set_list_conf[cmd]:
@@ -26,9 +26,10 @@ class wienerlinien:
         self.hash = hash
         self._stopid = args[3]
         self.api = WienerlinienAPI(self._stopid)
-        self._updateloop = asyncio.create_task(self.update_loop())
+        # departures change every minute, back off if there is no new data
+        self._updateloop = utils.AdaptivePoller(hash, self.update, 30, 120)
         # delete all readings on define
-        asyncio.create_task(fhem.CommandDeleteReading(hash, hash['NAME'] + " .*"))
+        utils.create_task(hash, fhem.CommandDeleteReading(hash, hash['NAME'] + " .*"))
 
     # FHEM FUNCTION
     async def Undefine(self, hash):
@@ -39,18 +40,18 @@ class wienerlinien:
     # FHEM FUNCTION
     async def Set(self, hash, args, argsh):
         set_list_conf = {
-           "update": {}
+           "update": {},
+           **utils.ADAPTIVE_POLL_SET
         }
         return await utils.handle_set(set_list_conf, self, hash, args, argsh)
 
     async def set_update(self, hash):
-        asyncio.create_task(self.update())
+        utils.create_task(hash, self.update())
         return ""
 
-    async def update_loop(self):
-        while True:
-            await self.update()
-            await asyncio.sleep(30)
+    async def set_pollFast(self, hash, params):
+        self._updateloop.boost(params['seconds'])
+        return ""
 
     async def update(self):
         try:
@@ -93,7 +94,8 @@ class wienerlinien:
                 await fhem.CommandDeleteReading(self.hash, self.hash["NAME"] + " line_" + del_reading)
 
             self._last_data = flat_data
-            
+            return flat_data
+
         except Exception:
             self.logger.exception("Failed...")
             pass
@@ -0,0 +1,477 @@
+
+import asyncio
+import collections
+import json
+import logging
+import os
+import random
+import signal
+import sys
+import time
+import zlib
+import websockets
+from . import fhem
+from . import pkg_installer
+
+logger = logging.getLogger(__name__)
+
+# messages are JSON lines, images of object_detection are larger than the default limit
+MAX_LINE = 64 * 1024 * 1024
+# FHEM waits at most 10s for a function, commands of other devices aren't held back longer
+MAX_HOLD = 10
+# a worker which crashes within n seconds after its start is restarted with growing delay
+STABLE_AFTER = 60
+MAX_RESTART_DELAY = 60
+# last lines of the worker's stderr, used to find the crash reason
+STDERR_LINES = 30
+
+supervisor = None
+
+class PipeConnection:
+    # Replaces the websocket of PyBinding in a worker process,
+    # every message is one line on the pipe to the supervisor.
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    async def send(self, msg):
+        if isinstance(msg, str):
+            msg = msg.encode("utf-8")
+        self.writer.write(msg + b"\n")
+        await self.writer.drain()
+
+class LocalConnection:
+    # PyBinding of the supervisor process, its messages are held back
+    # the same way as the messages of the workers
+
+    def __init__(self, supervisor):
+        self.supervisor = supervisor
+
+    async def send(self, msg):
+        self.supervisor.from_worker(None, msg)
+
+    @property
+    def transport(self):
+        if self.supervisor.websocket is None:
+            return None
+        return self.supervisor.websocket.transport
+
+async def open_worker_pipes(protocol_fd):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MAX_LINE)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(0, "rb"))
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, os.fdopen(protocol_fd, "wb"))
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    return reader, PipeConnection(writer)
+
+def redirect_stdout():
+    # print() of modules must not end up in the message pipe, send it to the log instead
+    protocol_fd = os.dup(1)
+    os.dup2(2, 1)
+    sys.stdout = os.fdopen(1, "w", buffering=1)
+    return protocol_fd
+
+def describe_exit(code, stderr_tail):
+    if code < 0:
+        try:
+            reason = "killed by " + signal.Signals(-code).name
+        except ValueError:
+            reason = f"killed by signal {-code}"
+    else:
+        reason = f"exit code {code}"
+    # faulthandler prints e.g. "Fatal Python error: Segmentation fault"
+    for marker in ("Fatal Python error", "Error", "error"):
+        for line in reversed(stderr_tail):
+            if marker in line:
+                return reason + ": " + line.strip()[-200:]
+    return reason
+
+class Worker:
+
+    def __init__(self, supervisor, id, command, isolated=False):
+        self.supervisor = supervisor
+        self.id = id
+        self.command = command
+        self.isolated = isolated
+        self.process = None
+        # starting, running, restarting or stopped
+        self.state = "stopped"
+        # messages received while the process starts
+        self.backlog = []
+        self.started = None
+        self.messages_in = 0
+        self.messages_out = 0
+        self.restarts = 0
+        self.quick_crashes = 0
+        self.last_crash = None
+        self.stderr_tail = collections.deque(maxlen=STDERR_LINES)
+
+    async def start(self):
+        self.state = "starting"
+        try:
+            self.process = await asyncio.create_subprocess_exec(*self.command,
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE, limit=MAX_LINE)
+        except OSError as e:
+            # e.g. interpreter missing, fails the waiting calls and retries like a crash
+            self.process = None
+            self.supervisor.worker_exited(self, None, f"start failed: {e}")
+            return
+        self.started = time.time()
+        self.state = "running"
+        self.stderr_tail.clear()
+        asyncio.ensure_future(self.read_stderr(self.process))
+        asyncio.ensure_future(self.read(self.process))
+        logger.info(f"Started worker {self.id} (pid {self.process.pid})")
+        backlog, self.backlog = self.backlog, []
+        for line in backlog:
+            self.process.stdin.write(line)
+
+    def send(self, payload):
+        self.messages_in += 1
+        line = payload.encode("utf-8") + b"\n"
+        if self.state == "running":
+            self.process.stdin.write(line)
+        else:
+            self.backlog.append(line)
+
+    async def read(self, process):
+        while True:
+            try:
+                line = await process.stdout.readline()
+            except ValueError:
+                logger.error(f"Worker {self.id} sent a message larger than {MAX_LINE} bytes")
+                continue
+            if not line:
+                break
+            self.messages_out += 1
+            self.supervisor.from_worker(self, line.rstrip(b"\n"))
+        code = await process.wait()
+        self.supervisor.worker_exited(self, code)
+
+    async def read_stderr(self, process):
+        # the log of the worker goes to the log of the binding
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                break
+            sys.stderr.buffer.write(line)
+            sys.stderr.flush()
+            self.stderr_tail.append(line.decode("utf-8", "replace"))
+
+    def devices(self):
+        return [name for name, worker in self.supervisor.assignment.items() if worker is self]
+
+class Supervisor:
+    # Runs the FHEM connection and distributes the devices over worker processes.
+    # Workers get the function messages of their devices, their commands are
+    # sent to FHEM by the supervisor and FHEM's reply goes back by awaitId.
+    # Crashed workers are restarted and their devices defined again.
+
+    def __init__(self, count, shard_by="type", pins=None, isolate=None):
+        self.count = count
+        self.shard_by = shard_by
+        self.workers = []
+        # worker id: worker of module types with their own process
+        self.isolated = {}
+        self.isolate = set(isolate or [])
+        # NAME: worker of the device, devices running in this process aren't listed
+        self.assignment = {}
+        # NAME: PYTHONTYPE of the device
+        self.types = {}
+        # NAME: NAME, PYTHONTYPE, defargs and defargsh to define the device again after a crash
+        self.defines = {}
+        # ids of calls by the supervisor itself (Define after a restart, reload), FHEM doesn't wait for them
+        self.own_calls = set()
+        # shard key (PYTHONTYPE or worker group): worker
+        self.keys = {}
+        # awaitId: worker which sent the command
+        self.awaiting = {}
+        # (id, NAME, timer) of functions FHEM waits for, like fhem.function_active
+        self.active = []
+        # (NAME, message) held back while FHEM waits for another device
+        self.held = []
+        self.websocket = None
+        self.connection = LocalConnection(self)
+        self.outbox = asyncio.Queue()
+        self.sender_task = None
+        # PYTHONTYPE: group, types of one group always run in the same worker
+        self.groups = {}
+        for pin in pins or []:
+            types = [t.strip() for t in pin.split(",") if t.strip()]
+            for pythontype in types:
+                self.groups[pythontype] = types[0]
+
+    def worker_command(self, id):
+        # same interpreter and script (pythonbinding.py or the bundle) with the same options
+        return [sys.executable, sys.argv[0]] + sys.argv[1:] + ["--worker-id", str(id)]
+
+    async def start(self):
+        for index in range(self.count):
+            worker = Worker(self, str(index), self.worker_command(index))
+            self.workers.append(worker)
+            await worker.start()
+        self.sender_task = asyncio.ensure_future(self.sender())
+
+    def all_workers(self):
+        return self.workers + list(self.isolated.values())
+
+    def attach(self, websocket):
+        self.websocket = websocket
+        # nobody waits for replies of the last connection anymore
+        self.awaiting.clear()
+        for entry in self.active:
+            entry[2].cancel()
+        self.active = []
+        self.held = []
+
+    def group(self, pythontype):
+        if pythontype not in self.groups:
+            # e.g. xiaomi_gateway3_device looks up its gateway instance with getFhemPyDeviceByName
+            self.groups[pythontype] = pkg_installer.manifest_value(pythontype, "worker_group")
+        return self.groups[pythontype]
+
+    def shard(self, hash):
+        pythontype = hash["PYTHONTYPE"]
+        group = self.group(pythontype)
+        key = group or pythontype
+        if key in set(self.group(t) or t for t in self.isolate):
+            return self.isolated_worker(key)
+        if len(self.workers) == 0:
+            # only isolated types run in workers
+            return None
+        if group is None and self.shard_by == "name":
+            # stable over restarts, unlike hash()
+            return self.workers[zlib.crc32(hash["NAME"].encode("utf-8")) % len(self.workers)]
+        worker = self.keys.get(key)
+        if worker is None:
+            # fewest module types first, the device count isn't known yet
+            worker = min(self.workers, key=lambda w: (len([k for k, v in self.keys.items() if v is w]), int(w.id)))
+            self.keys[key] = worker
+        return worker
+
+    def isolated_worker(self, key):
+        worker = self.isolated.get(key)
+        if worker is None:
+            worker = Worker(self, key, self.worker_command(key), isolated=True)
+            self.isolated[key] = worker
+            # messages wait in the backlog until the process is up
+            worker.state = "starting"
+            asyncio.ensure_future(worker.start())
+        return worker
+
+    def worker_for(self, hash):
+        name = hash["NAME"]
+        if name in self.assignment:
+            return self.assignment[name]
+        worker = None
+        if hash["function"] == "Rename":
+            # the instance stays in the worker which has it
+            old_name = hash["args"][1] if hash["args"][0] == name else hash["args"][0]
+            worker = self.assignment.pop(old_name, None)
+            self.types.pop(old_name, None)
+            self.defines.pop(old_name, None)
+        if worker is None:
+            worker = self.shard(hash)
+        if worker is not None:
+            self.assignment[name] = worker
+            self.types[name] = hash["PYTHONTYPE"]
+        return worker
+
+    def route(self, payload):
+        """Forwards a message of FHEM to the worker, returns False if the supervisor has to handle it"""
+        try:
+            hash = json.loads(payload)
+        except ValueError:
+            return False
+        if "\n" in payload:
+            payload = json.dumps(hash, ensure_ascii=False)
+
+        if "awaitId" in hash:
+            if hash["awaitId"] not in self.awaiting:
+                return False
+            worker = self.awaiting.pop(hash["awaitId"])
+            if worker.state != "restarting":
+                worker.send(payload)
+            return True
+
+        if hash.get("msgtype") != "function":
+            return False
+        if not hash.get("async"):
+            timer = asyncio.get_running_loop().call_later(MAX_HOLD, self.set_inactive, hash["id"])
+            self.active.append((hash["id"], hash["NAME"], timer))
+        # BindingsIo functions and module types without worker run in this process
+        worker = self.worker_for(hash) if hash.get("PYTHONTYPE") else None
+        if worker is None:
+            return False
+
+        if hash["function"] == "Undefine":
+            self.assignment.pop(hash["NAME"], None)
+            self.types.pop(hash["NAME"], None)
+            self.defines.pop(hash["NAME"], None)
+        else:
+            self.defines[hash["NAME"]] = {key: hash[key] for key in ("NAME", "PYTHONTYPE", "defargs", "defargsh") if key in hash}
+
+        if worker.state == "restarting":
+            # Define runs with the restart
+            error = None if hash["function"] in ("Define", "Undefine") else f"Worker {worker.id} is restarting after a crash"
+            self.reply(hash, error)
+        else:
+            worker.send(payload)
+        return True
+
+    def reply(self, hash, error=None):
+        msg = {"msgtype": "function", "finished": 1, "id": hash["id"], "NAME": hash["NAME"]}
+        if error:
+            msg["error"] = error
+        else:
+            msg["returnval"] = ""
+        self.from_worker(None, json.dumps(msg, ensure_ascii=False).encode("utf-8"))
+
+    def from_worker(self, worker, line):
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            logger.error(f"Worker {worker.id if worker else 'binding'} sent invalid message: {line[:200]}")
+            return
+        if worker is not None and "awaitId" in msg:
+            self.awaiting[msg["awaitId"]] = worker
+        if msg.get("msgtype") == "function" and msg.get("finished") == 1:
+            if msg.get("id") in self.own_calls:
+                self.own_calls.discard(msg["id"])
+                if msg.get("error"):
+                    logger.error(f"{msg.get('NAME')} {msg.get('function')} failed in worker {worker.id}: {msg['error']}")
+                return
+            self.forward(msg.get("NAME"), line)
+            self.set_inactive(msg.get("id"))
+        else:
+            self.forward(msg.get("NAME"), line)
+
+    def forward(self, name, line):
+        # FHEM handles only messages of the device whose function it waits for,
+        # others would be queued in BindingsIo and delay the reply
+        if len(self.active) and self.active[-1][1] != name:
+            self.held.append((name, line))
+        else:
+            self.outbox.put_nowait(line)
+
+    def set_inactive(self, id):
+        for entry in self.active:
+            if entry[0] == id:
+                entry[2].cancel()
+                self.active.remove(entry)
+                break
+        else:
+            return
+        held, self.held = self.held, []
+        for name, line in held:
+            self.forward(name, line)
+
+    async def sender(self):
+        while True:
+            line = await self.outbox.get()
+            if self.websocket is None:
+                logger.debug("FHEM isn't connected, dropped message of worker")
+                continue
+            try:
+                await self.websocket.send(line)
+            except websockets.exceptions.ConnectionClosed:
+                logger.debug("FHEM connection closed, dropped message of worker")
+            except Exception:
+                logger.error("Failed to send message of worker to FHEM", exc_info=True)
+
+    def worker_exited(self, worker, code, reason=None):
+        if worker.state == "stopped":
+            return
+        worker.restarts += 1
+        worker.last_crash = reason or describe_exit(code, worker.stderr_tail)
+        devices = sorted(worker.devices())
+        logger.error(f"Worker {worker.id} (pid {worker.process.pid if worker.process else '-'}) crashed, {worker.last_crash}, "
+            + f"devices: {', '.join(devices) or 'none'}")
+
+        # FHEM might wait for a function of the crashed worker
+        for id, name, timer in list(self.active):
+            if self.assignment.get(name) is worker:
+                self.reply({"id": id, "NAME": name}, f"Worker {worker.id} crashed: {worker.last_crash}")
+        for awaitId, owner in list(self.awaiting.items()):
+            if owner is worker:
+                del self.awaiting[awaitId]
+
+        if worker.process is None or time.time() - worker.started < STABLE_AFTER:
+            worker.quick_crashes += 1
+        else:
+            worker.quick_crashes = 1
+        delay = min(MAX_RESTART_DELAY, 2 ** (worker.quick_crashes - 1))
+        logger.info(f"Restart worker {worker.id} in {delay}s")
+        worker.state = "restarting"
+        worker.backlog = []
+        asyncio.get_running_loop().call_later(delay, lambda: asyncio.ensure_future(self.restart(worker)))
+
+    async def stop(self, timeout):
+        """Closes the pipes of all workers and waits until they saved their snapshots and exited"""
+        running = [worker for worker in self.all_workers() if worker.state == "running"]
+        for worker in self.all_workers():
+            worker.state = "stopped"
+        for worker in running:
+            worker.process.stdin.close()
+        if len(running):
+            await asyncio.wait([asyncio.ensure_future(worker.process.wait()) for worker in running], timeout=timeout)
+
+    async def restart(self, worker):
+        await worker.start()
+        if worker.state != "running":
+            # start failed, the next restart is scheduled
+            return
+        # only the devices of this worker are defined again, all others keep running
+        for name in sorted(worker.devices()):
+            define = self.defines.get(name)
+            if define is None:
+                continue
+            self.call(worker, dict(define, msgtype="function", function="Define",
+                args=define.get("defargs", []), argsh=define.get("defargsh", {})))
+            asyncio.ensure_future(self.update_readings(name, worker))
+
+    def call(self, worker, msg):
+        msg = dict(msg, id=random.randint(1, 100000000))
+        msg["async"] = 1
+        self.own_calls.add(msg["id"])
+        worker.send(json.dumps(msg, ensure_ascii=False))
+
+    def call_workers(self, hash):
+        """Calls the BindingsIo function of the message in every worker, e.g. set reload"""
+        for worker in self.all_workers():
+            if worker.state != "restarting":
+                self.call(worker, hash)
+
+    async def update_readings(self, name, worker):
+        if self.websocket is None:
+            return
+        hash = {"NAME": name}
+        await fhem.readingsBeginUpdate(hash)
+        await fhem.readingsBulkUpdate(hash, "worker_restarts", worker.restarts)
+        await fhem.readingsBulkUpdate(hash, "worker_crash", worker.last_crash)
+        await fhem.readingsEndUpdate(hash, 1)
+
+    def format_table(self):
+        lines = ["{:<16} {:>7} {:<10} {:>8} {:>8} {:>10} {:>10}  {}".format(
+            "worker", "pid", "state", "restarts", "devices", "msgs in", "msgs out", "module types")]
+        for worker in self.all_workers():
+            types = sorted(set(self.types[name] for name in worker.devices()))
+            lines.append("{:<16} {:>7} {:<10} {:>8} {:>8} {:>10} {:>10}  {}".format(worker.id,
+                worker.process.pid if worker.process else "-", worker.state, worker.restarts,
+                len(worker.devices()), worker.messages_in, worker.messages_out, ", ".join(types)))
+        lines.append("")
+        if len(self.workers):
+            lines.append(f"Sharded by {self.shard_by}, {len(self.awaiting)} commands waiting for FHEM, {len(self.held)} held back")
+        else:
+            lines.append(f"Other module types run in the binding process, {len(self.awaiting)} commands waiting for FHEM, {len(self.held)} held back")
+        for worker in self.all_workers():
+            if worker.last_crash:
+                lines.append(f"Last crash of worker {worker.id}: {worker.last_crash}")
+        return "\n".join(lines)
+
+def start_supervisor(loop, count, shard_by, pins, isolate):
+    global supervisor
+    supervisor = Supervisor(count, shard_by, pins, isolate)
+    loop.run_until_complete(supervisor.start())
+    return supervisor
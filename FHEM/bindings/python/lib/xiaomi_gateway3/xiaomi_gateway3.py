@@ -26,8 +26,19 @@ class xiaomi_gateway3:
 
   def __init__(self, logger):
     self.logger = logger
+    self.gw = None
+    self.cached_devices = None
     return
 
+  # warm restart: reading the device list via telnet takes a while
+  async def snapshot(self):
+    if self.gw is None or len(self.gw.devices) == 0:
+      return None
+    return {"devices": self.gw.devices}
+
+  async def restore(self, hash, state):
+    self.cached_devices = state["devices"]
+
   # FHEM FUNCTION
   async def Define(self, hash, args, argsh):
     self.hash = hash
@@ -45,7 +56,7 @@ class xiaomi_gateway3:
     self.host = args[3]
     self.token = args[4]
 
-    asyncio.create_task(self.connect_gw())
+    fpyutils.create_task(hash, self.connect_gw())
     
     return ""
 
@@ -65,10 +76,16 @@ class xiaomi_gateway3:
 
   async def connect_gw(self):
     self.gw = Gateway(self.logger, self.hash, self.host, self.token)
+    if self.cached_devices:
+      # devices get their last state right away, also while the gateway
+      # is unreachable, the gateway is read again below
+      self.gw.devices = self.cached_devices
+      await self.gw.create_devices()
+      await self.gw.report_all()
     # connect to gateway
     await self.gw.connect()
     # create task which handles MQTT messages
-    asyncio.create_task(self.gw.connect_mqtt())
+    fpyutils.create_task(self.hash, self.gw.connect_mqtt())
 
 class Gateway:
 
@@ -83,45 +100,58 @@ class Gateway:
     self.connected = False
     self.pair_model = None
     self.pair_payload = None
+    # retry unreachable gateway with backoff (10s up to 10min)
+    self.breaker = fpyutils.CircuitBreaker(host, failure_threshold=1, base_delay=10, max_delay=600)
 
   def register_device(self, did, upd_listener):
     if did not in self.child_devices:
       self.child_devices[did] = []
     self.child_devices[did].append(upd_listener)
     # report initial states
-    asyncio.create_task(self.report(did))
+    fpyutils.create_task(self.hash, self.report(did))
 
   def get_device(self, did):
     if did in self.devices:
       return self.devices[did]
     return None
 
+  async def try_connect(self):
+    if self.breaker.allow():
+      try:
+        await fpyutils.run_blocking(functools.partial(self.thread_blocking_connect))
+      except Exception:
+        # run_blocking logged it, the breaker needs the result anyway
+        self.connected = False
+      if self.connected:
+        self.breaker.record_success()
+      else:
+        self.breaker.record_failure()
+      await self.breaker.update_readings(self.hash)
+    return self.connected
+
   async def connect(self):
-    # first connect
-    await fpyutils.run_blocking(functools.partial(self.thread_blocking_connect))
+    # first connect, wait without blocking an executor thread
+    while not await self.try_connect():
+      await asyncio.sleep(max(1, self.breaker.retry_in()))
     await fhem.readingsSingleUpdateIfChanged(self.hash, "state", "connected", 1)
     await self.create_devices()
     await self.report_all()
     # start check_connection task to reconnect on gw reboot
-    asyncio.create_task(self.check_connection())
+    fpyutils.create_task(self.hash, self.check_connection())
 
   async def check_connection(self):
     while True:
       if self.connected is False:
-        await fpyutils.run_blocking(functools.partial(self.thread_blocking_connect))
-        if self.connected:
+        if await self.try_connect():
           await self.create_devices()
           await self.report_all()
-      # sleep 30s
-      await asyncio.sleep(30)
+      # sleep 30s or until next retry
+      await asyncio.sleep(max(30, self.breaker.retry_in()))
 
   def thread_blocking_connect(self, keepconnection=0):
-    while self.connected is False:
-      if self._miio_connect():
-          self.update_devices()
-      else:
-          time.sleep(30)
-    # connected
+    # one connection attempt, retries are handled by the circuit breaker
+    if self._miio_connect():
+      self.update_devices()
 
   def update_devices(self):
     devices = self._get_devices_v3()
@@ -3,6 +3,7 @@ import asyncio
 import time
 
 from .. import fhem
+from .. import utils
 from ..xiaomi_gateway3 import xiaomi_gateway3
 from .. import fhem_pythonbinding as fhepy
 
@@ -30,16 +31,15 @@ class xiaomi_gateway3_device:
 
         await fhem.readingsSingleUpdateIfChanged(self.hash, "presence", "offline", 1)
 
-        asyncio.create_task(self.connect_gw())
-        self.offline_check_task = asyncio.create_task(self.offline_check())
+        utils.create_task(hash, self.connect_gw())
+        # one shared timer for all devices instead of a task per device
+        self.offline_check_job = utils.schedule_periodic(hash, 300, self.offline_check, coalesce=True)
 
         return ""
 
     async def offline_check(self):
-        while True:
-            if time.time() - self.last_update > 3700:
-                await fhem.readingsSingleUpdateIfChanged(self.hash, "presence", "offline", 1)
-            await asyncio.sleep(300)
+        if time.time() - self.last_update > 3700:
+            await fhem.readingsSingleUpdateIfChanged(self.hash, "presence", "offline", 1)
     
     async def connect_gw(self):
         while self.gateway is None:
@@ -57,7 +57,7 @@ class xiaomi_gateway3_device:
 
     # FHEM FUNCTION
     async def Undefine(self, hash):
-        self.offline_check_task.cancel()
+        self.offline_check_job.cancel()
         return
 
     # FHEM FUNCTION